@@ -0,0 +1,40 @@
+# Вход пользователя на страницах приложения. Токен сессии хранится в базе данных
+# (database.AuthSession), а в браузере - в параметре адреса страницы "session": после
+# перезагрузки страницы или в новой вкладке с тем же адресом вход восстанавливается.
+# Токен проверяется при каждом перезапуске страницы (проверка кэшируется в database).
+# Streamlit сбрасывает параметры адреса при переходе между страницами, поэтому
+# каждая страница записывает токен в адрес заново.
+import streamlit as st
+
+from database import activate_session, deactivate_session, is_authenticated
+
+SESSION_PARAM = "session"
+
+
+# Функция проверки входа: (вошел ли пользователь, имя пользователя). Токен берется
+# из состояния сессии Streamlit, а если его там нет (новое соединение) - из адреса страницы
+def current_user():
+    token = st.session_state.get("session_token") or st.query_params.get(SESSION_PARAM)
+    authenticated, username = is_authenticated(token)
+    if authenticated:
+        st.session_state.session_token = token
+        if st.query_params.get(SESSION_PARAM) != token:
+            st.query_params[SESSION_PARAM] = token
+    else:
+        st.session_state.session_token = None
+        st.query_params.pop(SESSION_PARAM, None)
+    return authenticated, username
+
+
+# Функция входа: новая сессия пользователя в базе данных и в браузере
+def login(username):
+    token = activate_session(username)
+    st.session_state.session_token = token
+    st.query_params[SESSION_PARAM] = token
+
+
+# Функция выхода: сессия закрывается в базе данных и удаляется из браузера
+def logout():
+    deactivate_session(st.session_state.get("session_token"))
+    st.session_state.session_token = None
+    st.query_params.pop(SESSION_PARAM, None)
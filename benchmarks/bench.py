@@ -0,0 +1,243 @@
+# Микробенчмарки расчетного ядра и функций работы с базой данных.
+# Работают без сети, база данных - временный файл SQLite.
+#
+#   python -m benchmarks.bench                  # сравнить с baselines.json (без базовых значений - ошибка)
+#   python -m benchmarks.bench --update         # записать новые базовые значения
+#   python -m benchmarks.bench --threshold 1.3 --filter schedule
+#
+# Результат - время одного вызова (лучшее из нескольких замеров). Бенчмарк
+# считается регрессией, если он медленнее базового значения больше чем в threshold раз.
+# В репозитории лежат эталонные baselines.json, записанные на машине разработки. Время
+# зависит от машины, поэтому на другой машине (в том числе в CI) первым запуском
+# записываются свои базовые значения: python -m benchmarks.bench --update.
+import argparse
+import datetime
+import itertools
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+import numpy as np
+import pandas as pd
+
+from credit_engine import ANNUITY, DIFFERENTIATED, build_schedule, calculate_annuity_payment, calculate_differentiated_payment
+from credit_engine import ACT_ACT, daily_schedule, exact_schedule, schedule_to_arrow, schedule_to_dataframe
+from credit_engine.batch import calculate_portfolio_schedules, calculate_portfolio_totals
+from credit_engine.offers import compare_offers
+from credit_engine.solvers import full_cost_of_credit
+
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "baselines.json")
+DEFAULT_THRESHOLD = 1.5
+TERMS_YEARS = [1, 5, 10, 30, 50]
+BATCH_SIZES = [1_000, 100_000, 1_000_000]
+
+CASES = {}  # имя -> функция подготовки, возвращающая измеряемую функцию без аргументов
+
+
+def benchmark(name):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+# Расчетное ядро
+@benchmark("annuity_payment")
+def _annuity_payment():
+    return lambda: calculate_annuity_payment(1000000, 10 / 100 / 12, 360)
+
+
+for _years in TERMS_YEARS:
+    @benchmark(f"differentiated_payment[{_years}y]")
+    def _differentiated_payment(months=_years * 12):
+        return lambda: calculate_differentiated_payment(1000000, 10 / 100 / 12, months)
+
+    for _payment_type, _label in [(ANNUITY, "annuity"), (DIFFERENTIATED, "differentiated")]:
+        @benchmark(f"build_schedule[{_label},{_years}y]")
+        def _build_schedule(months=_years * 12, payment_type=_payment_type):
+            return lambda: build_schedule(1000000, 10 / 100 / 12, months, payment_type)
+
+    @benchmark(f"exact_schedule[annuity,{_years}y]")
+    def _exact_schedule(months=_years * 12):
+        return lambda: exact_schedule(1000000, 10 / 100 / 12, months, ANNUITY)
+
+    @benchmark(f"daily_schedule[ACT/ACT,{_years}y]")
+    def _daily_schedule(months=_years * 12):
+        return lambda: daily_schedule(1000000, 10.0, datetime.date(2024, 1, 31), months, ANNUITY, ACT_ACT)
+
+    @benchmark(f"schedule_table[{_years}y]")
+    def _schedule_table(months=_years * 12):
+        return lambda: schedule_to_dataframe(build_schedule(1000000, 10 / 100 / 12, months, ANNUITY))
+
+    @benchmark(f"schedule_arrow[{_years}y]")
+    def _schedule_arrow(months=_years * 12):
+        return lambda: schedule_to_arrow(build_schedule(1000000, 10 / 100 / 12, months, ANNUITY))
+
+
+def _portfolio(count):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({
+        "loan_amount": rng.integers(1000, 10000000, count).astype(float),
+        "annual_interest_rate": rng.uniform(0.1, 30, count).round(1),
+        "loan_term_years": rng.integers(1, 31, count),
+        "payment_type": rng.choice([ANNUITY, DIFFERENTIATED], count),
+    })
+
+
+for _count in BATCH_SIZES:
+    @benchmark(f"portfolio_totals[{_count}]")
+    def _portfolio_totals(count=_count):
+        loans = _portfolio(count)
+        return lambda: calculate_portfolio_totals(loans)
+
+@benchmark("portfolio_totals_exact[100000]")
+def _portfolio_totals_exact():
+    loans = _portfolio(100_000)
+    return lambda: calculate_portfolio_totals(loans, exact=True)
+
+
+@benchmark("full_cost_of_credit[100000]")
+def _full_cost_of_credit():
+    loans = _portfolio(100_000)
+    return lambda: full_cost_of_credit(
+        loans["loan_amount"], loans["annual_interest_rate"], loans["loan_term_years"] * 12, loans["payment_type"],
+        upfront_fee=loans["loan_amount"] * 0.01,
+    )
+
+
+@benchmark("compare_offers[50]")
+def _compare_offers():
+    offers = _portfolio(50)
+    return lambda: compare_offers(offers)
+
+
+@benchmark("portfolio_schedules[1000]")
+def _portfolio_schedules():
+    loans = _portfolio(1000)
+    return lambda: calculate_portfolio_schedules(loans)
+
+
+# Функции базы данных (на временной базе; подключается в main())
+@benchmark("db.register_user")
+def _register_user():
+    import database
+
+    names = (f"bench_register_{i}" for i in itertools.count())
+    return lambda: database.register_user(next(names), "password")
+
+
+@benchmark("db.authenticate_user")
+def _authenticate_user():
+    import database
+
+    database.register_user("bench_auth", "password")
+    return lambda: database.authenticate_user("bench_auth", "password")
+
+
+@benchmark("db.save_calculation")
+def _save_calculation():
+    import database
+
+    database.register_user("bench_save", "password")
+    return lambda: database.save_calculation("bench_save", 1000000, 10.0, 5, ANNUITY, 1274822.68, 274822.68)
+
+
+@benchmark("db.get_user_calculations[1000]")
+def _get_user_calculations():
+    import database
+
+    database.register_user("bench_history", "password")
+    database.insert_calculations([
+        {
+            "user_id": database.get_user_id("bench_history"),
+            "loan_amount": 1000000,
+            "annual_interest_rate": 10.0,
+            "loan_term_years": 5,
+            "payment_type": ANNUITY,
+            "total_payment": 1274822.68,
+            "total_interest_paid": 274822.68,
+            "unique_link": f"bench-history-{i}",
+        }
+        for i in range(1000)
+    ])
+    return lambda: database.get_user_calculations("bench_history")
+
+
+# Функция замера: лучшее время одного вызова из repeat серий
+def measure(func, repeat=5):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+# Функция сравнения с базовыми значениями: список (имя, базовое, текущее, отношение) для регрессий
+def find_regressions(results, baselines, threshold=DEFAULT_THRESHOLD):
+    regressions = []
+    for name, seconds in results.items():
+        baseline = baselines.get(name)
+        if baseline and seconds > baseline * threshold:
+            regressions.append((name, baseline, seconds, seconds / baseline))
+    return regressions
+
+
+def run(names, repeat=5):
+    results = {}
+    for name in names:
+        func = CASES[name]()
+        results[name] = measure(func, repeat)
+        print(f"{name:<45} {results[name] * 1e6:>14.1f} мкс", flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.bench", description="Микробенчмарки кредитного калькулятора")
+    parser.add_argument("--baselines", default=BASELINES_PATH, help="Файл с базовыми значениями (JSON)")
+    parser.add_argument("--threshold", type=float, default=float(os.environ.get("BENCH_THRESHOLD", DEFAULT_THRESHOLD)),
+                        help="Допустимое замедление относительно базового значения (по умолчанию 1.5)")
+    parser.add_argument("--filter", default="", help="Запускать только бенчмарки, в имени которых есть эта строка")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--update", action="store_true", help="Записать результаты как новые базовые значения")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        # До первого импорта database, чтобы не трогать рабочую базу; после замеров - прежнее значение
+        previous_url = os.environ.get("DATABASE_URL")
+        os.environ["DATABASE_URL"] = url
+        try:
+            import database
+
+            database.configure_database(url)
+            results = run([name for name in CASES if args.filter in name], args.repeat)
+            database.engine.dispose()
+        finally:
+            if previous_url is None:
+                os.environ.pop("DATABASE_URL", None)
+            else:
+                os.environ["DATABASE_URL"] = previous_url
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, encoding="utf-8") as f:
+            baselines = json.load(f)
+    if args.update:
+        baselines.update(results)
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+        print(f"Базовые значения записаны в {args.baselines}")
+        return 0
+
+    # Бенчмарк без базового значения не проверен - это ошибка, а не молчаливый успех
+    missing = [name for name in results if not baselines.get(name)]
+    for name in missing:
+        print(f"НЕТ БАЗОВОГО ЗНАЧЕНИЯ {name} (запишите его: --update)")
+    regressions = find_regressions(results, baselines, args.threshold)
+    for name, baseline, seconds, ratio in regressions:
+        print(f"РЕГРЕССИЯ {name}: {baseline * 1e6:.1f} -> {seconds * 1e6:.1f} мкс (x{ratio:.2f})")
+    return 1 if regressions or missing else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
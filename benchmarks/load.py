@@ -0,0 +1,275 @@
+# Нагрузочный тест страниц без браузера (streamlit.testing AppTest).
+# Сценарий сессии: регистрация, вход, расчет, сохранение, профиль и открытие ссылки
+# на сохраненный расчет. База данных - временный файл SQLite.
+#
+# AppTest хранит состояние в глобальных объектах Streamlit (Runtime._instance, настройки),
+# поэтому в одном процессе одновременно может выполняться только один AppTest.
+# Одновременные сессии - это concurrency процессов, каждый проходит свою долю сессий
+# подряд; все процессы работают с одной базой, так что блокировка записи SQLite общая,
+# как у нескольких реплик приложения.
+#
+#   python -m benchmarks.load --sessions 200 --concurrency 50
+#   python -m benchmarks.load --sessions 500 --concurrency 100 --write-behind --json load.json
+#
+# Отчет:
+# - p50/p95/p99 времени перезапуска страницы по шагам сценария и по всем шагам;
+# - время записей в SQLite (INSERT/UPDATE/DELETE и COMMIT): под нагрузкой в основном это
+#   ожидание блокировки записи; число ошибок "database is locked";
+# - рост RSS процесса на сессию и число незакрытых фигур matplotlib (по процессам).
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+PERCENTILES = (50, 95, 99)
+STEPS = ["main", "register", "login", "calculate", "save", "profile", "view"]
+
+
+# Текущий RSS процесса в байтах (на Linux - из /proc, иначе пиковый RSS)
+def current_rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+# Замеры одного процесса
+class LoadStats:
+    def __init__(self):
+        self.reruns = defaultdict(list)  # шаг -> секунды
+        self.writes = []  # секунды записи (оператор или COMMIT)
+        self.lock_errors = 0
+        self.failed_sessions = []  # (номер сессии, шаг, ошибка)
+
+    def add_rerun(self, step, seconds):
+        self.reruns[step].append(seconds)
+
+    def add_write(self, seconds):
+        self.writes.append(seconds)
+
+    def add_lock_error(self):
+        self.lock_errors += 1
+
+    def add_failure(self, session, step, error):
+        self.failed_sessions.append((session, step, error))
+
+
+# Подключение замеров записей к движку SQLAlchemy и сессиям database.SessionLocal
+def instrument_database(database, stats):
+    from sqlalchemy import event
+
+    local = threading.local()  # Запись может идти и из потока отложенной записи
+    write_prefixes = ("INSERT", "UPDATE", "DELETE")
+
+    @event.listens_for(database.engine, "before_cursor_execute")
+    def before_execute(conn, cursor, statement, parameters, context, executemany):
+        local.execute_start = time.perf_counter()
+
+    @event.listens_for(database.engine, "after_cursor_execute")
+    def after_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(write_prefixes):
+            stats.add_write(time.perf_counter() - local.execute_start)
+
+    @event.listens_for(database.engine, "handle_error")
+    def handle_error(context):
+        if "database is locked" in str(context.original_exception):
+            stats.add_lock_error()
+
+    @event.listens_for(database.SessionLocal, "before_commit")
+    def before_commit(session):
+        local.commit_start = time.perf_counter()
+
+    @event.listens_for(database.SessionLocal, "after_commit")
+    def after_commit(session):
+        stats.add_write(time.perf_counter() - local.commit_start)
+
+
+# Сценарий одной сессии; возвращает False, если какой-то шаг завершился ошибкой
+def run_session(session, stats, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    username, password = f"load_user_{session}", "password"
+    at = AppTest.from_file("main.py", default_timeout=timeout)
+
+    def step(name, action):
+        start = time.perf_counter()
+        action()
+        stats.add_rerun(name, time.perf_counter() - start)
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+
+    def fill(*values):
+        for widget, value in zip(at.text_input, values):
+            widget.input(value)
+
+    def save():
+        next(button for button in at.button if button.label == "Сохранить расчет").click().run()
+
+    current = "main"
+    try:
+        step(current, at.run)
+        current = "register"
+        at.switch_page("pages/registration.py").run()
+        fill(username, password, password)
+        step(current, lambda: at.button[0].click().run())
+        current = "login"
+        at.switch_page("pages/login.py").run()
+        fill(username, password)
+        step(current, lambda: at.button[0].click().run())
+        if "session_token" not in at.session_state:
+            raise RuntimeError("Вход не выполнен")
+        current = "calculate"
+        step(current, lambda: at.switch_page("pages/calculator.py").run())
+        current = "save"
+        step(current, save)
+        link = at.success[0].value.rsplit(" ", 1)[1]
+        current = "profile"
+        step(current, lambda: at.switch_page("pages/profile.py").run())
+        current = "view"
+        at.query_params["link"] = link
+        step(current, lambda: at.switch_page("pages/view_calculation.py").run())
+        if not at.title or at.title[0].value != "Просмотр расчета":
+            raise RuntimeError("Расчет по ссылке не открылся")
+    except Exception as e:
+        stats.add_failure(session, current, f"{type(e).__name__}: {e}")
+        return False
+    return True
+
+
+# Перцентили в миллисекундах
+def percentiles_ms(values):
+    if not values:
+        return dict.fromkeys(PERCENTILES, None)
+    return dict(zip(PERCENTILES, (np.percentile(values, PERCENTILES) * 1000).round(1).tolist()))
+
+
+# Создание схемы временной базы
+def create_schema(database_url):
+    import database
+
+    database.engine.dispose(close=False)
+    database.configure_database(database_url, schema=database.SCHEMA_SKIP)
+    database.create_schema()
+
+
+# Процесс нагрузки: проходит свои сессии подряд и возвращает замеры
+def run_worker(sessions, database_url, timeout=120, write_behind=False):
+    import database
+
+    # Соединения, унаследованные от родительского процесса, не используются
+    database.engine.dispose(close=False)
+    database.configure_database(database_url, schema=database.SCHEMA_SKIP)
+    stats = LoadStats()
+    instrument_database(database, stats)
+    if write_behind:
+        database.start_write_behind()
+
+    # Прогревочная сессия (импорты, кэши Streamlit) в статистику не входит
+    run_session(f"warmup-{os.getpid()}", LoadStats(), timeout)
+    rss_before = current_rss()
+    completed = sum(run_session(session, stats, timeout) for session in sessions)
+    if write_behind:
+        database.stop_write_behind()
+    open_figures = 0
+    if "matplotlib.pyplot" in sys.modules:
+        open_figures = len(sys.modules["matplotlib.pyplot"].get_fignums())
+    return {
+        "completed": completed,
+        "reruns": dict(stats.reruns),
+        "writes": stats.writes,
+        "lock_errors": stats.lock_errors,
+        "failed": stats.failed_sessions,
+        "rss_growth": current_rss() - rss_before,
+        "open_figures": open_figures,
+    }
+
+
+# Функция нагрузочного прогона: sessions сессий в concurrency процессах
+def run_load(sessions, concurrency, database_url, timeout=120, write_behind=False):
+    # Схема создается до запуска процессов нагрузки (в отдельном процессе, чтобы не
+    # переключать базу текущего), иначе они создавали бы таблицы одновременно
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        pool.submit(create_schema, database_url).result()
+    concurrency = max(min(concurrency, sessions), 1)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_worker, range(worker, sessions, concurrency), database_url, timeout, write_behind)
+                   for worker in range(concurrency)]
+        results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+
+    reruns = {step: [seconds for result in results for seconds in result["reruns"].get(step, [])] for step in STEPS}
+    writes = [seconds for result in results for seconds in result["writes"]]
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "write_behind": write_behind,
+        "completed": sum(result["completed"] for result in results),
+        "failed": [list(failure) for result in results for failure in result["failed"]],
+        "elapsed_seconds": round(elapsed, 3),
+        "sessions_per_second": round(sessions / elapsed, 2),
+        "rerun_ms": {step: percentiles_ms(reruns[step]) for step in STEPS},
+        "rerun_ms_all": percentiles_ms([seconds for step in STEPS for seconds in reruns[step]]),
+        "db_writes": len(writes),
+        "db_write_ms": percentiles_ms(writes),
+        "db_write_max_ms": round(max(writes, default=0) * 1000, 1),
+        "db_lock_errors": sum(result["lock_errors"] for result in results),
+        "rss_growth_kb_per_session": round(sum(result["rss_growth"] for result in results) / 1024 / max(sessions, 1), 1),
+        "open_matplotlib_figures": sum(result["open_figures"] for result in results),
+    }
+
+
+def print_report(report):
+    print(f"Сессий: {report['completed']} из {report['sessions']} (одновременно до {report['concurrency']}), "
+          f"{report['elapsed_seconds']} с, {report['sessions_per_second']} сессий/с")
+    header = "".join(f"{f'p{p}, мс':>12}" for p in PERCENTILES)
+    print(f"{'Шаг':<20}{header}")
+    for step, values in [*report["rerun_ms"].items(), ("все шаги", report["rerun_ms_all"])]:
+        print(f"{step:<20}" + "".join(f"{'-' if v is None else v:>12}" for v in values.values()))
+    write_ms = report["db_write_ms"]
+    print(f"Записи в БД: {report['db_writes']}, p50/p95/p99 = "
+          f"{write_ms[50]}/{write_ms[95]}/{write_ms[99]} мс, максимум {report['db_write_max_ms']} мс, "
+          f"ошибок блокировки: {report['db_lock_errors']}")
+    print(f"Рост RSS: {report['rss_growth_kb_per_session']} КБ на сессию, "
+          f"незакрытых фигур matplotlib: {report['open_matplotlib_figures']}")
+    for session, step, error in report["failed"][:10]:
+        print(f"ОШИБКА сессия {session}, шаг {step}: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.load", description="Нагрузочный тест страниц кредитного калькулятора")
+    parser.add_argument("--sessions", type=int, default=100, help="Число сессий (сценариев пользователя)")
+    parser.add_argument("--concurrency", type=int, default=os.cpu_count() or 1, help="Число одновременных сессий (процессов)")
+    parser.add_argument("--timeout", type=float, default=120, help="Предельное время одного перезапуска страницы, с")
+    parser.add_argument("--write-behind", action="store_true", help="Включить отложенную запись расчетов")
+    parser.add_argument("--json", help="Записать отчет в файл JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'load.db')}"
+        os.environ["DATABASE_URL"] = url  # До первого импорта database, чтобы не трогать рабочую базу
+        import database
+
+        database.configure_database(url)
+        report = run_load(args.sessions, args.concurrency, url, args.timeout, args.write_behind)
+        database.engine.dispose()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+# Бюджет холодного старта: время импорта модулей и первого перезапуска каждой страницы
+# в новом процессе интерпретатора (как у только что запущенной реплики приложения).
+#
+#   python -m benchmarks.startup            # отчет и проверка по startup_baselines.json
+#   python -m benchmarks.startup --update   # записать базовые значения этой машины
+#   python -m benchmarks.startup --repeat 5 --json startup.json
+#
+# Для каждой цели измеряется лучшее время из repeat новых процессов и список загруженных
+# тяжелых библиотек. Бюджет цели - ее базовое значение, умноженное на threshold, как в
+# benchmarks.bench. В репозитории лежат эталонные startup_baselines.json, записанные на
+# машине разработки; время зависит от машины, поэтому на другой машине (в том числе в CI)
+# первым запуском записываются свои базовые значения (--update).
+# Цель нарушает бюджет, если она медленнее бюджета, у нее нет базового значения или она
+# загружает библиотеку, которая ей не нужна. Страницы открываются без входа: до проверки входа
+# выполняются все импорты страницы, поэтому замер показывает именно стоимость импортов.
+# База данных - временный файл SQLite со схемой, созданной заранее (python database.py init),
+# приложение подключается в режиме быстрого старта DATABASE_SCHEMA=skip.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+HEAVY_MODULES = ("matplotlib", "pandas", "pyarrow", "sqlalchemy", "streamlit")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINES_PATH = os.path.join(os.path.dirname(__file__), "startup_baselines.json")
+DEFAULT_THRESHOLD = 1.5
+
+# Цель -> библиотеки, которые цель загружать не должна
+IMPORT_TARGETS = {
+    "credit_engine": ("matplotlib", "pandas", "pyarrow", "sqlalchemy", "streamlit"),
+    "charts": ("matplotlib", "pandas", "pyarrow", "sqlalchemy", "streamlit"),
+    "tables": ("matplotlib", "pandas", "pyarrow", "sqlalchemy", "streamlit"),
+    "credit_engine.export": ("matplotlib", "pandas", "pyarrow", "sqlalchemy", "streamlit"),
+    "database": ("matplotlib", "pandas", "pyarrow", "streamlit"),
+    "jobs": ("matplotlib", "pandas", "pyarrow", "streamlit"),
+}
+PAGE_TARGETS = {
+    "main.py": ("matplotlib", "pandas"),
+    "pages/login.py": ("matplotlib", "pandas"),
+    "pages/registration.py": ("matplotlib", "pandas"),
+    "pages/calculator.py": ("matplotlib", "pandas"),
+    "pages/profile.py": ("matplotlib", "pandas"),
+    "pages/view_calculation.py": ("matplotlib", "pandas"),
+    "pages/compare_offers.py": ("matplotlib",),
+    "pages/jobs.py": ("matplotlib", "pandas"),
+}
+
+# Код замера в новом процессе: target импортируется или открывается как страница
+def import_probe(target):
+    return f"import {target}"
+
+
+def page_probe(target):
+    return (
+        "from streamlit.testing.v1 import AppTest\n"
+        f"at = AppTest.from_file({target!r}, default_timeout=60)\n"
+        "at.run()\n"
+        "assert not at.exception, at.exception"
+    )
+
+
+def probe_code(target, probe_body):
+    return (
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        f"{probe_body(target)}\n"
+        "elapsed = time.perf_counter() - start\n"
+        f"print(json.dumps({{'seconds': elapsed, 'modules': sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules)}}))"
+    )
+
+
+# Замер одной цели в новом процессе: (секунды, загруженные тяжелые библиотеки)
+def probe(code, env):
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT, env=env)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return result["seconds"], result["modules"]
+
+
+# Функция замера всех целей: список словарей (цель, мс, загруженные и лишние библиотеки)
+def measure_startup(repeat=3, env=None):
+    results = []
+    for probe_body, targets in [(import_probe, IMPORT_TARGETS), (page_probe, PAGE_TARGETS)]:
+        for target, forbidden in targets.items():
+            runs = [probe(probe_code(target, probe_body), env) for _ in range(repeat)]
+            seconds = min(seconds for seconds, _ in runs)
+            modules = runs[0][1]
+            results.append({
+                "target": target,
+                "ms": round(seconds * 1000, 1),
+                "modules": modules,
+                "unexpected": [module for module in modules if module in forbidden],
+            })
+    return results
+
+
+# Функция проверки по базовым значениям (цель -> мс): добавляет к результатам бюджет и ok
+def check_budgets(results, baselines, threshold=DEFAULT_THRESHOLD):
+    for result in results:
+        baseline = baselines.get(result["target"])
+        result["budget_ms"] = round(baseline * threshold, 1) if baseline else None
+        result["ok"] = bool(baseline) and result["ms"] <= result["budget_ms"] and not result["unexpected"]
+    return results
+
+
+def print_report(results):
+    print(f"{'Цель':<30}{'мс':>10}{'бюджет':>10}  Загружено")
+    for result in results:
+        if result["budget_ms"] is None:
+            status = "  НЕТ БАЗОВОГО ЗНАЧЕНИЯ (запишите его: --update)"
+        else:
+            status = "" if result["ms"] <= result["budget_ms"] else "  ПРЕВЫШЕН БЮДЖЕТ"
+        if result["unexpected"]:
+            status += f" (лишние: {', '.join(result['unexpected'])})"
+        budget = "-" if result["budget_ms"] is None else result["budget_ms"]
+        print(f"{result['target']:<30}{result['ms']:>10}{budget:>10}  {', '.join(result['modules']) or '-'}{status}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="benchmarks.startup", description="Бюджет холодного старта")
+    parser.add_argument("--repeat", type=int, default=3, help="Число новых процессов на цель (берется лучшее время)")
+    parser.add_argument("--json", help="Записать отчет в файл JSON")
+    parser.add_argument("--baselines", default=BASELINES_PATH, help="Файл с базовыми значениями (JSON)")
+    parser.add_argument("--threshold", type=float,
+                        default=float(os.environ.get("STARTUP_THRESHOLD", DEFAULT_THRESHOLD)),
+                        help="Допустимое замедление относительно базового значения (по умолчанию 1.5)")
+    parser.add_argument("--update", action="store_true", help="Записать результаты как новые базовые значения")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'startup.db')}", PYTHONPATH=ROOT,
+                   DATABASE_SCHEMA="skip")
+        env.pop("SQL_ECHO", None)
+        subprocess.run([sys.executable, "database.py", "init"], cwd=ROOT, env=dict(env, DATABASE_SCHEMA="auto"),
+                       check=True, capture_output=True)
+        results = measure_startup(args.repeat, env)
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, encoding="utf-8") as f:
+            baselines = json.load(f)
+    if args.update:
+        baselines.update({result["target"]: result["ms"] for result in results})
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(baselines.items())), f, indent=2)
+        print(f"Базовые значения записаны в {args.baselines}")
+    check_budgets(results, baselines, args.threshold)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    return 0 if all(result["ok"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# Построение графиков по графику платежей.
+# Длинные графики сжимаются до ограниченного числа точек, готовый результат
+# кэшируется по ключу расчета. Два способа вывода:
+# - "matplotlib": PNG, отрисованный на сервере (фигура закрывается сразу после отрисовки);
+# - "vega": спецификация Vega-Lite, которую рисует браузер (matplotlib не нужен).
+import io
+import os
+
+import numpy as np
+
+import metrics
+from credit_engine import schedule_cache
+
+MATPLOTLIB = "matplotlib"
+VEGA = "vega"
+CHART_BACKEND = os.environ.get("CHART_BACKEND", MATPLOTLIB)
+DEFAULT_MAX_POINTS = 120  # Не больше 120 столбцов/точек на графике
+
+PRINCIPAL_COLOR = "#4682B4"  # Синий
+INTEREST_COLOR = "#FFA07A"  # Оранжевый
+
+
+# Функция сжатия графика платежей до max_points групп подряд идущих месяцев.
+# Для столбцов берется средний платеж группы, для накопленной суммы - значение на конец группы
+def downsample(schedule, max_points=DEFAULT_MAX_POINTS):
+    months = len(schedule.month)
+    cumulative = np.cumsum(schedule.payment)
+    if months <= max_points:
+        return schedule.month, schedule.principal, schedule.interest, cumulative
+    bucket_size = -(-months // max_points)  # Округление вверх
+    starts = np.arange(0, months, bucket_size)
+    counts = np.diff(np.append(starts, months))
+    principal = np.add.reduceat(schedule.principal, starts) / counts
+    interest = np.add.reduceat(schedule.interest, starts) / counts
+    ends = np.minimum(starts + bucket_size, months) - 1
+    return schedule.month[ends], principal, interest, cumulative[ends]
+
+
+# Функция отрисовки фигуры matplotlib в PNG с немедленным освобождением памяти
+def _to_png(fig):
+    buffer = io.BytesIO()
+    try:
+        fig.savefig(buffer, format="png", bbox_inches="tight", dpi=200)
+    finally:
+        fig.clear()
+    return buffer.getvalue()
+
+
+# Круговая диаграмма распределения выплат
+def pie_png(loan_amount, total_interest_paid):
+    from matplotlib.figure import Figure  # Без pyplot: фигура не попадает в глобальный реестр
+
+    fig = Figure(figsize=(3, 3))
+    ax = fig.subplots()
+    ax.pie(
+        [loan_amount, total_interest_paid],
+        explode=(0.1, 0),  # Выделение первого сегмента
+        labels=["Основной долг", "Проценты"],
+        autopct="%1.1f%%",
+        startangle=90,
+        colors=[PRINCIPAL_COLOR, INTEREST_COLOR],
+        shadow=True,
+        wedgeprops={"edgecolor": "white"},
+        textprops={"fontsize": 6},
+    )
+    ax.axis("equal")
+    ax.set_title("Распределение выплат", fontsize=8)
+    return _to_png(fig)
+
+
+# График ежемесячных выплат (столбцы: тело кредита и проценты)
+def payments_png(schedule, max_points=DEFAULT_MAX_POINTS):
+    from matplotlib.figure import Figure
+
+    months, principal, interest, _ = downsample(schedule, max_points)
+    fig = Figure(figsize=(5, 3))
+    ax = fig.subplots()
+    width = months[1] - months[0] if len(months) > 1 else 1
+    ax.bar(months, principal, width=width * 0.8, label="Тело кредита", color=PRINCIPAL_COLOR, alpha=0.6)
+    ax.bar(months, interest, width=width * 0.8, bottom=principal, label="Проценты", color=INTEREST_COLOR, alpha=0.6)
+    ax.set_xlabel("Месяцы", fontsize=6)
+    ax.set_ylabel("Сумма выплат", fontsize=6)
+    ax.set_title("Ежемесячные выплаты по кредиту", fontsize=8)
+    ax.legend(fontsize=6)
+    return _to_png(fig)
+
+
+# График накопленных выплат
+def cumulative_png(schedule, loan_amount, max_points=DEFAULT_MAX_POINTS):
+    from matplotlib.figure import Figure
+
+    months, _, _, cumulative = downsample(schedule, max_points)
+    fig = Figure(figsize=(5, 3))
+    ax = fig.subplots()
+    ax.plot(months, cumulative, label="Накопленные выплаты", color="green")
+    ax.axhline(y=loan_amount, color="red", linestyle="--", label="Сумма кредита")
+    ax.set_xlabel("Месяцы", fontsize=6)
+    ax.set_ylabel("Накопленная сумма", fontsize=6)
+    ax.set_title("Накопленные выплаты по кредиту", fontsize=8)
+    ax.legend(fontsize=6)
+    return _to_png(fig)
+
+
+# Спецификация Vega-Lite круговой диаграммы
+def pie_spec(loan_amount, total_interest_paid):
+    return {
+        "data": {"values": [
+            {"part": "Основной долг", "amount": float(loan_amount)},
+            {"part": "Проценты", "amount": float(total_interest_paid)},
+        ]},
+        "mark": {"type": "arc", "tooltip": True},
+        "encoding": {
+            "theta": {"field": "amount", "type": "quantitative"},
+            "color": {
+                "field": "part",
+                "type": "nominal",
+                "title": None,
+                "scale": {"range": [PRINCIPAL_COLOR, INTEREST_COLOR]},
+            },
+        },
+    }
+
+
+# Спецификация Vega-Lite графика ежемесячных выплат
+def payments_spec(schedule, max_points=DEFAULT_MAX_POINTS):
+    months, principal, interest, _ = downsample(schedule, max_points)
+    values = [{"month": int(m), "part": "Тело кредита", "amount": float(p)} for m, p in zip(months, principal)]
+    values += [{"month": int(m), "part": "Проценты", "amount": float(i)} for m, i in zip(months, interest)]
+    return {
+        "data": {"values": values},
+        "mark": {"type": "bar", "tooltip": True},
+        "encoding": {
+            "x": {"field": "month", "type": "ordinal", "title": "Месяцы"},
+            "y": {"field": "amount", "type": "quantitative", "stack": True, "title": "Сумма выплат"},
+            "color": {
+                "field": "part",
+                "type": "nominal",
+                "title": None,
+                "scale": {"domain": ["Тело кредита", "Проценты"], "range": [PRINCIPAL_COLOR, INTEREST_COLOR]},
+            },
+        },
+    }
+
+
+# Спецификация Vega-Lite графика накопленных выплат
+def cumulative_spec(schedule, loan_amount, max_points=DEFAULT_MAX_POINTS):
+    months, _, _, cumulative = downsample(schedule, max_points)
+    return {
+        "layer": [
+            {
+                "data": {"values": [{"month": int(m), "amount": float(c)} for m, c in zip(months, cumulative)]},
+                "mark": {"type": "line", "color": "green", "tooltip": True},
+                "encoding": {
+                    "x": {"field": "month", "type": "quantitative", "title": "Месяцы"},
+                    "y": {"field": "amount", "type": "quantitative", "title": "Накопленная сумма"},
+                },
+            },
+            {
+                "data": {"values": [{"amount": float(loan_amount)}]},
+                "mark": {"type": "rule", "color": "red", "strokeDash": [4, 4]},
+                "encoding": {"y": {"field": "amount", "type": "quantitative"}},
+            },
+        ],
+    }
+
+
+# Спецификация Vega-Lite тепловой карты показателя по сетке ставок и сроков
+def heatmap_spec(rates, terms, matrix, title):
+    values = [
+        {"rate": float(rate), "term": int(term), "value": float(matrix[i, j])}
+        for i, rate in enumerate(rates)
+        for j, term in enumerate(terms)
+    ]
+    return {
+        "data": {"values": values},
+        "mark": {"type": "rect", "tooltip": True},
+        "encoding": {
+            "x": {"field": "term", "type": "ordinal", "title": "Срок (лет)"},
+            "y": {"field": "rate", "type": "ordinal", "title": "Ставка (%)", "sort": "descending"},
+            "color": {"field": "value", "type": "quantitative", "title": title},
+        },
+    }
+
+
+# Спецификация Vega-Lite сравнения предложений: линия платежей (или накопленных выплат)
+# каждого предложения на одном графике. Ежемесячная комиссия входит в платеж
+def offers_spec(names, schedules, monthly_fees, cumulative=False, max_points=DEFAULT_MAX_POINTS):
+    values = []
+    for name, schedule, fee in zip(names, schedules, monthly_fees):
+        months, principal, interest, total = downsample(schedule, max_points)
+        amounts = total + fee * months if cumulative else principal + interest + fee
+        values += [{"offer": str(name), "month": int(m), "amount": float(a)} for m, a in zip(months, amounts)]
+    return {
+        "data": {"values": values},
+        "mark": {"type": "line", "tooltip": True, "interpolate": "step-after"},
+        "encoding": {
+            "x": {"field": "month", "type": "quantitative", "title": "Месяцы"},
+            "y": {"field": "amount", "type": "quantitative", "title": "Накопленная сумма" if cumulative else "Платеж"},
+            "color": {"field": "offer", "type": "nominal", "title": "Предложение"},
+        },
+    }
+
+
+_RENDERERS = {
+    MATPLOTLIB: {"pie": pie_png, "payments": payments_png, "cumulative": cumulative_png},
+    VEGA: {"pie": pie_spec, "payments": payments_spec, "cumulative": cumulative_spec},
+}
+
+
+# Функция получения готового графика из кэша (PNG или спецификация Vega-Lite).
+# key - ключ расчета, args - аргументы функции отрисовки
+def get_chart(kind, key, *args, backend=CHART_BACKEND):
+    render = _RENDERERS[backend][kind]
+    return schedule_cache.get_or_compute(("chart", backend, kind) + tuple(key), lambda: render(*args))
+
+
+# Функция вывода графика на страницу Streamlit
+def show_chart(kind, key, *args, backend=CHART_BACKEND):
+    import streamlit as st
+
+    with metrics.span(f"render.chart.{kind}"):
+        chart = get_chart(kind, key, *args, backend=backend)
+        if backend == VEGA:
+            st.vega_lite_chart(chart, use_container_width=True)
+        else:
+            st.image(chart, use_container_width=True)
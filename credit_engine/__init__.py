@@ -0,0 +1,38 @@
+# Расчетное ядро кредитного калькулятора без зависимостей от интерфейса:
+# не импортирует Streamlit, SQLAlchemy и matplotlib, поэтому подходит для
+# страниц, тестов, командной строки (python -m credit_engine) и фоновых процессов.
+# Пакетный расчет из файлов (pandas/pyarrow) - в модуле credit_engine.batch.
+from .cache import ScheduleCache, schedule_cache
+from .codec import decode_schedule, encode_schedule
+from .daycount import (
+    ACT_360,
+    ACT_365,
+    ACT_ACT,
+    CALENDAR_TITLES,
+    CALENDARS,
+    DAY_COUNT_CONVENTIONS,
+    daily_schedule,
+    payment_calendar,
+    year_fractions,
+)
+from .events import PREPAYMENT_MODES, REDUCE_PAYMENT, REDUCE_TERM, Prepayment, PrepaymentSchedule
+from .floating import FloatingRateResult, RateModel, simulate_floating_rate, simulate_key_rate_paths
+from .money import exact_schedule, exact_schedules, exact_totals, from_kopecks, schedule_from_kopecks, to_kopecks
+from .schedule import (
+    ANNUITY,
+    DIFFERENTIATED,
+    PAYMENT_TYPES,
+    SCHEDULE_COLUMNS,
+    Schedule,
+    annuity_schedule,
+    build_schedule,
+    calculate_annuity_payment,
+    calculate_compound_interest,
+    calculate_differentiated_payment,
+    calculate_simple_interest,
+    differentiated_schedule,
+    schedule_to_arrow,
+    schedule_to_dataframe,
+)
+from .sensitivity import SensitivityGrid, grid_metrics
+from .solvers import FullCost, SolverResult, full_cost_of_credit, solve_irr, solve_rate, solve_term
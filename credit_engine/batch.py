@@ -0,0 +1,266 @@
+# Пакетный расчет портфеля кредитов из файла (CSV или Parquet).
+# Кредиты читаются блоками фиксированного размера, каждый блок считается
+# векторно по всем кредитам сразу, блоки распределяются по процессам.
+# С полными графиками блок дополнительно режется по числу строк графика
+# (кредито-месяцев), так как 100 000 кредитов по 30 лет - это 36 млн строк.
+# Запуск: python -m credit_engine batch loans.parquet totals.parquet --schedules schedules.parquet
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from .money import exact_schedules, exact_totals, from_kopecks, to_kopecks
+from .schedule import ANNUITY, DIFFERENTIATED, calculate_annuity_payment
+
+DEFAULT_CHUNK_SIZE = 100_000
+SCHEDULE_ROWS_PER_CHUNK = 1_000_000  # Строк графика в блоке (около 50 МБ результата)
+LOAN_COLUMNS = ["loan_amount", "annual_interest_rate", "loan_term_years", "payment_type"]
+
+
+# Функция потокового чтения кредитов блоками
+def read_loans(path, chunk_size=DEFAULT_CHUNK_SIZE):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunk_size)
+
+
+# Функция подсчета кредитов в файле (для Parquet - по метаданным, без чтения данных)
+def count_loans(path):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        return pq.ParquetFile(path).metadata.num_rows
+    with open(path, "rb") as f:
+        return max(sum(1 for _ in f) - 1, 0)  # Без строки заголовка
+
+
+# Функция нарезки блока кредитов на части не более чем по max_rows строк графика
+# (кредит со сроком больше max_rows месяцев остается отдельной частью)
+def split_by_schedule_rows(loans, max_rows=SCHEDULE_ROWS_PER_CHUNK):
+    if "loan_term_years" not in loans:
+        yield loans  # Ошибку о недостающих колонках сообщит расчет
+        return
+    ends = np.cumsum(loans["loan_term_years"].to_numpy(dtype=np.int64) * 12)
+    start = 0
+    while start < len(loans):
+        base = ends[start - 1] if start else 0
+        stop = max(int(np.searchsorted(ends, base + max_rows, side="right")), start + 1)
+        yield loans.iloc[start:stop]
+        start = stop
+
+
+# Функция подготовки параметров кредитов в виде массивов
+def loan_arrays(loans):
+    missing = [column for column in LOAN_COLUMNS[:3] if column not in loans]
+    if missing:
+        raise ValueError(f"В файле нет колонок: {', '.join(missing)}")
+    loan_amount = loans["loan_amount"].to_numpy(dtype=float)
+    monthly_interest_rate = loans["annual_interest_rate"].to_numpy(dtype=float) / 100 / 12
+    loan_term_months = loans["loan_term_years"].to_numpy(dtype=np.int64) * 12
+    if "payment_type" in loans:
+        payment_type = loans["payment_type"].to_numpy(dtype=object)
+        unknown = ~np.isin(payment_type, [ANNUITY, DIFFERENTIATED])
+        if unknown.any():
+            raise ValueError(f"Неизвестный тип платежей: {payment_type[unknown][0]}")
+        is_annuity = payment_type == ANNUITY
+    else:
+        is_annuity = np.ones(len(loans), dtype=bool)  # По умолчанию аннуитет
+    return loan_amount, monthly_interest_rate, loan_term_months, is_annuity
+
+
+# Функция расчета итогов по каждому кредиту блока.
+# exact=True - точный расчет в копейках (см. credit_engine.money)
+def calculate_portfolio_totals(loans, exact=False):
+    loan_amount, rate, months, is_annuity = loan_arrays(loans)
+    if exact:
+        totals = exact_totals(to_kopecks(loan_amount), rate, months, is_annuity)
+        return pd.DataFrame({
+            "loan_id": loans["loan_id"].to_numpy() if "loan_id" in loans else loans.index.to_numpy(),
+            **{name: from_kopecks(kopecks) for name, kopecks in totals.items()},
+        })
+    annuity_payment = calculate_annuity_payment(loan_amount, rate, months)
+    principal_payment = loan_amount / months
+    # Для дифференцированных платежей сумма процентов: P * r * (n + 1) / 2
+    total_payment = np.where(
+        is_annuity,
+        annuity_payment * months,
+        loan_amount + loan_amount * rate * (months + 1) / 2,
+    )
+    return pd.DataFrame({
+        "loan_id": loans["loan_id"].to_numpy() if "loan_id" in loans else loans.index.to_numpy(),
+        "monthly_payment": np.where(is_annuity, annuity_payment, principal_payment + loan_amount * rate),
+        "last_payment": np.where(is_annuity, annuity_payment, principal_payment * (1 + rate)),
+        "total_payment": total_payment,
+        "total_interest_paid": total_payment - loan_amount,
+    })
+
+
+# Функция расчета полных графиков всех кредитов блока (в длинном формате).
+# exact=True - строки в копейках по тем же правилам, что и итоги (см. credit_engine.money)
+def calculate_portfolio_schedules(loans, exact=False):
+    loan_amount, rate, months, is_annuity = loan_arrays(loans)
+    loan_id = loans["loan_id"].to_numpy() if "loan_id" in loans else loans.index.to_numpy()
+    if exact:
+        rows = exact_schedules(to_kopecks(loan_amount), rate, months, is_annuity)
+        return pd.DataFrame({
+            "loan_id": np.repeat(loan_id, months),
+            "month": rows.pop("month"),
+            **{name: from_kopecks(kopecks) for name, kopecks in rows.items()},
+        })
+    # Номер строки -> номер кредита и номер месяца внутри его графика
+    row_loan = np.repeat(np.arange(len(loans)), months)
+    offsets = np.cumsum(months) - months
+    month = np.arange(len(row_loan)) - offsets[row_loan] + 1
+
+    amount = loan_amount[row_loan]
+    r = rate[row_loan]
+    n = months[row_loan]
+    annuity = is_annuity[row_loan]
+    annuity_payment = calculate_annuity_payment(loan_amount, rate, months)[row_loan]
+
+    # Остаток долга после k-го платежа по замкнутым формулам
+    def balance(k):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            annuity_balance = np.where(
+                r == 0,
+                amount - annuity_payment * k,
+                -annuity_payment * np.expm1(-(n - k) * np.log1p(r)) / r,
+            )
+        return np.where(annuity, annuity_balance, amount - amount / n * k)
+
+    remaining = balance(month)
+    remaining_before = balance(month - 1)
+    interest = remaining_before * r
+    principal = remaining_before - remaining
+    return pd.DataFrame({
+        "loan_id": loan_id[row_loan],
+        "month": month,
+        "payment": principal + interest,
+        "interest": interest,
+        "principal": principal,
+        "remaining": remaining,
+    })
+
+
+# Функция обработки одного блока (выполняется в процессе-обработчике)
+def process_chunk(loans, with_schedules=False, exact=False):
+    totals = calculate_portfolio_totals(loans, exact)
+    schedules = calculate_portfolio_schedules(loans, exact) if with_schedules else None
+    return totals, schedules
+
+
+# Потоковая запись результатов блоками в CSV, Parquet или XLSX.
+# XLSX пишется через openpyxl в режиме write_only (строки сразу уходят в файл);
+# openpyxl - необязательная зависимость, нужна только для этого формата
+class ChunkWriter:
+    XLSX_MAX_ROWS = 1_048_576  # Ограничение Excel на число строк листа (вместе с заголовком)
+
+    def __init__(self, path):
+        self.path = path
+        self._parquet_writer = None
+        self._header_written = False
+        self._workbook = None
+        self._sheet = None
+        self._sheet_rows = 0
+
+    def write(self, df):
+        if self.path.endswith(".parquet"):
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if self._parquet_writer is None:
+                self._parquet_writer = pq.ParquetWriter(self.path, table.schema)
+            self._parquet_writer.write_table(table)
+        elif self.path.endswith(".xlsx"):
+            self._write_xlsx(df)
+        else:
+            df.to_csv(self.path, mode="a" if self._header_written else "w", header=not self._header_written, index=False)
+            self._header_written = True
+
+    def _write_xlsx(self, df):
+        if self._workbook is None:
+            try:
+                from openpyxl import Workbook
+            except ImportError as error:
+                raise ImportError("Для выгрузки в XLSX установите пакет openpyxl") from error
+            self._workbook = Workbook(write_only=True)
+        for row in df.itertuples(index=False):
+            # Лист заполнен - продолжаем на новом листе с тем же заголовком
+            if self._sheet is None or self._sheet_rows >= self.XLSX_MAX_ROWS:
+                self._sheet = self._workbook.create_sheet()
+                self._sheet.append(list(df.columns))
+                self._sheet_rows = 1
+            self._sheet.append([value.item() if hasattr(value, "item") else value for value in row])
+            self._sheet_rows += 1
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+        if self._workbook is not None:
+            self._workbook.save(self.path)
+
+
+# Функция пакетного расчета портфеля: возвращает число обработанных кредитов.
+# progress(processed, totals) вызывается после записи каждого блока с итогами этого блока.
+# С полными графиками в памяти одновременно не больше (workers + 1) * schedule_rows строк графика
+def run_portfolio(input_path, totals_path, schedules_path=None, chunk_size=DEFAULT_CHUNK_SIZE, workers=None,
+                  exact=False, progress=None, schedule_rows=SCHEDULE_ROWS_PER_CHUNK):
+    workers = workers or os.cpu_count() or 1
+    with_schedules = schedules_path is not None
+    totals_writer = ChunkWriter(totals_path)
+    schedules_writer = ChunkWriter(schedules_path) if with_schedules else None
+    processed = 0
+
+    def write_result(result):
+        totals, schedules = result
+        totals_writer.write(totals)
+        if schedules_writer is not None:
+            schedules_writer.write(schedules)
+        if progress is not None:
+            progress(processed + len(totals), totals)
+        return len(totals)
+
+    # Сквозная нумерация кредитов, если в файле нет собственного loan_id
+    def numbered(chunks):
+        offset = 0
+        for loans in chunks:
+            loans.index = pd.RangeIndex(offset, offset + len(loans))
+            offset += len(loans)
+            yield loans
+
+    # Блоки с графиками режутся по числу строк графика
+    def bounded(chunks):
+        for loans in chunks:
+            yield from split_by_schedule_rows(loans, schedule_rows)
+
+    try:
+        chunks = numbered(read_loans(input_path, chunk_size))
+        if with_schedules:
+            chunks = bounded(chunks)
+        max_pending = workers + 1 if with_schedules else workers * 2
+        if workers == 1:
+            for loans in chunks:
+                processed += write_result(process_chunk(loans, with_schedules, exact))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # Ограничиваем число блоков в работе, чтобы память не росла с размером файла
+                pending = deque()
+                for loans in chunks:
+                    pending.append(pool.submit(process_chunk, loans, with_schedules, exact))
+                    if len(pending) >= max_pending:
+                        processed += write_result(pending.popleft().result())
+                while pending:
+                    processed += write_result(pending.popleft().result())
+    finally:
+        totals_writer.close()
+        if schedules_writer is not None:
+            schedules_writer.close()
+    return processed
+
@@ -0,0 +1,89 @@
+# Кэш рассчитанных графиков и производных артефактов (таблиц, графиков).
+# Один экземпляр на процесс: модуль импортируется один раз, поэтому кэш
+# общий для всех перезапусков страниц и всех сессий пользователей.
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024  # 64 МБ
+
+
+# Функция оценки занимаемой объектом памяти в байтах
+def estimate_size(value):
+    if hasattr(value, "nbytes"):  # Массивы NumPy
+        return int(value.nbytes)
+    if hasattr(value, "memory_usage"):  # Таблицы pandas
+        usage = value.memory_usage(deep=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(item) for item in value)
+    return sys.getsizeof(value)
+
+
+# LRU-кэш с ограничением по суммарному объему в байтах
+class ScheduleCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                return value  # Не помещается в бюджет целиком: не кэшируем
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            # Вытесняем давно не использованные записи, пока не уложимся в бюджет
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+        return value
+
+    # Возвращает значение из кэша или вычисляет и сохраняет его
+    def get_or_compute(self, key, compute):
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+# Общий кэш процесса; бюджет задается переменной окружения SCHEDULE_CACHE_MAX_BYTES
+schedule_cache = ScheduleCache(int(os.environ.get("SCHEDULE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)))
@@ -0,0 +1,74 @@
+# Командная строка расчетного ядра.
+#   python -m credit_engine single --amount 1000000 --rate 10 --term 5 --type annuity
+#   python -m credit_engine batch loans.parquet totals.parquet --schedules schedules.parquet
+import argparse
+
+from .money import exact_schedule, schedule_from_kopecks
+from .schedule import ANNUITY, DIFFERENTIATED, build_schedule
+
+# Тип платежей можно указать по-английски или так же, как в интерфейсе
+PAYMENT_TYPE_ALIASES = {
+    "annuity": ANNUITY,
+    "differentiated": DIFFERENTIATED,
+    ANNUITY: ANNUITY,
+    DIFFERENTIATED: DIFFERENTIATED,
+}
+
+
+# Расчет одного кредита: итоги на экран, график по желанию в CSV
+def run_single(args):
+    loan_term_months = args.term * 12
+    build = exact_schedule if args.exact else build_schedule
+    schedule = build(args.amount, args.rate / 100 / 12, loan_term_months, PAYMENT_TYPE_ALIASES[args.type])
+    if args.exact:
+        schedule = schedule_from_kopecks(schedule)
+    total_payment = schedule.payment.sum()
+    print(f"Ежемесячный платеж: {schedule.payment[0]:.2f}")
+    if schedule.payment[0] != schedule.payment[-1]:
+        print(f"Последний платеж: {schedule.payment[-1]:.2f}")
+    print(f"Общая сумма выплат: {total_payment:.2f}")
+    print(f"Переплата по кредиту: {total_payment - args.amount:.2f}")
+    if args.schedule:
+        from .export import export_schedule  # pandas загружается только для выгрузки
+
+        export_schedule(schedule, args.schedule)
+    return 0
+
+
+# Пакетный расчет портфеля из файла
+def run_batch(args):
+    from .batch import DEFAULT_CHUNK_SIZE, run_portfolio  # pandas загружается только для пакетного режима
+
+    chunk_size = args.chunk_size or DEFAULT_CHUNK_SIZE
+    count = run_portfolio(args.input, args.totals, args.schedules, chunk_size, args.workers, args.exact)
+    print(f"Обработано кредитов: {count}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="credit_engine", description="Кредитный калькулятор")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    single = commands.add_parser("single", help="Расчет одного кредита")
+    single.add_argument("--amount", type=float, required=True, help="Сумма кредита")
+    single.add_argument("--rate", type=float, required=True, help="Годовая процентная ставка (%%)")
+    single.add_argument("--term", type=int, required=True, help="Срок кредита (в годах)")
+    single.add_argument("--type", choices=PAYMENT_TYPE_ALIASES, default="annuity", help="Тип платежей")
+    single.add_argument("--schedule", help="Файл для графика платежей (.csv, .parquet или .xlsx)")
+    single.add_argument("--exact", action="store_true", help="Точный расчет в копейках")
+    single.set_defaults(handler=run_single)
+
+    batch = commands.add_parser("batch", help="Пакетный расчет портфеля из CSV или Parquet")
+    batch.add_argument("input", help="Файл с кредитами (.csv или .parquet)")
+    batch.add_argument("totals", help="Файл для итогов по кредитам (.csv или .parquet)")
+    batch.add_argument("--schedules", help="Файл для полных графиков платежей (.csv, .parquet или .xlsx)")
+    batch.add_argument("--chunk-size", type=int, help="Размер блока (по умолчанию 100000 кредитов)")
+    batch.add_argument("--workers", type=int, default=None)
+    batch.add_argument("--exact", action="store_true", help="Точный расчет итогов и графиков в копейках")
+    batch.set_defaults(handler=run_batch)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.handler(args)
@@ -0,0 +1,39 @@
+# Компактное бинарное колоночное представление графика платежей для хранения в БД.
+# Формат: заголовок (сигнатура, версия, флаги, число месяцев), затем колонки
+# payment, interest, principal, remaining подряд как little-endian float64.
+# Номер месяца не хранится: это всегда 1..n.
+import struct
+import zlib
+
+import numpy as np
+
+from .schedule import Schedule
+
+MAGIC = b"SCH1"
+VERSION = 1
+FLAG_ZLIB = 1
+_HEADER = struct.Struct("<4sBBI")  # сигнатура, версия, флаги, число месяцев
+_COLUMNS = ("payment", "interest", "principal", "remaining")
+_DTYPE = np.dtype("<f8")
+
+
+# Функция упаковки графика в байты (по умолчанию со сжатием zlib)
+def encode_schedule(schedule, compress=True):
+    body = np.concatenate([np.asarray(getattr(schedule, column), dtype=_DTYPE) for column in _COLUMNS]).tobytes()
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_ZLIB
+    return _HEADER.pack(MAGIC, VERSION, flags, len(schedule.month)) + body
+
+
+# Функция распаковки графика. Колонки - представления (view) одного буфера, без копирования
+def decode_schedule(blob):
+    magic, version, flags, months = _HEADER.unpack_from(blob)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Неизвестный формат сохраненного графика")
+    body = memoryview(blob)[_HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    columns = np.frombuffer(body, dtype=_DTYPE, count=months * len(_COLUMNS)).reshape(len(_COLUMNS), months)
+    return Schedule(np.arange(1, months + 1), *columns)
@@ -0,0 +1,176 @@
+# Ежедневное начисление процентов: конвенции подсчета дней и календарь платежей.
+#
+# Проценты за период = остаток * годовая ставка * доля года периода, где доля года
+# считается по конвенции:
+# - ACT/365: фактические дни / 365;
+# - ACT/ACT: каждый день весит 1/365 или 1/366 (в високосный год);
+# - ACT/360: фактические дни / 360.
+# Даты платежей - тот же день месяца, что и день выдачи (или последний день короткого
+# месяца), перенесенный на следующий рабочий день по календарю.
+#
+# Календарь и доли года рассчитываются векторно по массиву дней срока кредита
+# (накопленная сумма весов дней) и кэшируются по (дата выдачи, срок, календарь, конвенция).
+import datetime
+from functools import lru_cache
+from typing import NamedTuple
+
+import numpy as np
+
+from .schedule import ANNUITY, DIFFERENTIATED, Schedule
+
+ACT_365 = "ACT/365"
+ACT_ACT = "ACT/ACT"
+ACT_360 = "ACT/360"
+DAY_COUNT_CONVENTIONS = [ACT_365, ACT_ACT, ACT_360]
+
+NO_ADJUSTMENT = "none"  # Даты не переносятся
+WEEKENDS = "weekends"  # Перенос с субботы и воскресенья
+RUSSIA = "ru"  # Выходные и нерабочие праздничные дни РФ
+CALENDARS = [NO_ADJUSTMENT, WEEKENDS, RUSSIA]
+CALENDAR_TITLES = {NO_ADJUSTMENT: "Без переноса дат", WEEKENDS: "Перенос с выходных", RUSSIA: "Рабочие дни РФ"}
+
+# Нерабочие праздничные дни РФ (месяц, день). Ежегодные переносы выходных
+# по постановлениям Правительства не учитываются
+RUSSIAN_HOLIDAYS = [(1, day) for day in range(1, 9)] + [(2, 23), (3, 8), (5, 1), (5, 9), (6, 12), (11, 4)]
+
+
+# Праздничные дни календаря за годы first_year..last_year
+def _holidays(calendar, first_year, last_year):
+    if calendar != RUSSIA:
+        return np.empty(0, dtype="datetime64[D]")
+    return np.array(
+        [datetime.date(year, month, day) for year in range(first_year, last_year + 1) for month, day in RUSSIAN_HOLIDAYS],
+        dtype="datetime64[D]",
+    )
+
+
+# Календарь платежей: даты платежей (после переноса) и число дней в каждом периоде
+class PaymentCalendar(NamedTuple):
+    dates: np.ndarray  # Даты платежей, datetime64[D]
+    days: np.ndarray  # Дней в периоде (от предыдущего платежа или даты выдачи)
+
+
+# Функция построения календаря платежей (результат кэшируется, массивы только для чтения)
+@lru_cache(maxsize=1024)
+def payment_calendar(start_date, loan_term_months, calendar=RUSSIA):
+    if calendar not in CALENDARS:
+        raise ValueError(f"Неизвестный календарь: {calendar}")
+    start = np.datetime64(start_date, "D")
+    # Тот же день месяца через k месяцев; в коротких месяцах - последний день месяца
+    months = np.datetime64(start_date, "M") + np.arange(1, loan_term_months + 1)
+    day_offset = start - np.datetime64(start_date, "M").astype("datetime64[D]")
+    month_ends = (months + 1).astype("datetime64[D]") - 1
+    dates = np.minimum(months.astype("datetime64[D]") + day_offset, month_ends)
+    if calendar != NO_ADJUSTMENT:
+        first_year, last_year = start_date.year, int(str(dates[-1])[:4]) + 1
+        holidays = _holidays(calendar, first_year, last_year)
+        dates = np.busday_offset(dates, 0, roll="following", weekmask="1111100", holidays=holidays)
+    days = np.diff(np.concatenate(([start], dates))).astype(np.int64)
+    for array in (dates, days):
+        array.setflags(write=False)
+    return PaymentCalendar(dates, days)
+
+
+# Функция расчета долей года периодов календаря по конвенции (результат кэшируется).
+# Каждый день срока получает вес (1/365, 1/366 или 1/360), доля года периода -
+# разность накопленных сумм весов на его границах
+@lru_cache(maxsize=1024)
+def year_fractions(start_date, loan_term_months, calendar=RUSSIA, convention=ACT_365):
+    dates, days = payment_calendar(start_date, loan_term_months, calendar)
+    if convention == ACT_365:
+        fractions = days / 365
+    elif convention == ACT_360:
+        fractions = days / 360
+    elif convention == ACT_ACT:
+        start = np.datetime64(start_date, "D")
+        all_days = np.arange(start, dates[-1])
+        years = all_days.astype("datetime64[Y]").astype(np.int64) + 1970
+        leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+        cumulative = np.concatenate(([0.0], np.cumsum(np.where(leap, 1 / 366, 1 / 365))))
+        boundaries = np.concatenate(([0], (dates - start).astype(np.int64)))
+        fractions = np.diff(cumulative[boundaries])
+    else:
+        raise ValueError(f"Неизвестная конвенция подсчета дней: {convention}")
+    fractions.setflags(write=False)
+    return fractions
+
+
+# Аннуитетный график с переносом процентов: если проценты периода (вместе с перенесенными)
+# больше платежа, платеж целиком идет в проценты, а непогашенная часть переносится на
+# следующий период без начисления на нее процентов. Тело кредита при этом не растет.
+# Цикл по месяцам: сумма к переносу зависит от всех предыдущих периодов
+def _deferred_annuity(loan_amount, period_rate, annuity_payment):
+    interest, principal, remaining = [], [], []
+    balance, owed = loan_amount, 0.0
+    for rate in period_rate.tolist():
+        owed += balance * rate
+        paid_interest = min(owed, annuity_payment)
+        paid_principal = min(annuity_payment - paid_interest, balance)
+        owed -= paid_interest
+        balance -= paid_principal
+        interest.append(paid_interest)
+        principal.append(paid_principal)
+        remaining.append(balance)
+    interest, principal, remaining = np.array(interest), np.array(principal), np.array(remaining)
+    # Последний платеж гасит остаток тела кредита и перенесенные проценты
+    principal[-1] += remaining[-1]
+    interest[-1] += owed
+    remaining[-1] = 0.0
+    return interest, principal, remaining
+
+
+# Функция построения графика с ежедневным начислением процентов.
+# Проценты каждого периода начисляются по фактическим дням, аннуитетный платеж считается
+# по тем же ставкам периодов, поэтому остаток к концу срока гасится сам (с точностью до округления).
+# Если проценты длинного периода больше платежа, они переносятся (см. _deferred_annuity)
+def daily_schedule(loan_amount, annual_interest_rate, start_date, loan_term_months, payment_type,
+                   convention=ACT_365, calendar=RUSSIA):
+    period_rate = annual_interest_rate / 100 * year_fractions(start_date, loan_term_months, calendar, convention)
+    month = np.arange(1, loan_term_months + 1)
+    if payment_type == ANNUITY:
+        # B_k = B_{k-1} * (1 + i_k) - A, B_n = 0  =>  A = P / sum_m 1 / G_m,
+        # B_k = A * G_k * sum_{m>k} 1 / G_m, где G_k = prod_{j<=k} (1 + i_j). Хвостовые суммы
+        # накапливаются с конца срока, чтобы остаток не терял точность при больших G_k
+        growth = np.cumprod(1 + period_rate)
+        tail = np.cumsum((1 / growth)[::-1])[::-1]
+        annuity_payment = loan_amount / tail[0]
+        remaining = annuity_payment * growth * np.append(tail[1:], 0.0)
+        remaining_before = np.concatenate(([loan_amount], remaining[:-1]))
+        interest = remaining_before * period_rate
+        principal = remaining_before - remaining
+        if principal.min() < 0:
+            # Длинный период (например, с переносом через праздники) при высокой ставке: проценты
+            # больше платежа. Проценты переносятся без капитализации, платеж подбирается методом
+            # ложного положения (Illinois) так, чтобы последний платеж совпал с остальными.
+            # Без капитализации кредит дешевле, поэтому платеж лежит между P / n и найденным выше
+            def last_payment_gap(payment):
+                interest, principal, _ = _deferred_annuity(loan_amount, period_rate, payment)
+                return interest[-1] + principal[-1] - payment
+            low, high = loan_amount / loan_term_months, annuity_payment
+            gap_low, gap_high = last_payment_gap(low), last_payment_gap(high)
+            current, side = high, 0
+            for _ in range(200):
+                # При очень высоких ставках и долгих сроках последний платеж чувствителен к платежу
+                # сильнее, чем позволяет float64: поиск заканчивается на пределе точности платежа
+                if gap_low - gap_high <= 1e-9 * loan_amount or high - low <= 2 * np.spacing(high):
+                    break
+                current = high - gap_high * (high - low) / (gap_high - gap_low)
+                gap = last_payment_gap(current)
+                if abs(gap) <= 1e-9 * loan_amount:
+                    break
+                if gap > 0:
+                    low, gap_low = current, gap
+                    gap_high /= 2 if side == 1 else 1
+                    side = 1
+                else:
+                    high, gap_high = current, gap
+                    gap_low /= 2 if side == -1 else 1
+                    side = -1
+            interest, principal, remaining = _deferred_annuity(loan_amount, period_rate, current)
+    elif payment_type == DIFFERENTIATED:
+        principal = np.full(loan_term_months, loan_amount / loan_term_months)
+        remaining = loan_amount - principal[0] * month
+        interest = (remaining + principal[0]) * period_rate
+    else:
+        raise ValueError(f"Неизвестный тип платежей: {payment_type}")
+    return Schedule(month, principal + interest, interest, principal, remaining)
@@ -0,0 +1,156 @@
+# Досрочные погашения: график кредита со списком событий.
+# Каждое событие - досрочный платеж в конце месяца (после планового платежа)
+# с уменьшением срока или уменьшением платежа. Сумма, покрывающая весь остаток,
+# закрывает кредит. Между событиями график считается векторно по замкнутым формулам.
+#
+# PrepaymentSchedule хранит последний рассчитанный график и при изменении списка
+# событий пересчитывает его только начиная с первого измененного месяца.
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from .schedule import ANNUITY, DIFFERENTIATED, Schedule, calculate_annuity_payment
+
+REDUCE_TERM = "reduce_term"  # Сокращение срока, платеж прежний
+REDUCE_PAYMENT = "reduce_payment"  # Уменьшение платежа, срок прежний
+PREPAYMENT_MODES = [REDUCE_TERM, REDUCE_PAYMENT]
+
+_EPS = 1e-9
+
+
+# Досрочный платеж в конце месяца month (нумерация с 1)
+class Prepayment(NamedTuple):
+    month: int
+    amount: float
+    mode: str = REDUCE_TERM
+
+
+class PrepaymentSchedule:
+    def __init__(self, loan_amount, monthly_interest_rate, loan_term_months, payment_type):
+        if payment_type not in (ANNUITY, DIFFERENTIATED):
+            raise ValueError(f"Неизвестный тип платежей: {payment_type}")
+        self.loan_amount = loan_amount
+        self.rate = monthly_interest_rate
+        self.loan_term_months = loan_term_months
+        self.payment_type = payment_type
+        self.events = []
+        self.recomputed_months = 0  # Сколько месяцев было рассчитано за все время
+        self._rows = None  # Колонки графика + prepayment и param (платеж или доля тела кредита месяца)
+
+    # Параметр плана погашения: аннуитетный платеж или ежемесячная доля тела кредита
+    def _initial_param(self):
+        if self.payment_type == ANNUITY:
+            return calculate_annuity_payment(self.loan_amount, self.rate, self.loan_term_months)
+        return self.loan_amount / self.loan_term_months
+
+    # Оставшееся (дробное) число платежей при остатке balance и параметре плана param
+    def _months_left(self, balance, param):
+        if self.payment_type == DIFFERENTIATED or self.rate == 0:
+            return balance / param
+        return -math.log1p(-balance * self.rate / param) / math.log1p(self.rate)
+
+    # Отрезок графика без событий: месяцы first_month..last_month (или до полного погашения)
+    def _segment(self, first_month, balance, param, last_month):
+        n_left = self._months_left(balance, param)
+        total = math.ceil(n_left - _EPS)
+        count = max(min(total, last_month - first_month + 1), 0)
+        k = np.arange(1, count + 1)
+        if self.payment_type == ANNUITY and self.rate != 0:
+            remaining = -param * np.expm1(-(n_left - k) * math.log1p(self.rate)) / self.rate
+        else:
+            remaining = balance - param * k
+        remaining = np.maximum(remaining, 0)
+        if count == total and count:
+            remaining[-1] = 0.0  # Последний платеж гасит остаток полностью
+        remaining_before = np.concatenate(([balance], remaining[:-1]))
+        interest = remaining_before * self.rate
+        principal = remaining_before - remaining
+        return {
+            "month": np.arange(first_month, first_month + count),
+            "payment": principal + interest,
+            "interest": interest,
+            "principal": principal,
+            "remaining": remaining,
+            "prepayment": np.zeros(count),
+            "param": np.full(count, param),
+        }
+
+    # Расчет графика с месяца first_month при остатке balance на его начало
+    def _compute_from(self, first_month, balance, param, events):
+        parts = []
+        month = first_month  # Первый еще не рассчитанный месяц
+        for event in events:
+            if event.month >= month:
+                # Плановые платежи до месяца события включительно
+                part = self._segment(month, balance, param, event.month)
+                if len(part["month"]):
+                    parts.append(part)
+                    month += len(part["month"])
+                    balance = part["remaining"][-1]
+                if month <= event.month or balance <= _EPS:
+                    break  # Кредит погашен раньше события
+            # Досрочный платеж в последнем рассчитанном месяце (месяце события)
+            last = parts[-1]
+            prepayment = min(event.amount, balance)
+            months_left = math.ceil(self._months_left(balance, param) - _EPS)
+            balance -= prepayment
+            last["prepayment"][-1] += prepayment
+            last["payment"][-1] += prepayment
+            last["principal"][-1] += prepayment
+            last["remaining"][-1] = balance
+            if balance <= _EPS:
+                last["remaining"][-1] = 0.0
+                break  # Кредит погашен досрочно полностью
+            if event.mode == REDUCE_PAYMENT:
+                if self.payment_type == ANNUITY:
+                    param = calculate_annuity_payment(balance, self.rate, months_left)
+                else:
+                    param = balance / months_left
+        else:
+            # Плановые платежи после последнего события до полного погашения
+            part = self._segment(month, balance, param, math.inf)
+            if len(part["month"]):
+                parts.append(part)
+        rows = {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+        self.recomputed_months += len(rows["month"])
+        return rows
+
+    # Пересчет графика под новый список событий; возвращает график (Schedule),
+    # платеж и тело кредита в котором включают досрочные платежи
+    def update(self, events):
+        events = sorted((Prepayment(*event) for event in events), key=lambda event: event.month)
+        for event in events:
+            if event.month < 1 or event.amount < 0:
+                raise ValueError(f"Некорректное досрочное погашение: {event}")
+            if event.mode not in PREPAYMENT_MODES:
+                raise ValueError(f"Неизвестный способ досрочного погашения: {event.mode}")
+        if self._rows is None:
+            self._rows = self._compute_from(1, self.loan_amount, self._initial_param(), events)
+            self.events = events
+            return self.schedule()
+
+        # Первый месяц, с которого старый и новый списки событий расходятся
+        changed = [min(old.month, new.month) for old, new in zip(self.events, events) if old != new]
+        changed += [event.month for event in self.events[len(events):] + events[len(self.events):]]
+        first_changed = max(min(changed, default=math.inf), 1)
+        self.events = events
+        if first_changed > len(self._rows["month"]):
+            return self.schedule()  # Изменения только после полного погашения: график прежний
+
+        # Начало графика до измененного месяца переиспользуется без пересчета
+        keep = first_changed - 1
+        balance = self._rows["remaining"][keep - 1] if keep else self.loan_amount
+        param = self._rows["param"][keep]
+        suffix = self._compute_from(first_changed, balance, param, [e for e in events if e.month >= first_changed])
+        self._rows = {name: np.concatenate((self._rows[name][:keep], suffix[name])) for name in suffix}
+        return self.schedule()
+
+    def schedule(self):
+        rows = self._rows
+        return Schedule(rows["month"], rows["payment"], rows["interest"], rows["principal"], rows["remaining"])
+
+    # Досрочные платежи по месяцам
+    @property
+    def prepayment(self):
+        return self._rows["prepayment"]
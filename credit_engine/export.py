@@ -0,0 +1,99 @@
+# Потоковая выгрузка графиков платежей в CSV, Parquet или XLSX (формат - по расширению файла).
+# Строки пишутся блоками по batch_size, поэтому при выгрузке в файл память не зависит ни от
+# срока кредита, ни от числа выгружаемых расчетов: в памяти всегда один график и один блок строк.
+# export_bytes (для кнопки скачивания) возвращает файл целиком, и его размер уже в памяти.
+#
+#   export_schedule(schedule, "schedule.xlsx")
+#   export_calculations(database.iter_user_calculations(username), "calculations.parquet")
+import importlib.util
+import os
+import tempfile
+
+from .codec import decode_schedule
+from .schedule import Schedule, build_schedule, schedule_to_dataframe
+
+EXPORT_FORMATS = {"CSV": ".csv", "Parquet": ".parquet", "XLSX": ".xlsx"}
+DEFAULT_BATCH_SIZE = 10_000  # Строк в блоке
+CALCULATION_COLUMN = "Расчет"
+FORMAT_DEPENDENCIES = {"XLSX": "openpyxl"}  # Необязательные пакеты, без которых формат недоступен
+
+
+# Функция списка форматов, доступных в текущем окружении (без импорта модулей записи)
+def available_export_formats():
+    return {name: suffix for name, suffix in EXPORT_FORMATS.items()
+            if name not in FORMAT_DEPENDENCIES or importlib.util.find_spec(FORMAT_DEPENDENCIES[name]) is not None}
+
+
+# Функция нарезки графика на блоки таблиц по batch_size строк
+def schedule_batches(schedule, batch_size=DEFAULT_BATCH_SIZE):
+    for start in range(0, len(schedule.month), batch_size):
+        yield schedule_to_dataframe(Schedule(*(column[start:start + batch_size] for column in schedule)))
+
+
+# График сохраненного расчета: сохраненный вместе с расчетом или пересчитанный по параметрам
+def calculation_schedule(calculation):
+    schedule_blob = getattr(calculation, "schedule_blob", None)
+    if schedule_blob is not None:
+        return decode_schedule(schedule_blob)
+    return build_schedule(
+        calculation.loan_amount,
+        calculation.annual_interest_rate / 100 / 12,
+        calculation.loan_term_years * 12,
+        calculation.payment_type,
+    )
+
+
+# Функция построения блоков строк по набору расчетов: графики идут подряд,
+# в первой колонке - ссылка на расчет. calculations может быть генератором
+def calculations_batches(calculations, batch_size=DEFAULT_BATCH_SIZE):
+    import pandas as pd  # pandas и модули записи файлов загружаются только при выгрузке
+
+    pending, rows = [], 0
+    for calculation in calculations:
+        for df in schedule_batches(calculation_schedule(calculation), batch_size):
+            df.insert(0, CALCULATION_COLUMN, calculation.unique_link)
+            pending.append(df)
+            rows += len(df)
+            if rows >= batch_size:
+                yield pd.concat(pending, ignore_index=True)
+                pending, rows = [], 0
+    if pending:
+        yield pd.concat(pending, ignore_index=True)
+
+
+# Функция записи блоков в файл; возвращает число записанных строк
+def write_batches(batches, path):
+    from .batch import ChunkWriter
+
+    writer = ChunkWriter(path)
+    rows = 0
+    try:
+        for df in batches:
+            writer.write(df)
+            rows += len(df)
+    finally:
+        writer.close()
+    return rows
+
+
+# Выгрузка одного графика платежей
+def export_schedule(schedule, path, batch_size=DEFAULT_BATCH_SIZE):
+    return write_batches(schedule_batches(schedule, batch_size), path)
+
+
+# Выгрузка графиков набора сохраненных расчетов в один файл
+def export_calculations(calculations, path, batch_size=DEFAULT_BATCH_SIZE):
+    return write_batches(calculations_batches(calculations, batch_size), path)
+
+
+# Выгрузка в байты для кнопки скачивания: файл пишется блоками во временный каталог, но
+# возвращается целиком (st.download_button все равно держит данные в памяти), поэтому
+# память здесь пропорциональна размеру файла. Для больших выгрузок - export_schedule /
+# export_calculations в файл. export - одна из этих функций, suffix - расширение из EXPORT_FORMATS
+def export_bytes(export, source, suffix):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, f"export{suffix}")
+        if not export(source, path):
+            return None  # Нечего выгружать
+        with open(path, "rb") as f:
+            return f.read()
@@ -0,0 +1,153 @@
+# Кредиты с плавающей ставкой: ставка = ключевая ставка + маржа, пересматривается
+# каждые reset_months месяцев, и на каждую дату пересмотра аннуитетный платеж
+# пересчитывается на остаток долга и оставшийся срок.
+#
+# Траектории ключевой ставки генерируются локально по модели Васичека (возврат к
+# среднему) с заданным зерном. Все траектории считаются одновременно массивами NumPy
+# (цикл только по датам пересмотра); при большом числе траекторий блоки по
+# PATHS_PER_CHUNK траекторий распределяются по процессам.
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from .schedule import calculate_annuity_payment
+
+PATHS_PER_CHUNK = 5_000  # Размер блока не зависит от числа процессов, поэтому результат тоже
+BAND_SAMPLE_PATHS = 20_000  # Траекторий, по которым строятся полосы платежа по периодам
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+# Параметры модели ключевой ставки (годовые, в процентах)
+class RateModel(NamedTuple):
+    initial_rate: float  # Ключевая ставка сейчас
+    mean_rate: float  # Долгосрочный уровень
+    reversion: float = 0.5  # Скорость возврата к среднему (в год)
+    volatility: float = 2.0  # Волатильность (п.п. в год)
+    floor: float = 0.0  # Ставка не опускается ниже
+
+
+# Функция генерации траекторий ключевой ставки: массив (n_paths, n_periods),
+# значение в столбце j - ставка на период пересмотра j (первый период - текущая ставка)
+def simulate_key_rate_paths(model, n_paths, n_periods, reset_months=3, seed=None):
+    rng = np.random.default_rng(seed)
+    dt = reset_months / 12
+    # Точная дискретизация процесса Орнштейна-Уленбека
+    decay = math.exp(-model.reversion * dt)
+    if model.reversion > 0:
+        step_std = model.volatility * math.sqrt((1 - decay ** 2) / (2 * model.reversion))
+    else:
+        step_std = model.volatility * math.sqrt(dt)
+    shocks = rng.standard_normal((n_paths, n_periods - 1)) * step_std
+    paths = np.empty((n_paths, n_periods))
+    paths[:, 0] = model.initial_rate
+    for j in range(1, n_periods):
+        paths[:, j] = paths[:, j - 1] * decay + model.mean_rate * (1 - decay) + shocks[:, j - 1]
+    return np.maximum(paths, model.floor)
+
+
+# Функция расчета платежей по траекториям ставки кредита (годовые %, по периодам пересмотра).
+# Возвращает платеж каждого периода (n_paths, n_periods) и общую сумму выплат по траекториям
+def floating_payments(loan_amount, annual_rate_paths, loan_term_months, reset_months=3):
+    annual_rate_paths = np.asarray(annual_rate_paths, dtype=float)
+    n_paths, n_periods = annual_rate_paths.shape
+    balance = np.full(n_paths, float(loan_amount))
+    payments = np.empty((n_paths, n_periods))
+    total_payment = np.zeros(n_paths)
+    for j in range(n_periods):
+        months_left = loan_term_months - j * reset_months
+        months = min(reset_months, months_left)
+        rate = annual_rate_paths[:, j] / 100 / 12
+        payment = calculate_annuity_payment(balance, rate, months_left)
+        # Остаток после months платежей: B(1+r)^m - A((1+r)^m - 1)/r
+        growth_minus_one = np.expm1(months * np.log1p(rate))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            paid_off = np.where(rate == 0, payment * months, payment * growth_minus_one / rate)
+        balance = np.maximum(balance * (growth_minus_one + 1) - paid_off, 0)
+        payments[:, j] = payment
+        total_payment += payment * months
+    return payments, total_payment
+
+
+# Функция расчета блока траекторий (выполняется в процессе-обработчике)
+def simulate_chunk(loan_amount, loan_term_months, margin, model, n_paths, reset_months, seed):
+    n_periods = -(-loan_term_months // reset_months)
+    key_rates = simulate_key_rate_paths(model, n_paths, n_periods, reset_months, seed)
+    return floating_payments(loan_amount, key_rates + margin, loan_term_months, reset_months)
+
+
+# Результат моделирования: перцентили платежа по периодам, общей суммы выплат и переплаты
+class FloatingRateResult(NamedTuple):
+    percentiles: tuple
+    payment_bands: np.ndarray  # (число перцентилей, n_periods)
+    total_payment: np.ndarray  # Перцентили общей суммы выплат
+    overpayment: np.ndarray  # Перцентили переплаты
+    mean_total_payment: float
+    n_paths: int
+
+
+# Сводка по рассчитанным траекториям, пополняемая блоками simulate_chunk. Память ограничена:
+# от каждой траектории хранится только общая сумма выплат, а платежи по периодам - только
+# у первых BAND_SAMPLE_PATHS траекторий (траектории независимы, поэтому полосы платежа по
+# ним - несмещенная оценка; при n_paths <= BAND_SAMPLE_PATHS полосы точные)
+class PathSummary:
+    def __init__(self, loan_amount, percentiles=DEFAULT_PERCENTILES):
+        self.loan_amount = loan_amount
+        self.percentiles = tuple(percentiles)
+        self.n_paths = 0
+        self._totals = []
+        self._payments = []
+        self._sampled = 0
+        self._bands = None  # Полосы по текущей выборке (после ее заполнения не меняются)
+
+    def add(self, result):
+        payments, total_payment = result
+        self.n_paths += len(total_payment)
+        self._totals.append(total_payment)
+        if self._sampled < BAND_SAMPLE_PATHS:
+            payments = payments[:BAND_SAMPLE_PATHS - self._sampled]
+            self._payments.append(payments)
+            self._sampled += len(payments)
+            self._bands = None
+
+    def result(self):
+        if self._bands is None:
+            self._bands = np.percentile(np.concatenate(self._payments), self.percentiles, axis=0)
+        total_payment = np.concatenate(self._totals)
+        return FloatingRateResult(
+            percentiles=self.percentiles,
+            payment_bands=self._bands,
+            total_payment=np.percentile(total_payment, self.percentiles),
+            overpayment=np.percentile(total_payment - self.loan_amount, self.percentiles),
+            mean_total_payment=float(total_payment.mean()),
+            n_paths=self.n_paths,
+        )
+
+
+# Функция моделирования кредита с плавающей ставкой по n_paths траекториям.
+# progress(n_done, summarize) вызывается после каждого блока; summarize() строит сводку
+# по уже рассчитанным траекториям, поэтому ее стоит вызывать, только когда она нужна
+def simulate_floating_rate(loan_amount, loan_term_months, margin, model, n_paths=10_000, reset_months=3,
+                           seed=None, percentiles=DEFAULT_PERCENTILES, workers=None, progress=None):
+    # У каждого блока собственное независимое зерно, порожденное от общего
+    counts = [min(PATHS_PER_CHUNK, n_paths - start) for start in range(0, n_paths, PATHS_PER_CHUNK)]
+    seeds = np.random.SeedSequence(seed).spawn(len(counts))
+    tasks = [(loan_amount, loan_term_months, margin, model, count, reset_months, chunk_seed)
+             for count, chunk_seed in zip(counts, seeds)]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    summary = PathSummary(loan_amount, percentiles)
+
+    def collect(chunk_results):
+        for result in chunk_results:
+            summary.add(result)
+            if progress is not None:
+                progress(summary.n_paths, summary.result)
+
+    if workers == 1:
+        collect(simulate_chunk(*task) for task in tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            collect(pool.map(simulate_chunk, *zip(*tasks)))
+    return summary.result()
@@ -0,0 +1,207 @@
+# Точный расчет в копейках: все суммы графика - целые числа int64 (копейки).
+# Правила как в банке:
+# - аннуитетный платеж и проценты за месяц округляются до копейки банковским
+#   округлением (половина - к четному);
+# - проценты начисляются на фактический (округленный) остаток долга;
+# - тело дифференцированного платежа распределяется так, что нарастающий итог
+#   равен округленной доле P * k / n;
+# - последний платеж корректируется так, чтобы остаток стал ровно нулевым.
+# Поэтому сумма тела кредита по графику всегда в точности равна сумме кредита,
+# а в каждой строке платеж = проценты + тело кредита.
+#
+# Дифференцированный график одного кредита считается по замкнутым формулам. Аннуитетный
+# остаток зависит от округления процентов прошлых месяцев, поэтому для него нужен цикл
+# по месяцам: по скалярам для одного кредита. Итоги и графики пакета кредитов считаются
+# циклом по месяцам, где каждый шаг - операции над массивами всех кредитов сразу.
+#
+# Цена точности - помесячный цикл, который не заменить замкнутой формулой: округление
+# процентов каждого месяца меняет остаток следующего (замеры - бенчмарки
+# portfolio_totals_exact и exact_schedule).
+import numpy as np
+
+from .schedule import ANNUITY, DIFFERENTIATED, Schedule, calculate_annuity_payment
+
+# Функция перевода рублей в копейки (банковское округление)
+def to_kopecks(amount):
+    kopecks = np.rint(np.multiply(amount, 100)).astype(np.int64)
+    return int(kopecks) if kopecks.ndim == 0 else kopecks
+
+
+# Функция перевода копеек в рубли
+def from_kopecks(kopecks):
+    return np.asarray(kopecks) / 100
+
+
+# Функция перевода графика в копейках в график в рублях (для таблицы и графиков)
+def schedule_from_kopecks(schedule):
+    return Schedule(schedule.month, *(from_kopecks(column) for column in schedule[1:]))
+
+
+# Функция построения точного дифференцированного графика одного кредита.
+# Целые копейки в float64 представляются точно (до 2^53), а P * k / n отличается от
+# половины копейки не меньше чем на 1 / n, поэтому np.rint дает точное банковское округление
+def _differentiated_kopecks(loan_kopecks, monthly_interest_rate, loan_term_months):
+    # Нарастающий итог погашенного тела: round(P * k / n), k = 0..n
+    paid = np.rint(float(loan_kopecks) * np.arange(loan_term_months + 1) / loan_term_months)
+    principal = np.diff(paid)
+    interest = np.rint((loan_kopecks - paid[:-1]) * monthly_interest_rate)
+    return principal.astype(np.int64), interest.astype(np.int64), (loan_kopecks - paid[1:]).astype(np.int64)
+
+
+# Функция построения точного аннуитетного графика одного кредита
+def _annuity_kopecks(loan_kopecks, monthly_interest_rate, loan_term_months):
+    annuity_payment = round(calculate_annuity_payment(loan_kopecks, monthly_interest_rate, loan_term_months))
+    interest = np.empty(loan_term_months, dtype=np.int64)
+    principal = np.empty(loan_term_months, dtype=np.int64)
+    balance = loan_kopecks
+    for k in range(loan_term_months):
+        month_interest = round(balance * monthly_interest_rate)  # round() - банковское округление
+        # Последний месяц (или досрочное погашение остатка): гасится весь остаток
+        month_principal = balance if k == loan_term_months - 1 else min(annuity_payment - month_interest, balance)
+        interest[k] = month_interest
+        principal[k] = month_principal
+        balance -= month_principal
+    return principal, interest, loan_kopecks - np.cumsum(principal)
+
+
+# Функция построения точного графика одного кредита: Schedule из массивов int64 (копейки)
+def exact_schedule(loan_amount, monthly_interest_rate, loan_term_months, payment_type):
+    loan_kopecks = to_kopecks(loan_amount)
+    if payment_type == ANNUITY:
+        principal, interest, remaining = _annuity_kopecks(loan_kopecks, monthly_interest_rate, loan_term_months)
+    elif payment_type == DIFFERENTIATED:
+        principal, interest, remaining = _differentiated_kopecks(loan_kopecks, monthly_interest_rate, loan_term_months)
+    else:
+        raise ValueError(f"Неизвестный тип платежей: {payment_type}")
+    month = np.arange(1, loan_term_months + 1)
+    return Schedule(month, principal + interest, interest, principal, remaining)
+
+
+# Функция подготовки массивов кредитов для помесячных циклов: плоские массивы
+# суммы (копейки во float64), ставки, срока и признака аннуитета
+def _flat_loans(loan_kopecks, monthly_interest_rate, loan_term_months, is_annuity):
+    shape = loan_kopecks.shape
+    months = np.broadcast_to(np.asarray(loan_term_months, dtype=np.int64), shape).ravel()
+    rate = np.broadcast_to(np.asarray(monthly_interest_rate, dtype=float), shape).ravel()
+    is_annuity = np.broadcast_to(np.asarray(is_annuity, dtype=bool), shape).ravel()
+    # Целые копейки в float64 представляются точно (до 2^53), а операции с float быстрее
+    return loan_kopecks.ravel().astype(float), rate, months, is_annuity
+
+
+# Группы кредитов: номера аннуитетных и дифференцированных кредитов с помесячными шагами их графиков.
+# Кредиты группы упорядочены по убыванию срока: не погашенные - всегда начало массива,
+# погашаемые в месяце k - его конец
+def _groups(loan, rate, months, is_annuity):
+    for group, steps in [(is_annuity, _annuity_months), (~is_annuity, _differentiated_months)]:
+        index = np.flatnonzero(group)
+        if len(index):
+            index = index[np.argsort(-months[index], kind="stable")]
+            yield index, steps(loan[index], rate[index], months[index])
+
+
+# Функция точного расчета итогов по массивам кредитов: словарь массивов int64 (копейки).
+# Цикл по месяцам, на каждом шаге - операции над всеми еще не погашенными кредитами
+# группы во временных массивах без выделения памяти
+def exact_totals(loan_kopecks, monthly_interest_rate, loan_term_months, is_annuity):
+    loan_kopecks = np.asarray(loan_kopecks, dtype=np.int64)
+    loan, rate, months, is_annuity = _flat_loans(loan_kopecks, monthly_interest_rate, loan_term_months, is_annuity)
+    first_payment, last_payment, total_interest = np.zeros((3, loan.size))
+    for index, steps in _groups(loan, rate, months, is_annuity):
+        first_payment[index], last_payment[index], total_interest[index] = _totals(steps, len(index))
+    first_payment, last_payment, total_interest = (
+        column.astype(np.int64).reshape(loan_kopecks.shape) for column in (first_payment, last_payment, total_interest)
+    )
+    return {
+        "monthly_payment": first_payment,
+        "last_payment": last_payment,
+        "total_payment": loan_kopecks + total_interest,
+        "total_interest_paid": total_interest,
+    }
+
+
+# Функция точного расчета полных графиков массива кредитов в длинном формате: словарь
+# массивов int64 (копейки), строки идут по кредитам, внутри кредита - по месяцам.
+# Шаги те же, что у exact_totals, поэтому строки графика в сумме дают ровно его итоги
+def exact_schedules(loan_kopecks, monthly_interest_rate, loan_term_months, is_annuity):
+    loan_kopecks = np.asarray(loan_kopecks, dtype=np.int64).ravel()
+    loan, rate, months, is_annuity = _flat_loans(loan_kopecks, monthly_interest_rate, loan_term_months, is_annuity)
+    row_loan = np.repeat(np.arange(loan.size), months)
+    offsets = np.cumsum(months) - months
+    interest, principal = np.zeros((2, len(row_loan)), dtype=np.int64)
+    for index, steps in _groups(loan, rate, months, is_annuity):
+        rows = offsets[index]  # Строка текущего месяца каждого кредита группы
+        for active, _, month_interest, month_principal in steps:
+            interest[rows[:active]] = month_interest
+            principal[rows[:active]] = month_principal
+            rows[:active] += 1
+    # Остаток: сумма кредита минус нарастающий итог тела кредита внутри графика
+    paid = np.cumsum(principal)
+    remaining = loan_kopecks[row_loan] - (paid - (paid[offsets] - principal[offsets])[row_loan])
+    return {
+        "month": np.arange(len(row_loan)) - offsets[row_loan] + 1,
+        "payment": principal + interest,
+        "interest": interest,
+        "principal": principal,
+        "remaining": remaining,
+    }
+
+
+# Итоги группы по ее помесячным шагам: первый и последний платеж, сумма процентов
+def _totals(steps, size):
+    total_interest = np.zeros(size)
+    last_payment = np.zeros(size)
+    for k, (active, ending, interest, principal) in enumerate(steps, start=1):
+        last_payment[ending:active] = principal[ending:] + interest[ending:]
+        if k == 1:
+            first_payment = principal + interest
+        total_interest[:active] += interest
+    return first_payment, last_payment, total_interest
+
+
+# Функция числа кредитов, не погашенных к месяцу k, для каждого k = 1..n (сроки по убыванию)
+def _active_counts(months):
+    return np.searchsorted(-months, -np.arange(1, int(months[0]) + 1), side="right")
+
+
+# Помесячные шаги аннуитетных кредитов (сроки по убыванию): на каждом месяце - число
+# не погашенных кредитов active, начало погашаемых в этом месяце ending, проценты и тело
+# кредита (временные массивы, действительны до следующего шага)
+def _annuity_months(loan, rate, months):
+    payment = np.rint(calculate_annuity_payment(loan, rate, months))
+    balance = loan.copy()
+    interest_buffer = np.empty(len(loan))
+    principal_buffer = np.empty(len(loan))
+    counts = _active_counts(months)
+    for k, active in enumerate(counts, start=1):
+        b, r = balance[:active], rate[:active]
+        interest = np.multiply(b, r, out=interest_buffer[:active])
+        np.rint(interest, out=interest)
+        principal = np.subtract(payment[:active], interest, out=principal_buffer[:active])
+        np.minimum(principal, b, out=principal)
+        ending = counts[k] if k < len(counts) else 0
+        principal[ending:] = b[ending:]  # Последний платеж гасит весь остаток
+        yield active, ending, interest, principal
+        b -= principal
+
+
+# Помесячные шаги дифференцированных кредитов (сроки по убыванию). Тело платежа: round(P * k / n)
+# минус уже погашенное, поэтому остаток после месяца k - это P - round(P * k / n)
+def _differentiated_months(loan, rate, months):
+    balance = loan.copy()
+    interest_buffer = np.empty(len(loan))
+    remaining_buffer = np.empty(len(loan))
+    principal_buffer = np.empty(len(loan))
+    counts = _active_counts(months)
+    for k, active in enumerate(counts, start=1):
+        b = balance[:active]
+        interest = np.multiply(b, rate[:active], out=interest_buffer[:active])
+        np.rint(interest, out=interest)
+        # Остаток после платежа: P - round(P * k / n) (у погашаемых в этом месяце - ноль)
+        remaining = np.multiply(loan[:active], k, out=remaining_buffer[:active])
+        np.divide(remaining, months[:active], out=remaining)
+        np.rint(remaining, out=remaining)
+        np.subtract(loan[:active], remaining, out=remaining)
+        principal = np.subtract(b, remaining, out=principal_buffer[:active])
+        ending = counts[k] if k < len(counts) else 0
+        yield active, ending, interest, principal
+        b[:] = remaining
@@ -0,0 +1,86 @@
+# Сравнение кредитных предложений: все предложения считаются одним векторным
+# проходом (как портфель в credit_engine.batch) и ранжируются по общей стоимости,
+# переплате и максимальному платежу. Полные графики нужны только для графиков
+# сравнения: предложения с одинаковыми параметрами используют один и тот же график.
+import numpy as np
+import pandas as pd
+
+from .batch import calculate_portfolio_totals, loan_arrays
+from .cache import schedule_cache
+from .schedule import ANNUITY, build_schedule
+from .solvers import full_cost_of_credit
+
+OFFER_COLUMNS = ["name", "loan_amount", "annual_interest_rate", "loan_term_years", "payment_type", "upfront_fee", "monthly_fee"]
+RANKINGS = {
+    "total_cost": "Общая стоимость",
+    "overpayment": "Переплата",
+    "peak_payment": "Максимальный платеж",
+    "full_cost_rate": "ПСК",
+}
+OFFER_TITLES = {
+    "name": "Предложение",
+    "loan_amount": "Сумма кредита",
+    "annual_interest_rate": "Ставка (%)",
+    "loan_term_years": "Срок (лет)",
+    "payment_type": "Тип платежей",
+    "upfront_fee": "Разовая комиссия",
+    "monthly_fee": "Ежемесячная комиссия",
+    "monthly_payment": "Первый платеж",
+    **RANKINGS,
+}
+
+
+# Функция приведения таблицы предложений к полному набору колонок (комиссии по умолчанию нулевые)
+def normalize_offers(offers):
+    offers = pd.DataFrame(offers).reset_index(drop=True)
+    if "name" not in offers:
+        offers["name"] = [f"Предложение {i + 1}" for i in range(len(offers))]
+    if "payment_type" not in offers:
+        offers["payment_type"] = ANNUITY
+    for fee in ["upfront_fee", "monthly_fee"]:
+        offers[fee] = offers[fee].fillna(0.0).astype(float) if fee in offers else 0.0
+    return offers
+
+
+# Функция проверки предложений: маска строк, у которых разовая комиссия не меньше суммы
+# кредита (заемщик ничего не получает, ПСК не определена)
+def unpaid_offers(offers):
+    offers = normalize_offers(offers)
+    return (offers["upfront_fee"] >= offers["loan_amount"]).to_numpy()
+
+
+# Функция расчета и ранжирования предложений: таблица с итогами, ПСК и местами (1 - лучшее)
+def compare_offers(offers):
+    offers = normalize_offers(offers)
+    loan_amount, _, months, _ = loan_arrays(offers)
+    totals = calculate_portfolio_totals(offers)
+    upfront_fee = offers["upfront_fee"].to_numpy()
+    monthly_fee = offers["monthly_fee"].to_numpy()
+    total_cost = totals["total_payment"].to_numpy() + upfront_fee + monthly_fee * months
+    result = offers[OFFER_COLUMNS].copy()
+    result["monthly_payment"] = totals["monthly_payment"].to_numpy() + monthly_fee
+    # Дифференцированный платеж максимален в первый месяц, аннуитетный постоянен
+    result["peak_payment"] = np.maximum(totals["monthly_payment"], totals["last_payment"]).to_numpy() + monthly_fee
+    result["total_cost"] = total_cost
+    result["overpayment"] = total_cost - loan_amount
+    result["full_cost_rate"] = full_cost_of_credit(
+        loan_amount, offers["annual_interest_rate"].to_numpy(dtype=float), months, offers["payment_type"].to_numpy(),
+        upfront_fee, monthly_fee,
+    ).full_cost_rate
+    # ПСК может не найтись (например, разовая комиссия не меньше суммы кредита): у такого
+    # предложения нет места (<NA>), остальные ранжируются как обычно
+    for column in RANKINGS:
+        result[f"rank_{column}"] = result[column].rank(method="min").astype("Int64")
+    return result
+
+
+# Функция получения графиков платежей предложений. Одинаковые параметры дают один
+# график: он строится один раз и хранится в общем кэше графиков процесса
+def offer_schedules(offers):
+    offers = normalize_offers(offers)
+    loan_amount, rate, months, _ = loan_arrays(offers)
+    schedules = {}
+    for key in zip(loan_amount.tolist(), rate.tolist(), months.tolist(), offers["payment_type"]):
+        if key not in schedules:
+            schedules[key] = schedule_cache.get_or_compute(("schedule",) + key, lambda key=key: build_schedule(*key))
+    return [schedules[key] for key in zip(loan_amount.tolist(), rate.tolist(), months.tolist(), offers["payment_type"])]
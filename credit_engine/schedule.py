@@ -0,0 +1,132 @@
+# Векторизованный расчет графика платежей по кредиту (замкнутые формулы).
+# Все величины считаются сразу целыми массивами NumPy, без цикла по месяцам.
+from typing import NamedTuple
+
+import numpy as np
+
+ANNUITY = "Аннуитетный"
+DIFFERENTIATED = "Дифференцированный"
+PAYMENT_TYPES = [ANNUITY, DIFFERENTIATED]
+
+# Названия колонок таблицы "Детализация выплат"
+SCHEDULE_COLUMNS = {
+    "month": "Месяц",
+    "payment": "Платеж",
+    "remaining": "Остаток долга",
+    "interest": "Проценты",
+    "principal": "Тело кредита",
+}
+PAYMENT_DATE_COLUMN = "Дата платежа"
+
+
+# График платежей: массивы одинаковой длины, по элементу на месяц
+class Schedule(NamedTuple):
+    month: np.ndarray  # Номер месяца (с 1)
+    payment: np.ndarray  # Платеж за месяц
+    interest: np.ndarray  # Проценты в платеже
+    principal: np.ndarray  # Погашение тела кредита
+    remaining: np.ndarray  # Остаток долга после платежа
+
+
+# Функция расчета аннуитетного платежа (скаляры или массивы NumPy)
+def calculate_annuity_payment(loan_amount, monthly_interest_rate, loan_term_months):
+    rate = np.asarray(monthly_interest_rate, dtype=float)
+    # (1 + r) ** n - 1 через expm1/log1p, чтобы не терять точность на малых ставках
+    growth_minus_one = np.expm1(np.multiply(loan_term_months, np.log1p(rate)))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        annuity_payment = np.where(
+            rate == 0,
+            np.divide(loan_amount, loan_term_months),
+            np.multiply(loan_amount, rate) * (growth_minus_one + 1) / growth_minus_one,
+        )
+    if annuity_payment.ndim == 0:
+        return float(annuity_payment)
+    return annuity_payment
+
+
+# Функция расчета дифференцированного платежа (массив платежей по месяцам)
+def calculate_differentiated_payment(loan_amount, monthly_interest_rate, loan_term_months):
+    principal_payment = loan_amount / loan_term_months
+    # Остаток долга на начало каждого месяца убывает арифметической прогрессией
+    remaining_before = loan_amount - principal_payment * np.arange(loan_term_months)
+    return principal_payment + remaining_before * monthly_interest_rate
+
+
+# Функция расчета простого процента (общая сумма выплат)
+def calculate_simple_interest(loan_amount, annual_interest_rate, loan_term_years):
+    total_interest = loan_amount * (annual_interest_rate / 100) * loan_term_years
+    return loan_amount + total_interest
+
+
+# Функция расчета сложного процента (общая сумма выплат)
+def calculate_compound_interest(loan_amount, annual_interest_rate, loan_term_years):
+    return loan_amount * (1 + annual_interest_rate / 100) ** loan_term_years
+
+
+# Функция построения аннуитетного графика
+def annuity_schedule(loan_amount, monthly_interest_rate, loan_term_months):
+    month = np.arange(1, loan_term_months + 1)
+    annuity_payment = calculate_annuity_payment(loan_amount, monthly_interest_rate, loan_term_months)
+    payment = np.full(loan_term_months, annuity_payment)
+    if monthly_interest_rate == 0:
+        remaining = loan_amount - annuity_payment * month
+    else:
+        # Остаток после k-го платежа равен приведенной стоимости оставшихся платежей:
+        # B_k = A * (1 - (1 + r)^-(n - k)) / r. Формула устойчива и на длинных сроках
+        remaining = -annuity_payment * np.expm1(
+            -(loan_term_months - month) * np.log1p(monthly_interest_rate)
+        ) / monthly_interest_rate
+    remaining_before = np.concatenate(([loan_amount], remaining[:-1]))
+    interest = remaining_before * monthly_interest_rate
+    principal = payment - interest
+    return Schedule(month, payment, interest, principal, remaining)
+
+
+# Функция построения дифференцированного графика
+def differentiated_schedule(loan_amount, monthly_interest_rate, loan_term_months):
+    month = np.arange(1, loan_term_months + 1)
+    principal = np.full(loan_term_months, loan_amount / loan_term_months)
+    remaining = loan_amount - principal[0] * month
+    interest = (remaining + principal[0]) * monthly_interest_rate
+    payment = principal + interest
+    return Schedule(month, payment, interest, principal, remaining)
+
+
+# Функция построения графика платежей по типу платежей
+def build_schedule(loan_amount, monthly_interest_rate, loan_term_months, payment_type):
+    if payment_type == ANNUITY:
+        return annuity_schedule(loan_amount, monthly_interest_rate, loan_term_months)
+    if payment_type == DIFFERENTIATED:
+        return differentiated_schedule(loan_amount, monthly_interest_rate, loan_term_months)
+    raise ValueError(f"Неизвестный тип платежей: {payment_type}")
+
+
+# Функция преобразования графика в таблицу для отображения
+def schedule_to_dataframe(schedule):
+    import pandas as pd  # pandas нужен только для таблицы, не для расчета
+
+    return pd.DataFrame({
+        SCHEDULE_COLUMNS["month"]: schedule.month,
+        SCHEDULE_COLUMNS["payment"]: np.round(schedule.payment, 2),
+        # Защита от отрицательных значений из-за погрешности округления
+        SCHEDULE_COLUMNS["remaining"]: np.round(np.maximum(schedule.remaining, 0), 2),
+        SCHEDULE_COLUMNS["interest"]: np.round(schedule.interest, 2),
+        SCHEDULE_COLUMNS["principal"]: np.round(schedule.principal, 2),
+    })
+
+
+# Функция преобразования графика в таблицу Arrow для отображения: типы колонок заданы
+# заранее, значения округлены так же, как в schedule_to_dataframe.
+# dates - даты платежей (datetime64[D]), если график построен по календарю
+def schedule_to_arrow(schedule, dates=None):
+    import pyarrow as pa  # pyarrow нужен только для таблицы, не для расчета
+
+    date_column = {} if dates is None else {PAYMENT_DATE_COLUMN: pa.array(dates, type=pa.date32())}
+    return pa.table({
+        SCHEDULE_COLUMNS["month"]: pa.array(schedule.month, type=pa.int32()),
+        **date_column,
+        SCHEDULE_COLUMNS["payment"]: pa.array(np.round(schedule.payment, 2), type=pa.float64()),
+        SCHEDULE_COLUMNS["remaining"]: pa.array(np.round(np.maximum(schedule.remaining, 0), 2), type=pa.float64()),
+        SCHEDULE_COLUMNS["interest"]: pa.array(np.round(schedule.interest, 2), type=pa.float64()),
+        SCHEDULE_COLUMNS["principal"]: pa.array(np.round(schedule.principal, 2), type=pa.float64()),
+    })
@@ -0,0 +1,97 @@
+# Анализ "что если": платеж, общая сумма выплат и переплата по сетке ставок и сроков.
+# Вся сетка считается одним векторным проходом (ставки - строки, сроки - столбцы).
+# SensitivityGrid хранит уже рассчитанные ячейки и при сдвиге оси (например,
+# при движении ползунка ставки) досчитывает только новые строки и столбцы.
+import numpy as np
+
+from .schedule import ANNUITY, DIFFERENTIATED, calculate_annuity_payment
+
+METRICS = ["monthly_payment", "total_payment", "overpayment"]
+METRIC_TITLES = {
+    "monthly_payment": "Ежемесячный платеж",
+    "total_payment": "Общая сумма выплат",
+    "overpayment": "Переплата",
+}
+
+
+# Функция расчета показателей для всех сочетаний ставок (% годовых) и сроков (лет)
+def grid_metrics(loan_amount, annual_rates, terms_years, payment_type):
+    rate = np.asarray(annual_rates, dtype=float)[:, None] / 100 / 12
+    months = np.asarray(terms_years, dtype=np.int64)[None, :] * 12
+    if payment_type == ANNUITY:
+        monthly_payment = calculate_annuity_payment(loan_amount, rate, months)
+        total_payment = monthly_payment * months
+    elif payment_type == DIFFERENTIATED:
+        # Первый (наибольший) платеж и сумма процентов P * r * (n + 1) / 2
+        monthly_payment = loan_amount / months + loan_amount * rate
+        total_payment = loan_amount + loan_amount * rate * (months + 1) / 2
+    else:
+        raise ValueError(f"Неизвестный тип платежей: {payment_type}")
+    monthly_payment, total_payment = np.broadcast_arrays(monthly_payment, total_payment)
+    return {
+        "monthly_payment": np.array(monthly_payment),
+        "total_payment": np.array(total_payment),
+        "overpayment": total_payment - loan_amount,
+    }
+
+
+# Сетка показателей с инкрементальным пересчетом при изменении осей
+class SensitivityGrid:
+    def __init__(self, loan_amount, payment_type):
+        self.loan_amount = loan_amount
+        self.payment_type = payment_type
+        self.rates = np.empty(0)
+        self.terms = np.empty(0, dtype=np.int64)
+        self.values = {metric: np.empty((0, 0)) for metric in METRICS}
+        self.computed_cells = 0  # Сколько ячеек было посчитано за все время
+
+    # Функция пересчета сетки под новые оси; возвращает словарь матриц показателей
+    def update(self, rates, terms):
+        rates = np.asarray(rates, dtype=float)
+        terms = np.asarray(terms, dtype=np.int64)
+        old_rate_index = {rate: i for i, rate in enumerate(self.rates.tolist())}
+        old_term_index = {term: j for j, term in enumerate(self.terms.tolist())}
+        rate_index = np.array([old_rate_index.get(rate, -1) for rate in rates.tolist()], dtype=np.int64)
+        term_index = np.array([old_term_index.get(term, -1) for term in terms.tolist()], dtype=np.int64)
+        known_rates = rate_index >= 0
+        known_terms = term_index >= 0
+
+        values = {metric: np.empty((len(rates), len(terms))) for metric in METRICS}
+        # Уже рассчитанные ячейки переносятся без пересчета
+        for metric in METRICS:
+            values[metric][np.ix_(known_rates, known_terms)] = self.values[metric][
+                np.ix_(rate_index[known_rates], term_index[known_terms])
+            ]
+        # Новые строки (ставки) считаются по всем срокам
+        if (~known_rates).any():
+            self._fill(values, ~known_rates, np.ones(len(terms), dtype=bool), rates, terms)
+        # Новые столбцы (сроки) - только для уже известных ставок
+        if (~known_terms).any() and known_rates.any():
+            self._fill(values, known_rates, ~known_terms, rates, terms)
+
+        self.rates, self.terms, self.values = rates, terms, values
+        return values
+
+    def _fill(self, values, row_mask, column_mask, rates, terms):
+        block = grid_metrics(self.loan_amount, rates[row_mask], terms[column_mask], self.payment_type)
+        for metric in METRICS:
+            values[metric][np.ix_(row_mask, column_mask)] = block[metric]
+        self.computed_cells += int(row_mask.sum() * column_mask.sum())
+
+
+# Функция построения оси ставок вокруг выбранной ставки с шагом ползунка
+def rate_axis(center, step=0.5, count=10, low=0.1, high=50.0):
+    # Округление делает значения одинаковыми при разных центрах, чтобы строки переиспользовались
+    rates = np.round(center + step * np.arange(-count, count + 1), 6)
+    return rates[(rates >= low) & (rates <= high)]
+
+
+# Функция преобразования матрицы показателя в таблицу (строки - ставки, столбцы - сроки)
+def grid_to_dataframe(rates, terms, matrix):
+    import pandas as pd  # pandas нужен только для таблицы, не для расчета
+
+    return pd.DataFrame(
+        np.round(matrix, 2),
+        index=pd.Index([f"{rate:g}%" for rate in rates], name="Ставка"),
+        columns=pd.Index([f"{term} г." for term in terms], name="Срок"),
+    )
@@ -0,0 +1,196 @@
+# Обратные задачи: ставка по желаемому платежу, срок по бюджету и полная стоимость
+# кредита (ПСК) с учетом комиссий.
+#
+# Ставка и ПСК ищутся методом Ньютона с защитой бисекцией: корень всегда внутри
+# отрезка [lo, hi], на концах которого функция разных знаков; если шаг Ньютона
+# выходит за отрезок, берется его середина. Все кредиты пакета решаются одновременно
+# (массивы NumPy), итерации для уже сошедшихся кредитов просто не меняют результат.
+# Срок по бюджету считается по замкнутой формуле.
+from typing import NamedTuple
+
+import numpy as np
+
+from .schedule import ANNUITY, DIFFERENTIATED, calculate_annuity_payment
+
+DEFAULT_TOLERANCE = 1e-10
+DEFAULT_MAX_ITERATIONS = 100
+PERIODS_PER_YEAR = 12  # Базовый период - месяц
+
+
+# Результат решения для пакета кредитов (массивы одинаковой длины)
+class SolverResult(NamedTuple):
+    value: np.ndarray  # Найденное значение (nan, если решения нет)
+    converged: np.ndarray  # Сошлось ли решение
+    iterations: np.ndarray  # Число итераций
+    residual: np.ndarray  # Невязка в найденной точке
+
+
+# Метод Ньютона с защитой бисекцией. func(x) возвращает (значение, производная);
+# f_tol - допустимая невязка (массив или число)
+def _newton_bisect(func, lo, hi, x0, f_tol, max_iter=DEFAULT_MAX_ITERATIONS):
+    f_lo, _ = func(lo)
+    f_hi, _ = func(hi)
+    bracketed = np.sign(f_lo) != np.sign(f_hi)
+    x = np.clip(x0, lo, hi)
+    iterations = np.zeros(x.shape, dtype=np.int64)
+    done = ~bracketed
+
+    # Сходимость: невязка мала или отрезок сжался до точности float
+    def converged(f, lo, hi):
+        return (np.abs(f) <= f_tol) | (hi - lo <= 4 * np.spacing(np.maximum(np.abs(lo), np.abs(hi))))
+
+    for _ in range(max_iter):
+        f, df = func(x)
+        done |= converged(f, lo, hi)
+        if done.all():
+            break
+        iterations += ~done
+        # Сужение отрезка: конец с тем же знаком функции заменяется текущей точкой
+        same_as_lo = np.sign(f) == np.sign(f_lo)
+        lo = np.where(same_as_lo & ~done, x, lo)
+        hi = np.where(~same_as_lo & ~done, x, hi)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            step = x - f / df
+        newton_ok = np.isfinite(step) & (step > lo) & (step < hi)
+        x = np.where(done, x, np.where(newton_ok, step, (lo + hi) / 2))
+    else:
+        # Итерации кончились: точка после последнего шага тоже проверяется на сходимость
+        f, _ = func(x)
+        done |= converged(f, lo, hi)
+    return SolverResult(np.where(bracketed, x, np.nan), bracketed & done, iterations, np.where(bracketed, f, np.nan))
+
+
+# Функция поиска месячной ставки, при которой аннуитетный платеж равен payment
+def solve_rate(loan_amount, payment, loan_term_months, tol=DEFAULT_TOLERANCE, max_iter=DEFAULT_MAX_ITERATIONS):
+    loan_amount, payment, months = np.broadcast_arrays(
+        np.asarray(loan_amount, dtype=float), np.asarray(payment, dtype=float), np.asarray(loan_term_months, dtype=float)
+    )
+
+    def func(rate):
+        annuity_payment = calculate_annuity_payment(loan_amount, rate, months)
+        # dA/dr = P * g * ((g - 1) - r * n / (1 + r)) / (g - 1)^2, g = (1 + r)^n
+        growth_minus_one = np.expm1(months * np.log1p(rate))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            derivative = np.where(
+                rate == 0,
+                loan_amount * (months + 1) / (2 * months),
+                loan_amount * (growth_minus_one + 1) * (growth_minus_one - rate * months / (1 + rate)) / growth_minus_one ** 2,
+            )
+        return annuity_payment - payment, derivative
+
+    # Платеж растет со ставкой: при нулевой ставке он P / n, при ставке A / P - больше A
+    lo = np.zeros(loan_amount.shape)
+    hi = np.maximum(payment / loan_amount, 0) + 1e-12
+    # Начальное приближение из линейной формулы A ~ P / n + P * r * (n + 1) / (2n)
+    x0 = (payment * months / loan_amount - 1) * 2 / (months + 1)
+    return _newton_bisect(func, lo, hi, x0, tol * np.maximum(payment, 1), max_iter)
+
+
+# Функция поиска минимального срока (месяцев), при котором аннуитетный платеж не больше бюджета
+def solve_term(loan_amount, budget, monthly_interest_rate):
+    loan_amount, budget, rate = np.broadcast_arrays(
+        np.asarray(loan_amount, dtype=float), np.asarray(budget, dtype=float), np.asarray(monthly_interest_rate, dtype=float)
+    )
+    # Бюджет должен покрывать хотя бы проценты первого месяца
+    feasible = budget > loan_amount * rate
+    with np.errstate(divide="ignore", invalid="ignore"):
+        exact_months = np.where(rate == 0, loan_amount / budget, -np.log1p(-loan_amount * rate / budget) / np.log1p(rate))
+    months = np.where(feasible, np.ceil(exact_months - 1e-9), np.nan)
+    payment = np.where(feasible, calculate_annuity_payment(loan_amount, rate, np.where(feasible, months, 1)), np.nan)
+    return SolverResult(months, feasible, np.zeros(months.shape, dtype=np.int64), payment - budget)
+
+
+# Функция поиска месячной внутренней ставки доходности потоков: кредит минус разовые
+# комиссии против матрицы ежемесячных платежей (кредиты x месяцы, нули после окончания срока)
+def solve_irr(net_amount, payments, tol=DEFAULT_TOLERANCE, max_iter=DEFAULT_MAX_ITERATIONS):
+    net_amount = np.asarray(net_amount, dtype=float)
+    payments = np.asarray(payments, dtype=float)
+    k = np.arange(1, payments.shape[1] + 1)
+
+    def func(rate):
+        discount = np.exp(-np.log1p(rate)[:, None] * k)  # (1 + i)^-k
+        value = (payments * discount).sum(axis=1) - net_amount
+        derivative = -(payments * discount * k).sum(axis=1) / (1 + rate)
+        return value, derivative
+
+    # Приведенная стоимость убывает со ставкой; корень ищется на (-50%, до 100% в месяц и выше)
+    total = payments.sum(axis=1)
+    lo = np.full(net_amount.shape, -0.5)
+    hi = np.maximum(1.0, total / np.maximum(net_amount, 1e-12))
+    x0 = 2 * (total / np.maximum(net_amount, 1e-12) - 1) / (payments.shape[1] + 1)
+    return _newton_bisect(func, lo, hi, x0, tol * np.maximum(net_amount, 1), max_iter)
+
+
+# Функция поиска месячной внутренней ставки доходности дифференцированных платежей
+# c_k = a - b * (k - 1), k = 1..n, против суммы net_amount. Приведенная стоимость - по
+# замкнутым формулам: sum(v^k) = (1 - v^n) / i и sum(k * v^k) = (1 + i) / i * (sum(v^k) - n * v^(n+1))
+def _solve_linear_irr(net_amount, first_payment, decrement, months, tol=DEFAULT_TOLERANCE,
+                      max_iter=DEFAULT_MAX_ITERATIONS):
+    def present_value(rate):
+        small = np.abs(rate) < 1e-8
+        safe_rate = np.where(small, 1e-8, rate)
+        log_v = -np.log1p(safe_rate)
+        v_n = np.exp(months * log_v)
+        s0 = np.where(small, months, -np.expm1(months * log_v) / safe_rate)
+        s1 = np.where(small, months * (months + 1) / 2, (1 + safe_rate) / safe_rate * (s0 - months * v_n * np.exp(log_v)))
+        return (first_payment + decrement) * s0 - decrement * s1 - net_amount
+
+    def func(rate):
+        step = 1e-7 * (1 + np.abs(rate))
+        value = present_value(rate)
+        return value, (present_value(rate + step) - present_value(rate - step)) / (2 * step)
+
+    total = first_payment * months - decrement * months * (months - 1) / 2
+    lo = np.full(net_amount.shape, -0.5)
+    hi = np.maximum(1.0, total / np.maximum(net_amount, 1e-12))
+    x0 = 2 * (total / np.maximum(net_amount, 1e-12) - 1) / (months + 1)
+    return _newton_bisect(func, lo, hi, x0, tol * np.maximum(net_amount, 1), max_iter)
+
+
+# Результат расчета ПСК для пакета кредитов
+class FullCost(NamedTuple):
+    full_cost_rate: np.ndarray  # ПСК, % годовых: i * 12 * 100
+    effective_rate: np.ndarray  # Эффективная годовая ставка, %: ((1 + i)^12 - 1) * 100
+    monthly_rate: SolverResult  # Месячная ставка i с диагностикой сходимости
+
+
+# Функция расчета полной стоимости кредита (ПСК) по 353-ФЗ для ежемесячных платежей:
+# i - корень уравнения sum(ДП_k / (1 + i)^k) = 0, ПСК = i * 12 * 100.
+# upfront_fee - разовые комиссии при выдаче, monthly_fee - ежемесячные (страховка, обслуживание).
+# Аннуитет с комиссиями - тоже аннуитет, поэтому i находится через solve_rate;
+# дифференцированные платежи убывают линейно, для них приведенная стоимость считается по замкнутой формуле
+def full_cost_of_credit(loan_amount, annual_interest_rate, loan_term_months, payment_type=ANNUITY,
+                        upfront_fee=0.0, monthly_fee=0.0, tol=DEFAULT_TOLERANCE, max_iter=DEFAULT_MAX_ITERATIONS):
+    if not np.isin(np.asarray(payment_type), [ANNUITY, DIFFERENTIATED]).all():
+        raise ValueError(f"Неизвестный тип платежей: {payment_type}")
+    loan_amount, rate, months, is_annuity, upfront_fee, monthly_fee = np.broadcast_arrays(
+        np.asarray(loan_amount, dtype=float),
+        np.asarray(annual_interest_rate, dtype=float) / 100 / 12,
+        np.asarray(loan_term_months, dtype=float),
+        np.asarray(payment_type) == ANNUITY,
+        np.asarray(upfront_fee, dtype=float),
+        np.asarray(monthly_fee, dtype=float),
+    )
+    net_amount = loan_amount - upfront_fee
+
+    def annuity(m):
+        payment = calculate_annuity_payment(loan_amount[m], rate[m], months[m]) + monthly_fee[m]
+        return solve_rate(net_amount[m], payment, months[m], tol, max_iter)
+
+    def differentiated(m):
+        first_payment = loan_amount[m] / months[m] + loan_amount[m] * rate[m] + monthly_fee[m]
+        return _solve_linear_irr(net_amount[m], first_payment, loan_amount[m] * rate[m] / months[m], months[m], tol, max_iter)
+
+    # Каждый тип платежей решается только для своих кредитов
+    shape = loan_amount.shape
+    monthly_rate = SolverResult(np.full(shape, np.nan), np.zeros(shape, dtype=bool), np.zeros(shape, dtype=np.int64),
+                                np.full(shape, np.nan))
+    for mask, solve in [(is_annuity, annuity), (~is_annuity, differentiated)]:
+        if mask.any():
+            for column, values in zip(monthly_rate, solve(mask)):
+                column[mask] = values
+    return FullCost(
+        full_cost_rate=monthly_rate.value * PERIODS_PER_YEAR * 100,
+        effective_rate=np.expm1(PERIODS_PER_YEAR * np.log1p(monthly_rate.value)) * 100,
+        monthly_rate=monthly_rate,
+    )
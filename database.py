@@ -1,15 +1,39 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean
+from sqlalchemy import create_engine, Column, Integer, String, Date, DateTime, LargeBinary, Index, func, insert, inspect, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, deferred, undefer
+import atexit
+import base64
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
 
+import metrics
 
-from sqlalchemy import Column, Integer, String, Float, ForeignKey
+
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Boolean, Text
 from sqlalchemy.orm import relationship
 
 # Модель для хранения расчетов
-# Настройка базы данных SQLite
-DATABASE_URL = "sqlite:///users.db"
-engine = create_engine(DATABASE_URL, echo=True)
+# Настройка базы данных SQLite (путь можно переопределить переменной окружения DATABASE_URL)
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///users.db")
+SQL_ECHO = os.environ.get("SQL_ECHO") == "1"  # Журнал всех SQL-запросов (для отладки)
+# Создание схемы при подключении: "auto" - только если версия схемы базы устарела,
+# "skip" - никогда (схема создается отдельным шагом при развертывании: python database.py init)
+SCHEMA_AUTO = "auto"
+SCHEMA_SKIP = "skip"
+SCHEMA_MODE = os.environ.get("DATABASE_SCHEMA", SCHEMA_AUTO)
+SCHEMA_VERSION = 3  # Увеличивается при изменении моделей; у SQLite хранится в PRAGMA user_version
+# Отложенная запись расчетов (CALCULATION_WRITE_BEHIND=1) включается при первом сохранении расчета
+WRITE_BEHIND = os.environ.get("CALCULATION_WRITE_BEHIND") == "1"
+engine = None  # Создается в configure_database() при первом обращении к базе
+_configure_lock = threading.Lock()
 Base = declarative_base()
 class Calculation(Base):
     __tablename__ = "calculations"
@@ -22,9 +46,20 @@ class Calculation(Base):
     total_payment = Column(Float)  # Общая сумма выплат
     total_interest_paid = Column(Float)  # Переплата по кредиту
     unique_link = Column(String, unique=True)  # Уникальная ссылка на расчет
+    # Полный график платежей в бинарном колоночном формате (см. credit_engine/codec.py).
+    # Загружается только по запросу, чтобы списки расчетов его не читали
+    schedule_blob = deferred(Column(LargeBinary, nullable=True))
+    # Начисление процентов по дням: конвенция, календарь платежей и дата выдачи, по которым
+    # пересчитывается сохраненный график (None - ежемесячное начисление, ставка / 12)
+    day_count = Column(String, nullable=True)
+    payment_calendar = Column(String, nullable=True)
+    start_date = Column(Date, nullable=True)
 
     user = relationship("User", back_populates="calculations")
 
+    # Составной индекс для постраничной истории расчетов пользователя
+    __table_args__ = (Index("ix_calculations_user_id_id", "user_id", "id"),)
+
 
 # Модель пользователя
 class User(Base):
@@ -35,20 +70,136 @@ class User(Base):
 
 # Добавляем связь между User и Calculation
 User.calculations = relationship("Calculation", order_by=Calculation.id, back_populates="user")
-# Модель сессии
-class Session(Base):
-    __tablename__ = "sessions"
+# Модель сессии: у каждого браузера свой токен со сроком действия
+class AuthSession(Base):
+    __tablename__ = "auth_sessions"
     id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True)
-    is_active = Column(Boolean, default=False)
+    token = Column(String, unique=True, index=True, nullable=False)  # Токен сессии браузера
+    username = Column(String, index=True, nullable=False)
+    expires_at = Column(DateTime, index=True, nullable=False)  # Срок действия (UTC)
+
+# Модель сводки по расчетам пользователя: агрегаты по каждому типу платежей.
+# Обновляется в той же транзакции, что и запись расчетов (insert_calculations),
+# поэтому профиль читает несколько строк вместо всех расчетов пользователя
+class UserSummary(Base):
+    __tablename__ = "user_summaries"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    payment_type = Column(String, primary_key=True)
+    calculation_count = Column(Integer, nullable=False, default=0)  # Число расчетов
+    total_loan_amount = Column(Float, nullable=False, default=0.0)  # Сумма кредитов
+    rate_sum = Column(Float, nullable=False, default=0.0)  # Сумма ставок (средняя = rate_sum / calculation_count)
+    total_payment = Column(Float, nullable=False, default=0.0)  # Сумма выплат
+    total_interest_paid = Column(Float, nullable=False, default=0.0)  # Сумма переплат
+
+    @property
+    def average_rate(self):
+        return self.rate_sum / self.calculation_count if self.calculation_count else 0.0
+
+# Агрегаты сводки и колонки расчета, из которых они складываются
+SUMMARY_COLUMNS = {
+    "total_loan_amount": "loan_amount",
+    "rate_sum": "annual_interest_rate",
+    "total_payment": "total_payment",
+    "total_interest_paid": "total_interest_paid",
+}
+
+# Модель фоновой задачи (см. jobs.py): параметры, состояние, прогресс и результат в JSON
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # Вид задачи из jobs.JOB_KINDS
+    params = Column(Text, nullable=False)  # Параметры (JSON)
+    status = Column(String, index=True, nullable=False)  # queued, running, done, failed, cancelled
+    progress = Column(Float, nullable=False, default=0.0)  # Доля выполненной работы, 0..1
+    result = Column(Text, nullable=True)  # Частичный (пока задача выполняется), затем итоговый результат (JSON)
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, nullable=False, default=False)
+    worker_pid = Column(Integer, nullable=True)  # Процесс, выполняющий задачу
+    # Время запуска этого процесса (тики с загрузки ОС, см. jobs.process_start_time): отличает
+    # обработчик от другого процесса, получившего тот же pid после его гибели
+    worker_started = Column(Integer, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+    # Составной индекс для списка задач пользователя (новые сверху)
+    __table_args__ = (Index("ix_jobs_username_id", "username", "id"),)
+
+# Добавление колонок, появившихся после создания таблицы (create_all их не добавляет)
+def add_missing_columns(table_name, columns):
+    existing = {column["name"] for column in inspect(get_engine()).get_columns(table_name)}
+    with get_engine().begin() as connection:
+        for name, ddl_type in columns.items():
+            if name not in existing:
+                connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {name} {ddl_type}"))
+
+# Создание индексов, объявленных после создания таблиц
+def create_missing_indexes():
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=get_engine(), checkfirst=True)
 
-# Создание таблиц
-Base.metadata.create_all(bind=engine)
+# Фабрика сессий: при создании первой сессии процесс подключается к базе (configure_database
+# с параметрами из окружения), поэтому импорт модуля не обращается к базе данных
+class _LazySessionmaker(sessionmaker):
+    def __call__(self, **local_kw):
+        get_engine()
+        return super().__call__(**local_kw)
 
 # Создание сессии
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = _LazySessionmaker(autocommit=False, autoflush=False)
+
+# Движок базы данных; если процесс еще не подключен к базе, подключение по настройкам из окружения
+def get_engine():
+    if engine is None:
+        with _configure_lock:
+            if engine is None:
+                configure_database()
+    return engine
+
+# Версия схемы базы (у SQLite - PRAGMA user_version; для других СУБД версия не хранится)
+def get_schema_version():
+    if get_engine().dialect.name != "sqlite":
+        return None
+    with get_engine().connect() as connection:
+        return connection.exec_driver_sql("PRAGMA user_version").scalar()
+
+# Создание и обновление схемы: таблицы, недостающие колонки и индексы, затем запись версии схемы
+def create_schema():
+    summaries_missing = not inspect(get_engine()).has_table(UserSummary.__tablename__)
+    Base.metadata.create_all(bind=get_engine())
+    add_missing_columns("calculations", {"schedule_blob": "BLOB", "day_count": "VARCHAR", "payment_calendar": "VARCHAR",
+                                         "start_date": "DATE"})
+    add_missing_columns("jobs", {"worker_started": "INTEGER"})
+    create_missing_indexes()
+    # Сводки появились после расчетов: для существующей базы они строятся один раз
+    if summaries_missing:
+        rebuild_user_summaries()
+    if get_engine().dialect.name == "sqlite":
+        with get_engine().begin() as connection:
+            connection.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+# Подключение к базе данных (сводки обновляются upsert в SQLite и PostgreSQL, в других СУБД - UPDATE и INSERT).
+# Вызывается явно или при первом обращении к базе (get_engine). Схема создается или обновляется, только
+# если ее версия в базе устарела (schema="auto"), поэтому подключение делает один запрос к БД, а с schema="skip" - ни одного
+def configure_database(url=DATABASE_URL, echo=SQL_ECHO, schema=SCHEMA_MODE):
+    global engine
+    engine = create_engine(url, echo=echo)
+    SessionLocal.configure(bind=engine)
+    if schema == SCHEMA_AUTO and get_schema_version() != SCHEMA_VERSION:
+        create_schema()
+    # Кэши относятся к предыдущей базе данных
+    _user_id_cache.clear()
+    with _session_cache_lock:
+        _session_cache.clear()
+    clear_link_cache()
+    return engine
+
+logger = logging.getLogger(__name__)
 
 # Функция для регистрации пользователя
+@metrics.timed("db.register_user")
 def register_user(username, password):
     db = SessionLocal()
     user = db.query(User).filter(User.username == username).first()
@@ -62,6 +213,7 @@ def register_user(username, password):
     return True
 
 # Функция для аутентификации пользователя
+@metrics.timed("db.authenticate_user")
 def authenticate_user(username, password):
     db = SessionLocal()
     user = db.query(User).filter(User.username == username).first()
@@ -70,75 +222,582 @@ def authenticate_user(username, password):
         return True
     return False
 
-# Функция для активации сессии
+# Время жизни сессии и время, на которое результат проверки токена кэшируется в процессе
+SESSION_TTL = timedelta(days=7)
+SESSION_CACHE_TTL = 60  # секунд
+SESSION_CACHE_MAX_SIZE = 10000
+
+# Кэш проверенных токенов: token -> (username, expires_at, время проверки)
+_session_cache = {}
+_session_cache_lock = threading.Lock()
+
+# Текущее время UTC без часового пояса (так время хранится в базе)
+def utcnow():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Функция для активации сессии: создает токен для браузера и возвращает его
+@metrics.timed("db.activate_session")
 def activate_session(username):
+    token = secrets.token_urlsafe(32)
     db = SessionLocal()
-    session = db.query(Session).filter(Session.username == username).first()
-    if not session:
-        session = Session(username=username, is_active=True)
-        db.add(session)
-    else:
-        session.is_active = True
+    db.add(AuthSession(token=token, username=username, expires_at=utcnow() + SESSION_TTL))
     db.commit()
     db.close()
+    cleanup_expired_sessions()
+    return token
 
-# Функция для деактивации сессии
-def deactivate_session(username):
+# Функция для деактивации сессии (выход)
+@metrics.timed("db.deactivate_session")
+def deactivate_session(token):
+    if not token:
+        return
+    with _session_cache_lock:
+        _session_cache.pop(token, None)
     db = SessionLocal()
-    session = db.query(Session).filter(Session.username == username).first()
-    if session:
-        session.is_active = False
-        db.commit()
+    db.query(AuthSession).filter(AuthSession.token == token).delete()
+    db.commit()
     db.close()
 
-# Функция для проверки состояния авторизации
-def is_authenticated():
+# Функция для проверки состояния авторизации по токену сессии браузера.
+# Проверенные токены кэшируются, поэтому большинство перезапусков страниц не обращаются к БД
+@metrics.timed("db.is_authenticated")
+def is_authenticated(token):
+    if not token:
+        return False, None
+    now = time.monotonic()
+    with _session_cache_lock:
+        cached = _session_cache.get(token)
+    if cached is None or now - cached[2] > SESSION_CACHE_TTL:
+        metrics.increment("auth.cache_miss")
+        db = SessionLocal()
+        session = db.query(AuthSession.username, AuthSession.expires_at).filter(AuthSession.token == token).first()
+        db.close()
+        if session is None:
+            return False, None
+        cached = (session.username, session.expires_at, now)
+        with _session_cache_lock:
+            if len(_session_cache) >= SESSION_CACHE_MAX_SIZE:
+                _session_cache.clear()
+            _session_cache[token] = cached
+    username, expires_at, _ = cached
+    if expires_at <= utcnow():
+        return False, None
+    return True, username
+
+# Функция для удаления всех истекших сессий одним запросом; возвращает число удаленных
+@metrics.timed("db.cleanup_expired_sessions")
+def cleanup_expired_sessions():
     db = SessionLocal()
-    active_session = db.query(Session).filter(Session.is_active == True).first()
+    deleted = db.query(AuthSession).filter(AuthSession.expires_at <= utcnow()).delete(synchronize_session=False)
+    db.commit()
     db.close()
-    return active_session is not None, getattr(active_session, "username", None)
+    return deleted
 
 import uuid
 
-# Функция для сохранения расчета
-def save_calculation(username, loan_amount, annual_interest_rate, loan_term_years, payment_type, total_payment, total_interest_paid):
+# Кэш id пользователей по имени: пользователи не удаляются, поэтому id не меняется
+_user_id_cache = {}
+
+# Функция получения id пользователя по имени (None, если пользователя нет)
+@metrics.timed("db.get_user_id")
+def get_user_id(username):
+    user_id = _user_id_cache.get(username)
+    if user_id is None:
+        db = SessionLocal()
+        user_id = db.query(User.id).filter(User.username == username).scalar()
+        db.close()
+        if user_id is not None:
+            _user_id_cache[username] = user_id
+    return user_id
+
+def clear_user_id_cache():
+    _user_id_cache.clear()
+
+# Функция INSERT для upsert (ON CONFLICT DO UPDATE) в диалекте базы; None, если диалект его не поддерживает
+def _upsert_insert(dialect_name):
+    if dialect_name == "sqlite":
+        return sqlite_insert
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+
+        return postgresql_insert
+    return None
+
+# Функция обновления сводок пользователей по пачке новых расчетов (в транзакции вызывающего):
+# приращения суммируются по (пользователь, тип платежей) и добавляются одним upsert на строку сводки.
+# В СУБД без ON CONFLICT - UPDATE, а для строк, которых еще нет, INSERT
+def _update_user_summaries(db, records):
+    increments = {}
+    for record in records:
+        key = (record["user_id"], record["payment_type"])
+        row = increments.get(key)
+        if row is None:
+            row = increments[key] = {"user_id": key[0], "payment_type": key[1], "calculation_count": 0,
+                                     **dict.fromkeys(SUMMARY_COLUMNS, 0.0)}
+        row["calculation_count"] += 1
+        for column, source in SUMMARY_COLUMNS.items():
+            row[column] += record[source]
+    columns = UserSummary.__table__.c
+    summed = ["calculation_count", *SUMMARY_COLUMNS]
+    dialect_insert = _upsert_insert(db.get_bind().dialect.name)
+    if dialect_insert is not None:
+        statement = dialect_insert(UserSummary)
+        statement = statement.on_conflict_do_update(
+            index_elements=[columns.user_id, columns.payment_type],
+            set_={column: columns[column] + statement.excluded[column] for column in summed},
+        )
+        db.execute(statement, list(increments.values()))
+        return
+    for row in increments.values():
+        updated = db.execute(
+            update(UserSummary)
+            .where(UserSummary.user_id == row["user_id"], UserSummary.payment_type == row["payment_type"])
+            .values({column: columns[column] + row[column] for column in summed})
+        ).rowcount
+        if not updated:
+            db.execute(insert(UserSummary), [row])
+
+# Функция записи пачки расчетов одной транзакцией (вместе с обновлением сводок)
+@metrics.timed("db.insert_calculations")
+def insert_calculations(records):
     db = SessionLocal()
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
+    try:
+        db.execute(insert(Calculation), records)
+        _update_user_summaries(db, records)
+        db.commit()
+    finally:
         db.close()
+    _invalidate_links([record["unique_link"] for record in records])
+
+# Расчеты, которые отложенная запись так и не смогла сохранить (строка JSON на расчет,
+# график в base64). Возвращаются в базу командой: python database.py replay-failed
+FAILED_CALCULATIONS_PATH = os.environ.get("FAILED_CALCULATIONS_PATH", "failed_calculations.jsonl")
+
+# Функция дописывания расчетов в файл несохраненных расчетов
+def _append_failed_calculations(records, path=None):
+    with open(path or FAILED_CALCULATIONS_PATH, "a", encoding="utf-8") as f:
+        for record in records:
+            blob = record.get("schedule_blob")
+            row = dict(record, schedule_blob=base64.b64encode(blob).decode() if blob is not None else None)
+            if record.get("start_date") is not None:
+                row["start_date"] = record["start_date"].isoformat()
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+# Функция повторной записи расчетов из файла несохраненных расчетов: возвращает число
+# записанных; расчеты, которые снова не записались, остаются в файле
+def replay_failed_calculations(path=None):
+    path = path or FAILED_CALCULATIONS_PATH
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    for record in records:
+        if record.get("schedule_blob") is not None:
+            record["schedule_blob"] = base64.b64decode(record["schedule_blob"])
+        if record.get("start_date") is not None:
+            record["start_date"] = date.fromisoformat(record["start_date"])
+    failed = []
+    for record in records:
+        try:
+            insert_calculations([record])
+        except Exception:
+            logger.exception("Не удалось сохранить расчет %s", record["unique_link"])
+            failed.append(record)
+    os.remove(path)
+    if failed:
+        _append_failed_calculations(failed, path)
+    return len(records) - len(failed)
+
+# Отложенная запись расчетов: сохранения копятся в очереди, фоновый поток
+# записывает их пачками (одна транзакция и один fsync на пачку) по размеру или по времени.
+# Расчет, который не записался, остается доступным по ссылке и повторяется раз в retry_interval
+# секунд; после max_retries неудач (или при остановке) он дописывается в FAILED_CALCULATIONS_PATH
+class WriteBehindWriter:
+    def __init__(self, batch_size=100, flush_interval=0.5, max_queue_size=10000, retry_interval=5.0, max_retries=5,
+                 failed_path=None):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.max_retries = max_retries
+        self.failed_path = failed_path
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._pending = {}  # unique_link -> запись, еще не попавшая в БД
+        # Защищает _pending и вместе с проверкой _stopping - постановку в очередь: после stop()
+        # в очередь уже ничего не попадет, и оставшиеся записи будут записаны
+        self._pending_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._failed = {}  # unique_link -> [запись, число неудачных попыток] (только поток записи)
+        self._last_retry = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="calculation-writer", daemon=True)
+        self._thread.start()
+
+    # Добавление записи в очередь; False, если очередь переполнена или писатель остановлен
+    def submit(self, record):
+        with self._pending_lock:
+            if self._stopping.is_set():
+                return False
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                return False
+            self._pending[record["unique_link"]] = record
+        return True
+
+    # Запись, ожидающая сохранения (чтобы ссылка открывалась сразу после сохранения)
+    def get_pending(self, unique_link):
+        with self._pending_lock:
+            return self._pending.get(unique_link)
+
+    # Ожидание попытки записи всего, что уже поставлено в очередь
+    def flush(self):
+        self._queue.join()
+
+    # Остановка с записью всех оставшихся расчетов; то, что так и не записалось, - в файл
+    def stop(self):
+        with self._pending_lock:
+            self._stopping.set()
+        self._thread.join()
+        # Записи, попавшие в очередь в момент остановки
+        leftover = []
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        if leftover:
+            self._write(leftover)
+        if self._failed:
+            self._retry_failed()
+        if self._failed:
+            self._dead_letter([record for record, _ in self._failed.values()])
+            self._failed.clear()
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            if self._failed and time.monotonic() - self._last_retry >= self.retry_interval:
+                self._retry_failed()
+            try:
+                batch = [self._queue.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0 or (self._stopping.is_set() and self._queue.empty()):
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    # Запись пачки; если пачка не записалась - по одной, чтобы одна ошибка не потеряла остальные.
+    # Возвращает записи, которые не удалось сохранить
+    def _insert(self, batch):
+        try:
+            insert_calculations(batch)
+            return []
+        except Exception:
+            failed = []
+            for record in batch:
+                try:
+                    insert_calculations([record])
+                except Exception:
+                    logger.exception("Не удалось сохранить расчет %s", record["unique_link"])
+                    failed.append(record)
+            return failed
+
+    # Снятие записанных (или отложенных в файл) расчетов из ожидающих
+    def _release(self, records):
+        with self._pending_lock:
+            for record in records:
+                self._pending.pop(record["unique_link"], None)
+
+    def _write(self, batch):
+        failed = self._insert(batch)
+        for record in failed:
+            self._failed[record["unique_link"]] = [record, 1]
+        failed_links = {record["unique_link"] for record in failed}
+        self._release([record for record in batch if record["unique_link"] not in failed_links])
+        for _ in batch:
+            self._queue.task_done()
+
+    # Повторная попытка записи расчетов, которые раньше не записались
+    def _retry_failed(self):
+        self._last_retry = time.monotonic()
+        records = [record for record, _ in self._failed.values()]
+        failed_links = {record["unique_link"] for record in self._insert(records)}
+        exhausted = []
+        for record in records:
+            link = record["unique_link"]
+            if link not in failed_links:
+                del self._failed[link]
+                self._release([record])
+                continue
+            self._failed[link][1] += 1
+            if self._failed[link][1] > self.max_retries:
+                exhausted.append(self._failed.pop(link)[0])
+        if exhausted:
+            self._dead_letter(exhausted)
+
+    # Сохранение расчетов в файл несохраненных расчетов (последнее средство, чтобы не потерять их)
+    def _dead_letter(self, records):
+        logger.error("Расчеты не сохранены в базу и записаны в %s: %d", self.failed_path or FAILED_CALCULATIONS_PATH,
+                     len(records))
+        _append_failed_calculations(records, self.failed_path)
+        self._release(records)
+
+_writer = None
+
+# Включение отложенной записи расчетов
+def start_write_behind(batch_size=100, flush_interval=0.5, max_queue_size=10000, retry_interval=5.0, max_retries=5,
+                       failed_path=None):
+    global _writer
+    if _writer is None:
+        _writer = WriteBehindWriter(batch_size, flush_interval, max_queue_size, retry_interval, max_retries, failed_path)
+        atexit.register(stop_write_behind)
+    return _writer
+
+# Выключение отложенной записи: все расчеты из очереди записываются до возврата
+def stop_write_behind():
+    global _writer
+    writer, _writer = _writer, None
+    if writer is not None:
+        writer.stop()
+
+# Функция для сохранения расчета. При включенной отложенной записи расчет ставится
+# в очередь и ссылка возвращается сразу; иначе (или если очередь полна) - запись сразу.
+# day_count, payment_calendar и start_date задаются для расчетов с начислением процентов по дням
+@metrics.timed("db.save_calculation")
+def save_calculation(username, loan_amount, annual_interest_rate, loan_term_years, payment_type, total_payment, total_interest_paid, schedule_blob=None,
+                     day_count=None, payment_calendar=None, start_date=None):
+    user_id = get_user_id(username)
+    if user_id is None:
         return False
 
     unique_link = str(uuid.uuid4())  # Генерация уникальной ссылки
-    calculation = Calculation(
-        user_id=user.id,
-        loan_amount=loan_amount,
-        annual_interest_rate=annual_interest_rate,
-        loan_term_years=loan_term_years,
-        payment_type=payment_type,
-        total_payment=total_payment,
-        total_interest_paid=total_interest_paid,
-        unique_link=unique_link
-    )
-    db.add(calculation)
-    db.commit()
-    db.refresh(calculation)
-    db.close()
+    record = {
+        "user_id": user_id,
+        "loan_amount": loan_amount,
+        "annual_interest_rate": annual_interest_rate,
+        "loan_term_years": loan_term_years,
+        "payment_type": payment_type,
+        "total_payment": total_payment,
+        "total_interest_paid": total_interest_paid,
+        "unique_link": unique_link,
+        "schedule_blob": schedule_blob,
+        "day_count": day_count,
+        "payment_calendar": payment_calendar,
+        "start_date": start_date,
+    }
+    writer = _writer
+    if writer is None and WRITE_BEHIND:
+        writer = start_write_behind()
+    if writer is None or not writer.submit(record):
+        insert_calculations([record])
     return unique_link
 
+# Колонки, нужные для списка расчетов (без графика платежей)
+CALCULATION_LIST_COLUMNS = (
+    Calculation.id,
+    Calculation.loan_amount,
+    Calculation.annual_interest_rate,
+    Calculation.loan_term_years,
+    Calculation.payment_type,
+    Calculation.total_payment,
+    Calculation.total_interest_paid,
+    Calculation.unique_link,
+)
+
 # Функция для получения всех расчетов пользователя
+@metrics.timed("db.get_user_calculations")
 def get_user_calculations(username):
     db = SessionLocal()
-    user = db.query(User).filter(User.username == username).first()
-    if not user:
+    calculations = (
+        db.query(*CALCULATION_LIST_COLUMNS)
+        .join(User, Calculation.user_id == User.id)
+        .filter(User.username == username)
+        .order_by(Calculation.id)
+        .all()
+    )
+    db.close()
+    return calculations
+
+# Функция для получения страницы истории расчетов, от новых к старым.
+# Постраничность по ключу: следующая страница начинается после before_id
+# (id последнего расчета предыдущей страницы). Возвращает (расчеты, курсор следующей страницы или None)
+@metrics.timed("db.get_user_calculations_page")
+def get_user_calculations_page(username, before_id=None, limit=50):
+    user_id = get_user_id(username)
+    if user_id is None:
+        return [], None
+    db = SessionLocal()
+    query = db.query(*CALCULATION_LIST_COLUMNS).filter(Calculation.user_id == user_id)
+    if before_id is not None:
+        query = query.filter(Calculation.id < before_id)
+    calculations = query.order_by(Calculation.id.desc()).limit(limit + 1).all()
+    db.close()
+    if len(calculations) > limit:
+        return calculations[:limit], calculations[limit - 1].id
+    return calculations, None
+
+# Функция потокового чтения всех расчетов пользователя вместе с графиками (от старых к новым).
+# Расчеты читаются страницами по batch_size (постраничность по ключу), каждая страница -
+# отдельный короткий запрос, поэтому в памяти не больше одной страницы
+def iter_user_calculations(username, batch_size=500):
+    user_id = get_user_id(username)
+    if user_id is None:
+        return
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        calculations = (
+            db.query(*CALCULATION_LIST_COLUMNS, Calculation.schedule_blob)
+            .filter(Calculation.user_id == user_id, Calculation.id > last_id)
+            .order_by(Calculation.id)
+            .limit(batch_size)
+            .all()
+        )
         db.close()
+        yield from calculations
+        if len(calculations) < batch_size:
+            return
+        last_id = calculations[-1].id
+
+# Функция для подсчета числа расчетов пользователя
+@metrics.timed("db.count_user_calculations")
+def count_user_calculations(username):
+    db = SessionLocal()
+    count = (
+        db.query(func.count(Calculation.id))
+        .join(User, Calculation.user_id == User.id)
+        .filter(User.username == username)
+        .scalar()
+    )
+    db.close()
+    return count
+
+# Функция получения сводки по расчетам пользователя: строки UserSummary по типам платежей
+@metrics.timed("db.get_user_summary")
+def get_user_summary(username):
+    user_id = get_user_id(username)
+    if user_id is None:
         return []
-    calculations = user.calculations
+    db = SessionLocal()
+    summary = db.query(UserSummary).filter(UserSummary.user_id == user_id).order_by(UserSummary.payment_type).all()
     db.close()
-    return calculations
+    return summary
 
-# Функция для получения расчета по ссылке
-def get_calculation_by_link(unique_link):
+# Функция полного пересчета сводок по таблице расчетов (восстановление после ручных правок БД).
+# Возвращает число строк сводки
+@metrics.timed("db.rebuild_user_summaries")
+def rebuild_user_summaries():
     db = SessionLocal()
-    calculation = db.query(Calculation).filter(Calculation.unique_link == unique_link).first()
+    try:
+        db.query(UserSummary).delete()
+        aggregates = (
+            select(
+                Calculation.user_id,
+                Calculation.payment_type,
+                func.count(Calculation.id),
+                *(func.sum(getattr(Calculation, source)) for source in SUMMARY_COLUMNS.values()),
+            )
+            .where(Calculation.user_id.is_not(None), Calculation.payment_type.is_not(None))
+            .group_by(Calculation.user_id, Calculation.payment_type)
+        )
+        rows = db.execute(
+            insert(UserSummary).from_select(["user_id", "payment_type", "calculation_count", *SUMMARY_COLUMNS], aggregates)
+        ).rowcount
+        db.commit()
+    finally:
+        db.close()
+    return rows
+
+# Кэш расчетов по ссылкам (LRU со сроком жизни): популярные ссылки открываются без
+# запроса к БД, несуществующие ссылки тоже кэшируются (на более короткий срок),
+# а ссылки не в формате UUID отклоняются без обращения к БД.
+# При записи расчета его ссылка удаляется из кэша
+LINK_CACHE_TTL = 300  # секунд
+LINK_NEGATIVE_CACHE_TTL = 30  # секунд
+LINK_CACHE_MAX_SIZE = 10000
+
+# (unique_link, with_schedule) -> (расчет или None, время истечения)
+_link_cache = OrderedDict()
+_link_cache_lock = threading.Lock()
+_link_cache_generation = 0  # Увеличивается при каждой записи, см. get_calculation_by_link
+
+def clear_link_cache():
+    with _link_cache_lock:
+        _link_cache.clear()
+
+def _invalidate_links(links):
+    global _link_cache_generation
+    with _link_cache_lock:
+        _link_cache_generation += 1
+        for link in links:
+            _link_cache.pop((link, False), None)
+            _link_cache.pop((link, True), None)
+
+# Проверка формата ссылки: ссылки создаются как str(uuid.uuid4())
+def is_valid_link(unique_link):
+    if not isinstance(unique_link, str) or len(unique_link) != 36:
+        return False
+    try:
+        return str(uuid.UUID(unique_link)) == unique_link
+    except ValueError:
+        return False
+
+# Функция для получения расчета по ссылке (with_schedule=True читает и график тем же запросом)
+@metrics.timed("db.get_calculation_by_link")
+def get_calculation_by_link(unique_link, with_schedule=False):
+    if not is_valid_link(unique_link):
+        metrics.increment("link_cache.invalid")
+        return None
+    key = (unique_link, with_schedule)
+    now = time.monotonic()
+    with _link_cache_lock:
+        cached = _link_cache.get(key)
+        if cached is not None and cached[1] > now:
+            _link_cache.move_to_end(key)
+            metrics.increment("link_cache.hit" if cached[0] is not None else "link_cache.negative_hit")
+            return cached[0]
+        generation = _link_cache_generation
+    metrics.increment("link_cache.miss")
+
+    db = SessionLocal()
+    query = db.query(Calculation)
+    if with_schedule:
+        query = query.options(undefer(Calculation.schedule_blob))
+    calculation = query.filter(Calculation.unique_link == unique_link).first()
     db.close()
-    return calculation
\ No newline at end of file
+    if calculation is None and _writer is not None:
+        # Расчет мог быть сохранен только что и еще ждать записи в очереди (такой результат не кэшируется)
+        record = _writer.get_pending(unique_link)
+        if record is not None:
+            return Calculation(**record)
+
+    ttl = LINK_CACHE_TTL if calculation is not None else LINK_NEGATIVE_CACHE_TTL
+    with _link_cache_lock:
+        # Если во время запроса что-то записывалось, результат мог устареть - не кэшируем
+        if generation == _link_cache_generation:
+            _link_cache[key] = (calculation, now + ttl)
+            _link_cache.move_to_end(key)
+            if len(_link_cache) > LINK_CACHE_MAX_SIZE:
+                _link_cache.popitem(last=False)
+    return calculation
+
+# Обслуживание из командной строки:
+#   python database.py init               # создание или обновление схемы (один раз при развертывании)
+#   python database.py rebuild-summaries  # пересчет сводок
+#   python database.py replay-failed      # запись расчетов, не сохраненных отложенной записью
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Обслуживание базы данных")
+    parser.add_argument("command", choices=["init", "rebuild-summaries", "replay-failed"])
+    args = parser.parse_args()
+    configure_database(schema=SCHEMA_SKIP if args.command == "init" else SCHEMA_MODE)
+    if args.command == "init":
+        create_schema()
+        print(f"Версия схемы: {get_schema_version()}")
+    elif args.command == "rebuild-summaries":
+        print(f"Строк сводки: {rebuild_user_summaries()}")
+    elif args.command == "replay-failed":
+        print(f"Записано расчетов: {replay_failed_calculations()}")
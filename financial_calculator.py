@@ -3,6 +3,12 @@ import streamlit as st
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
+from credit_engine import (
+    calculate_annuity_payment,
+    calculate_compound_interest,
+    calculate_differentiated_payment,
+    calculate_simple_interest,
+)
 
 # Настройка страницы
 st.set_page_config(page_title="Кредитный калькулятор", layout="wide")
@@ -20,36 +26,6 @@ interest_type = st.sidebar.selectbox("Тип процентов", ["Просто
 monthly_interest_rate = annual_interest_rate / 100 / 12
 loan_term_months = loan_term_years * 12
 
-# Функция расчета аннуитетного платежа
-def calculate_annuity_payment(loan_amount, monthly_interest_rate, loan_term_months):
-    if monthly_interest_rate == 0:
-        return loan_amount / loan_term_months
-    annuity_payment = loan_amount * (monthly_interest_rate * (1 + monthly_interest_rate) ** loan_term_months) / ((1 + monthly_interest_rate) ** loan_term_months - 1)
-    return annuity_payment
-
-# Функция расчета дифференцированного платежа
-def calculate_differentiated_payment(loan_amount, monthly_interest_rate, loan_term_months):
-    principal_payment = loan_amount / loan_term_months
-    payments = []
-    remaining_loan = loan_amount
-    for month in range(1, loan_term_months + 1):
-        interest_payment = remaining_loan * monthly_interest_rate
-        total_payment = principal_payment + interest_payment
-        payments.append(total_payment)
-        remaining_loan -= principal_payment
-    return payments
-
-# Функция расчета простого процента
-def calculate_simple_interest(loan_amount, annual_interest_rate, loan_term_years):
-    total_interest = loan_amount * (annual_interest_rate / 100) * loan_term_years
-    total_payment = loan_amount + total_interest
-    return total_payment
-
-# Функция расчета сложного процента
-def calculate_compound_interest(loan_amount, annual_interest_rate, loan_term_years):
-    total_payment = loan_amount * (1 + annual_interest_rate / 100) ** loan_term_years
-    return total_payment
-
 # Основной расчет
 if payment_type == "Аннуитетный":
     monthly_payment = calculate_annuity_payment(loan_amount, monthly_interest_rate, loan_term_months)
@@ -57,7 +33,7 @@ if payment_type == "Аннуитетный":
     payments = [monthly_payment] * loan_term_months
 else:  # Дифференцированный
     payments = calculate_differentiated_payment(loan_amount, monthly_interest_rate, loan_term_months)
-    total_payment = sum(payments)
+    total_payment = payments.sum()
 
 if interest_type == "Простой":
     total_payment_simple = calculate_simple_interest(loan_amount, annual_interest_rate, loan_term_years)
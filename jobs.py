@@ -0,0 +1,441 @@
+# Фоновые задачи: долгие пакетные расчеты и моделирование плавающей ставки выполняются
+# вне потока страницы Streamlit, в отдельных процессах-обработчиках.
+#
+# Очередь хранится в таблице jobs той же базы SQLite (модель database.Job):
+# - страница ставит задачу в очередь (submit_job) и опрашивает ее состояние (get_job, list_jobs);
+# - обработчик забирает задачу атомарным UPDATE ... WHERE status = 'queued', выполняет ее
+#   и после каждого блока работы пишет в таблицу прогресс и частичный результат;
+# - отмена кооперативная: cancel_job ставит флаг, и задача останавливается на ближайшем
+#   отчете о прогрессе (поставленная в очередь задача отменяется сразу).
+#
+# Задача погибшего обработчика (сбой, нехватка памяти, перезапуск сервера) помечается как
+# прерванная: при запуске пула - по pid, которого больше нет (или который занял другой процесс:
+# вместе с pid хранится время запуска процесса), во время работы - при проверке пула
+# (start_job_workers на каждом перезапуске страницы), которая заодно заменяет процесс.
+#
+# Обработчики запускаются методом spawn: пул создается внутри многопоточного сервера Streamlit,
+# и fork унаследовал бы соединения SQLAlchemy и захваченные другими потоками блокировки.
+# Обработчику нужен только адрес базы: импорт database в новом процессе к базе не подключается
+# (подключение ленивое), и worker_loop подключается по адресу базы родителя без создания схемы.
+#
+# Обработчики запускаются вместе с приложением (start_job_workers, число процессов -
+# переменная окружения JOB_WORKERS, 0 - не запускать) или отдельно: python jobs.py --workers 2
+import argparse
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+from sqlalchemy import update
+
+import database
+import metrics
+from database import Job, SessionLocal, utcnow
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+JOBS_DIR = os.environ.get("JOBS_DIR", "jobs_data")  # Входные и выходные файлы задач
+POLL_INTERVAL = 0.5  # секунд между проверками очереди
+PROGRESS_INTERVAL = 0.5  # секунд между записями прогресса в БД (последний отчет пишется всегда)
+FLOATING_MAX_PATH_PERIODS = 200_000_000  # Предел траекторий x периодов пересмотра для задачи плавающей ставки
+
+logger = logging.getLogger(__name__)
+
+# Виды задач: имя -> функция(params, report), возвращающая итоговый результат.
+# report(progress, partial) пишет прогресс и частичный результат и выбрасывает
+# JobCancelled, если задачу попросили отменить
+JOB_KINDS = {}
+
+
+# Задача остановлена по запросу отмены
+class JobCancelled(Exception):
+    pass
+
+
+# Декоратор регистрации вида задачи
+def job_kind(name):
+    def decorator(func):
+        JOB_KINDS[name] = func
+        return func
+    return decorator
+
+
+# Функция сериализации результатов (массивы NumPy - в списки)
+def _to_json(value):
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise TypeError(f"Значение типа {type(obj).__name__} не сериализуется в JSON")
+    return json.dumps(value, default=default)
+
+
+# Функция постановки задачи в очередь: возвращает id задачи
+@metrics.timed("jobs.submit_job")
+def submit_job(username, kind, params):
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Неизвестный вид задачи: {kind}")
+    db = SessionLocal()
+    try:
+        job = Job(username=username, kind=kind, params=_to_json(params), status=QUEUED, progress=0.0,
+                  cancel_requested=False, created_at=utcnow())
+        db.add(job)
+        db.commit()
+        return job.id
+    finally:
+        db.close()
+
+
+# Функция получения задачи по id (None, если задачи нет)
+@metrics.timed("jobs.get_job")
+def get_job(job_id):
+    db = SessionLocal()
+    try:
+        return db.get(Job, job_id)
+    finally:
+        db.close()
+
+
+# Функция получения последних задач пользователя (новые сверху)
+@metrics.timed("jobs.list_jobs")
+def list_jobs(username, limit=20):
+    db = SessionLocal()
+    try:
+        return db.query(Job).filter(Job.username == username).order_by(Job.id.desc()).limit(limit).all()
+    finally:
+        db.close()
+
+
+# Функция отмены задачи: задача в очереди отменяется сразу, выполняющаяся - на ближайшем
+# отчете о прогрессе. username ограничивает отмену задачами пользователя. True, если задача была активна
+@metrics.timed("jobs.cancel_job")
+def cancel_job(job_id, username=None):
+    db = SessionLocal()
+    try:
+        query = db.query(Job).filter(Job.id == job_id)
+        if username is not None:
+            query = query.filter(Job.username == username)
+        cancelled = query.filter(Job.status == QUEUED).update(
+            {Job.status: CANCELLED, Job.finished_at: utcnow()}, synchronize_session=False
+        )
+        requested = query.filter(Job.status == RUNNING).update({Job.cancel_requested: True}, synchronize_session=False)
+        db.commit()
+        return bool(cancelled or requested)
+    finally:
+        db.close()
+
+
+# Функция захвата следующей задачи из очереди (None, если очередь пуста).
+# UPDATE с условием на статус гарантирует, что задачу заберет только один обработчик
+@metrics.timed("jobs.claim_next_job")
+def claim_next_job():
+    db = SessionLocal()
+    try:
+        while True:
+            job_id = db.query(Job.id).filter(Job.status == QUEUED).order_by(Job.id).limit(1).scalar()
+            if job_id is None:
+                return None
+            claimed = db.execute(
+                update(Job)
+                .where(Job.id == job_id, Job.status == QUEUED)
+                .values(status=RUNNING, started_at=utcnow(), worker_pid=os.getpid(),
+                        worker_started=process_start_time(os.getpid()))
+            ).rowcount
+            db.commit()
+            if claimed:
+                return db.get(Job, job_id)
+    finally:
+        db.close()
+
+
+# Функция записи прогресса и частичного результата; выбрасывает JobCancelled, если запрошена отмена
+def report_progress(job_id, progress, partial=None):
+    db = SessionLocal()
+    try:
+        values = {"progress": min(max(float(progress), 0.0), 1.0)}
+        if partial is not None:
+            values["result"] = _to_json(partial)
+        db.execute(update(Job).where(Job.id == job_id).values(**values))
+        cancel_requested = db.query(Job.cancel_requested).filter(Job.id == job_id).scalar()
+        db.commit()
+    finally:
+        db.close()
+    if cancel_requested:
+        raise JobCancelled()
+
+
+# Функция завершения задачи: итоговое состояние и результат (None - оставить частичный)
+def finish_job(job_id, status, result=None, error=None):
+    values = {"status": status, "finished_at": utcnow(), "error": error}
+    if status == DONE:
+        values["progress"] = 1.0
+    if result is not None:
+        values["result"] = _to_json(result)
+    db = SessionLocal()
+    try:
+        db.execute(update(Job).where(Job.id == job_id).values(**values))
+        db.commit()
+    finally:
+        db.close()
+
+
+# Функция выполнения захваченной задачи. Отчеты о прогрессе чаще PROGRESS_INTERVAL
+# не пишутся в БД (кроме отчета о завершении), но флаг отмены проверяется при каждой записи.
+# partial может быть функцией без аргументов: тогда частичный результат строится, только
+# если отчет действительно пишется
+def run_job(job):
+    last_report = float("-inf")
+
+    def report(progress, partial=None):
+        nonlocal last_report
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL or progress >= 1:
+            last_report = now
+            report_progress(job.id, progress, partial() if callable(partial) else partial)
+
+    try:
+        with metrics.span(f"jobs.run.{job.kind}"):
+            result = JOB_KINDS[job.kind](json.loads(job.params), report)
+    except JobCancelled:
+        finish_job(job.id, CANCELLED)
+        return CANCELLED
+    except Exception as e:
+        logger.exception("Задача %s завершилась с ошибкой", job.id)
+        finish_job(job.id, FAILED, error=f"{type(e).__name__}: {e}")
+        return FAILED
+    finish_job(job.id, DONE, result)
+    return DONE
+
+
+# Функция выполнения одной задачи из очереди в текущем процессе; возвращает id задачи или None
+def run_next_job():
+    job = claim_next_job()
+    if job is None:
+        return None
+    run_job(job)
+    return job.id
+
+
+# Цикл процесса-обработчика: забирает задачи из очереди, пока не установлено событие остановки
+def worker_loop(database_url, stop_event, poll_interval=POLL_INTERVAL):
+    database.configure_database(database_url, schema=database.SCHEMA_SKIP)  # Схему создал родительский процесс
+    while not stop_event.is_set():
+        if run_next_job() is None:
+            stop_event.wait(poll_interval)
+
+
+# Пул процессов-обработчиков
+class JobWorkerPool:
+    def __init__(self, workers=1, database_url=None, poll_interval=POLL_INTERVAL):
+        self._database_url = database_url or database.get_engine().url.render_as_string(hide_password=False)
+        self._poll_interval = poll_interval
+        self._context = multiprocessing.get_context("spawn")
+        self._stop_event = self._context.Event()
+        # Задачи обработчиков, погибших до запуска пула (сбой, перезапуск сервера), не завершатся сами
+        fail_orphaned_jobs()
+        self.processes = [self._start_worker(i) for i in range(workers)]
+
+    def _start_worker(self, i):
+        process = self._context.Process(target=worker_loop,
+                                        args=(self._database_url, self._stop_event, self._poll_interval),
+                                        name=f"job-worker-{i}", daemon=True)
+        process.start()
+        return process
+
+    # Проверка обработчиков: задачи завершившихся процессов (например, убитых из-за нехватки
+    # памяти) помечаются как прерванные, а на место процессов запускаются новые
+    def check(self):
+        if self._stop_event.is_set():
+            return
+        dead = [i for i, process in enumerate(self.processes) if not process.is_alive()]
+        if dead:
+            fail_interrupted_jobs([self.processes[i].pid for i in dead])
+            for i in dead:
+                self.processes[i].join()
+                self.processes[i] = self._start_worker(i)
+
+    # Остановка: обработчики доделывают текущие задачи; не успевшие за timeout
+    # завершаются принудительно, а их задачи помечаются как прерванные
+    def stop(self, timeout=10):
+        self._stop_event.set()
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            process.join(max(deadline - time.monotonic(), 0))
+        killed = [process.pid for process in self.processes if process.is_alive()]
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        if killed:
+            fail_interrupted_jobs(killed)
+
+
+# Функция пометки задач остановленных обработчиков как прерванных
+def fail_interrupted_jobs(worker_pids):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(Job)
+            .where(Job.status == RUNNING, Job.worker_pid.in_(worker_pids))
+            .values(status=FAILED, error="Обработчик остановлен", finished_at=utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+# Функция пометки как прерванных выполняющихся задач, процесса-обработчика которых уже нет;
+# возвращает id этих задач
+def fail_orphaned_jobs():
+    db = SessionLocal()
+    try:
+        running = db.query(Job.id, Job.worker_pid, Job.worker_started).filter(Job.status == RUNNING).all()
+        orphaned = [job_id for job_id, pid, started in running if not _worker_alive(pid, started)]
+        if orphaned:
+            db.execute(
+                update(Job)
+                .where(Job.status == RUNNING, Job.id.in_(orphaned))
+                .values(status=FAILED, error="Обработчик остановлен", finished_at=utcnow())
+            )
+            db.commit()
+    finally:
+        db.close()
+    return orphaned
+
+
+# Функция времени запуска процесса в тиках с загрузки ОС (поле starttime из /proc/<pid>/stat).
+# None, если процесса нет или ОС не дает этих сведений (тогда процесс узнается только по pid)
+def process_start_time(pid):
+    try:
+        with open(f"/proc/{pid}/stat", encoding="ascii", errors="replace") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # Имя процесса в скобках может содержать пробелы: поля считаются после последней скобки
+    return int(stat.rsplit(")", 1)[1].split()[19])
+
+
+# Функция проверки, что обработчик жив: процесс с данным pid существует (база SQLite - всегда
+# на этом же хосте) и, если время запуска известно, это тот же процесс, а не новый с тем же pid
+def _worker_alive(pid, started=None):
+    if not _process_alive(pid):
+        return False
+    if started is None:
+        return True
+    current = process_start_time(pid)
+    return current is None or current == started
+
+
+# Функция проверки, что процесс с данным pid существует
+def _process_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_pool = None
+
+# Запуск обработчиков задач в фоне (повторный вызов проверяет и возвращает уже запущенный пул)
+def start_job_workers(workers=None):
+    global _pool
+    workers = int(os.environ.get("JOB_WORKERS", 1)) if workers is None else workers
+    if _pool is not None:
+        _pool.check()
+    elif workers > 0:
+        _pool = JobWorkerPool(workers)
+        atexit.register(stop_job_workers)
+    return _pool
+
+
+# Остановка обработчиков задач
+def stop_job_workers():
+    global _pool
+    pool, _pool = _pool, None
+    if pool is not None:
+        pool.stop()
+
+
+# Путь к файлу задачи в JOBS_DIR
+def job_file(name):
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    return os.path.join(JOBS_DIR, name)
+
+
+# Функция объема моделирования плавающей ставки: число траекторий x число периодов пересмотра
+def floating_path_periods(n_paths, loan_term_months, reset_months):
+    return n_paths * -(-loan_term_months // reset_months)
+
+
+# Моделирование кредита с плавающей ставкой: частичный результат - перцентили
+# по уже рассчитанным траекториям
+@job_kind("floating")
+def floating_job(params, report):
+    from credit_engine.floating import RateModel, simulate_floating_rate
+
+    n_paths = params["n_paths"]
+    path_periods = floating_path_periods(n_paths, params["loan_term_months"], params.get("reset_months", 3))
+    if path_periods > FLOATING_MAX_PATH_PERIODS:
+        raise ValueError(f"Слишком большой расчет: {path_periods} траекторий-периодов "
+                         f"(не более {FLOATING_MAX_PATH_PERIODS})")
+    result = simulate_floating_rate(
+        params["loan_amount"], params["loan_term_months"], params["margin"], RateModel(**params["model"]), n_paths,
+        params.get("reset_months", 3), seed=params.get("seed"), workers=params.get("workers", 1),
+        progress=lambda done, summarize: report(done / n_paths, lambda: summarize()._asdict()),
+    )
+    return result._asdict()
+
+
+# Пакетный расчет портфеля из файла: частичный результат - число обработанных кредитов
+# и суммы по ним; итоги по каждому кредиту пишутся в totals_path
+@job_kind("portfolio")
+def portfolio_job(params, report):
+    from credit_engine.batch import DEFAULT_CHUNK_SIZE, count_loans, run_portfolio
+
+    total = count_loans(params["input_path"])
+    summary = {"processed": 0, "total": total, "loan_amount": 0.0, "total_payment": 0.0, "total_interest_paid": 0.0}
+
+    def progress(processed, totals):
+        summary["processed"] = processed
+        summary["total_payment"] += float(totals["total_payment"].sum())
+        summary["total_interest_paid"] += float(totals["total_interest_paid"].sum())
+        summary["loan_amount"] = summary["total_payment"] - summary["total_interest_paid"]
+        report(processed / total if total else 1.0, summary)
+
+    run_portfolio(params["input_path"], params["totals_path"], chunk_size=params.get("chunk_size", DEFAULT_CHUNK_SIZE),
+                  workers=params.get("workers", 1), exact=params.get("exact", False), progress=progress)
+    return {**summary, "totals_path": params["totals_path"]}
+
+
+# Запуск обработчиков отдельно от приложения: python jobs.py --workers 2
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обработчики фоновых задач")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+    pool = JobWorkerPool(args.workers)
+    try:
+        while True:
+            pool.check()
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()
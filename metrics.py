@@ -0,0 +1,231 @@
+# Легкая инструментовка: интервалы времени (spans) и счетчики на каждый перезапуск
+# страницы и каждый вызов функций базы данных.
+#
+# Включается переменной окружения METRICS_ENABLED=1 (или enable()). В выключенном
+# состоянии span() возвращает один и тот же пустой контекст, а timed() - сразу вызывает функцию.
+# Вывод:
+# - METRICS_JSONL (по умолчанию metrics.jsonl) - строка JSON на каждый перезапуск страницы;
+# - METRICS_PROM_FILE - файл в текстовом формате Prometheus (обновляется не чаще раза в 10 секунд);
+# - METRICS_PORT - HTTP-эндпоинт /metrics в формате Prometheus.
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_enabled = os.environ.get("METRICS_ENABLED") == "1"
+JSONL_PATH = os.environ.get("METRICS_JSONL", "metrics.jsonl")
+PROM_FILE = os.environ.get("METRICS_PROM_FILE")
+PROM_FILE_INTERVAL = 10  # секунд
+
+_NULL_CONTEXT = contextlib.nullcontext()
+_local = threading.local()  # Текущий перезапуск страницы (каждый перезапуск Streamlit - в своем потоке)
+_lock = threading.Lock()
+_span_totals = {}  # имя -> [число, сумма секунд, максимум секунд]
+_counters = {}  # имя -> значение
+_last_prom_write = 0.0
+
+
+def is_enabled():
+    return _enabled
+
+
+def enable(jsonl_path=None):
+    global _enabled, JSONL_PATH
+    _enabled = True
+    if jsonl_path is not None:
+        JSONL_PATH = jsonl_path
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def reset():
+    with _lock:
+        _span_totals.clear()
+        _counters.clear()
+
+
+def _record_span(name, start, duration):
+    with _lock:
+        totals = _span_totals.setdefault(name, [0, 0.0, 0.0])
+        totals[0] += 1
+        totals[1] += duration
+        totals[2] = max(totals[2], duration)
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace["spans"].append({"name": name, "start": round(start - trace["start"], 6), "duration": round(duration, 6)})
+
+
+class _Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        _record_span(self.name, self.start, time.perf_counter() - self.start)
+        return False
+
+
+# Контекст для замера участка кода: with metrics.span("render.table"): ...
+def span(name):
+    if not _enabled:
+        return _NULL_CONTEXT
+    return _Span(name)
+
+
+# Декоратор для замера каждого вызова функции
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with _Span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Увеличение счетчика (например, попаданий в кэш)
+def increment(name, value=1):
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace["counters"][name] = trace["counters"].get(name, 0) + value
+
+
+# Начало перезапуска страницы
+def start_rerun(page):
+    if not _enabled:
+        return
+    _local.trace = {
+        "page": page,
+        "rerun_id": uuid.uuid4().hex,
+        "ts": time.time(),
+        "start": time.perf_counter(),
+        "spans": [],
+        "counters": {},
+    }
+
+
+# Завершение перезапуска страницы: запись строки в JSONL и обновление файла Prometheus
+def finish_rerun(status="ok"):
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return
+    _local.trace = None
+    duration = time.perf_counter() - trace.pop("start")
+    _record_span(f"rerun.{trace['page']}", 0.0, duration)
+    trace.update(status=status, duration=round(duration, 6))
+    line = json.dumps(trace, ensure_ascii=False)
+    with _lock:
+        with open(JSONL_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    _maybe_write_prometheus_file()
+
+
+# Контекст перезапуска страницы: with metrics.rerun("calculator"): <тело страницы>.
+# Streamlit выполняет каждый перезапуск в новом потоке, поэтому перезапуск закрывается здесь же:
+# st.stop(), st.rerun() и st.switch_page() прерывают скрипт исключением, не наследующим
+# Exception (статус stopped), остальные исключения дают статус error
+@contextlib.contextmanager
+def rerun(page):
+    start_rerun(page)
+    status = "error"
+    try:
+        yield
+        status = "ok"
+    except Exception:
+        raise
+    except BaseException:
+        status = "stopped"
+        raise
+    finally:
+        finish_rerun(status=status)
+
+
+def _metric_name(name):
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+# Текущие значения в текстовом формате Prometheus
+def prometheus_text():
+    lines = []
+    with _lock:
+        if _span_totals:
+            spans = sorted(_span_totals.items())
+            lines.append("# TYPE credit_span_seconds summary")
+            for name, (count, total, _) in spans:
+                label = f'{{span="{name}"}}'
+                lines.append(f"credit_span_seconds_count{label} {count}")
+                lines.append(f"credit_span_seconds_sum{label} {total:.6f}")
+            # В summary допустимы только _count, _sum и квантили, поэтому максимум - отдельная метрика gauge
+            lines.append("# TYPE credit_span_max_seconds gauge")
+            for name, (_, _, maximum) in spans:
+                lines.append(f'credit_span_max_seconds{{span="{name}"}} {maximum:.6f}')
+        for name, value in sorted(_counters.items()):
+            metric = f"credit_{_metric_name(name)}_total"
+            lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(path):
+    # Запись через временный файл, чтобы сборщик не прочитал файл наполовину
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(prometheus_text())
+    os.replace(tmp_path, path)
+
+
+def _maybe_write_prometheus_file():
+    global _last_prom_write
+    if PROM_FILE and time.monotonic() - _last_prom_write >= PROM_FILE_INTERVAL:
+        _last_prom_write = time.monotonic()
+        write_prometheus_file(PROM_FILE)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = prometheus_text().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+
+
+# Запуск HTTP-эндпоинта /metrics в фоновом потоке (один на процесс)
+def start_http_server(port):
+    global _server
+    if _server is None:
+        _server = ThreadingHTTPServer(("", port), _MetricsHandler)
+        threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    return _server
+
+
+if _enabled and os.environ.get("METRICS_PORT"):
+    start_http_server(int(os.environ["METRICS_PORT"]))
@@ -1,180 +1,268 @@
-import streamlit as st
+import datetime
+
 import numpy as np
-import matplotlib.pyplot as plt
-import pandas as pd
-from database import is_authenticated
+import streamlit as st
+import metrics
+import auth
 from database import save_calculation
+from charts import heatmap_spec, show_chart
+from tables import show_table_page
+from credit_engine import ANNUITY, PAYMENT_TYPES, REDUCE_PAYMENT, REDUCE_TERM, Prepayment, PrepaymentSchedule, build_schedule
+from credit_engine import CALENDAR_TITLES, CALENDARS, DAY_COUNT_CONVENTIONS, daily_schedule, payment_calendar
+from credit_engine import encode_schedule, exact_schedule, schedule_cache, schedule_from_kopecks, schedule_to_arrow
+from credit_engine.export import available_export_formats, export_bytes, export_schedule
+from credit_engine.floating import RateModel, simulate_floating_rate
+from credit_engine.solvers import full_cost_of_credit, solve_rate, solve_term
+from credit_engine.sensitivity import METRICS, METRIC_TITLES, SensitivityGrid, grid_to_dataframe, rate_axis
 
 # Настройка страницы (должна быть первой командой)
 st.set_page_config(page_title="Кредитный калькулятор", layout="wide")
+with metrics.rerun("calculator"):
+    # Проверка аутентификации
+    authenticated, username = auth.current_user()
+    if not authenticated:
+        st.warning("Вы не авторизованы. Пожалуйста, войдите.")
+        st.stop()
 
-# Проверка аутентификации
-authenticated, username = is_authenticated()
-if not authenticated:
-    st.warning("Вы не авторизованы. Пожалуйста, войдите.")
-    st.stop()
-
-# Ввод данных пользователем
-st.title("Кредитный калькулятор")
-st.sidebar.header("Параметры кредита")
-loan_amount = st.sidebar.number_input("Сумма кредита", min_value=1000, value=1000000)
-annual_interest_rate = st.sidebar.slider(
-    "Годовая процентная ставка (%)",
-    min_value=0.1,
-    max_value=50.0,
-    value=10.0,
-    step=0.5
-)
-loan_term_years = st.sidebar.number_input("Срок кредита (в годах)", min_value=1, value=5)
-payment_type = st.sidebar.selectbox("Тип платежей", ["Аннуитетный", "Дифференцированный"])
-interest_type = st.sidebar.selectbox("Тип процентов", ["Простой", "Сложный"])
-
-# Преобразование годовой ставки в месячную
-monthly_interest_rate = annual_interest_rate / 100 / 12
-loan_term_months = loan_term_years * 12
-
-# Функция расчета аннуитетного платежа
-def calculate_annuity_payment(loan_amount, monthly_interest_rate, loan_term_months):
-    if monthly_interest_rate == 0:
-        return loan_amount / loan_term_months
-    annuity_payment = loan_amount * (monthly_interest_rate * (1 + monthly_interest_rate) ** loan_term_months) / ((1 + monthly_interest_rate) ** loan_term_months - 1)
-    return annuity_payment
-
-# Функция расчета дифференцированного платежа
-def calculate_differentiated_payment(loan_amount, monthly_interest_rate, loan_term_months):
-    # Расчет основного долга за месяц
-    principal_payment = loan_amount / loan_term_months
-    payments = []
-    remaining_loan = loan_amount
-
-    for month in range(1, loan_term_months + 1):
-        # Расчет процентов за текущий месяц
-        interest_payment = remaining_loan * monthly_interest_rate
-        # Общий платеж за месяц
-        total_payment = principal_payment + interest_payment
-        # Добавляем платеж в список
-        payments.append(total_payment)
-        # Уменьшаем остаток кредита
-        remaining_loan -= principal_payment
-
-    return payments
-
-# Основной расчет
-if payment_type == "Аннуитетный":
-    monthly_payment = calculate_annuity_payment(loan_amount, monthly_interest_rate, loan_term_months)
-    total_payment = monthly_payment * loan_term_months
-    payments = [monthly_payment] * loan_term_months
-else:  # Дифференцированный
-    payments = calculate_differentiated_payment(loan_amount, monthly_interest_rate, loan_term_months)
-    total_payment = sum(payments)
-
-# Расчет переплаты
-total_interest_paid = total_payment - loan_amount
-
-# Создание таблицы с детализацией выплат
-months = np.arange(1, loan_term_months + 1)
-remaining_loan = loan_amount
-table_data = []
-
-for month in range(1, loan_term_months + 1):
-    if payment_type == "Аннуитетный":
-        interest_payment = remaining_loan * monthly_interest_rate
-        principal_payment = monthly_payment - interest_payment
-    else:  # Дифференцированный
-        principal_payment = loan_amount / loan_term_months
-        interest_payment = remaining_loan * monthly_interest_rate
-    
-    # Обновление остатка долга
-    remaining_loan -= principal_payment
-    table_data.append({
-        "Месяц": month,
-        "Платеж": round(monthly_payment, 2) if payment_type == "Аннуитетный" else round(payments[month - 1], 2),
-        "Остаток долга": round(max(remaining_loan, 0), 2),  # Защита от отрицательных значений
-        "Проценты": round(interest_payment, 2),
-        "Тело кредита": round(principal_payment, 2)
-    })
-
-# Преобразование данных в DataFrame
-df = pd.DataFrame(table_data)
-
-
-# Отображение результатов
-st.write(f"Ежемесячный платеж: {monthly_payment:.2f}" if payment_type == "Аннуитетный" else "Ежемесячные платежи различаются.")
-st.write(f"Общая сумма выплат: {total_payment:.2f}")
-st.write(f"Переплата по кредиту: {total_interest_paid:.2f}")
-
-# Кнопка для сохранения расчета
-if st.button("Сохранить расчет"):
-    unique_link = save_calculation(
-        username=st.session_state.username,
-        loan_amount=loan_amount,
-        annual_interest_rate=annual_interest_rate,
-        loan_term_years=loan_term_years,
-        payment_type=payment_type,
-        total_payment=total_payment,
-        total_interest_paid=total_interest_paid
+    # Ввод данных пользователем
+    st.title("Кредитный калькулятор")
+    st.sidebar.header("Параметры кредита")
+    loan_amount = st.sidebar.number_input("Сумма кредита", min_value=1000, value=1000000)
+    annual_interest_rate = st.sidebar.slider(
+        "Годовая процентная ставка (%)",
+        min_value=0.1,
+        max_value=50.0,
+        value=10.0,
+        step=0.5
     )
-    if unique_link:
-        st.success(f"Расчет сохранен! Поделитесь ссылкой: {unique_link}")
+    loan_term_years = st.sidebar.number_input("Срок кредита (в годах)", min_value=1, value=5)
+    payment_type = st.sidebar.selectbox("Тип платежей", PAYMENT_TYPES)
+    interest_type = st.sidebar.selectbox("Тип процентов", ["Простой", "Сложный"])
+    # Начисление процентов: ставка / 12 каждый месяц или по фактическим дням с датами платежей по календарю
+    MONTHLY_ACCRUAL = "Ежемесячно (ставка / 12)"
+    accrual = st.sidebar.selectbox("Начисление процентов", [MONTHLY_ACCRUAL] + DAY_COUNT_CONVENTIONS)
+    daily = accrual != MONTHLY_ACCRUAL
+    if daily:
+        start_date = st.sidebar.date_input("Дата выдачи", value=datetime.date.today())
+        payment_calendar_name = st.sidebar.selectbox("Календарь платежей", CALENDARS, index=2, format_func=CALENDAR_TITLES.get)
     else:
-        st.error("Не удалось сохранить расчет.")
-
-
-# Круговая диаграмма (уменьшенный размер и шрифт)
-labels = ["Основной долг", "Проценты"]
-sizes = [loan_amount, total_interest_paid]
-colors = ["#4682B4", "#FFA07A"]  # Синий и оранжевый
-explode = (0.1, 0)  # Выделение первого сегмента
-
-fig_pie, ax_pie = plt.subplots(figsize=(3, 3))  # Уменьшенный размер
-ax_pie.pie(
-    sizes,
-    explode=explode,
-    labels=labels,
-    autopct="%1.1f%%",
-    startangle=90,
-    colors=colors,
-    shadow=True,
-    wedgeprops={"edgecolor": "white"},
-    textprops={'fontsize': 6}  # Уменьшенный размер шрифта текста
-)
-ax_pie.axis("equal")  # Equal aspect ratio ensures that pie is drawn as a circle.
-ax_pie.set_title("Распределение выплат", fontsize=8)  # Уменьшенный размер шрифта заголовка
-st.subheader("Распределение выплат")
-st.pyplot(fig_pie)
-
-# Таблица с распределением выплат
-st.subheader("Детализация выплат")
-st.dataframe(df.style.format({
-    "Платеж": "{:.2f}",
-    "Остаток долга": "{:.2f}",
-    "Проценты": "{:.2f}",
-    "Тело кредита": "{:.2f}"
-}))
-
-# График ежемесячных выплат (уменьшенный размер и шрифт)
-fig_payments, ax_payments = plt.subplots(figsize=(5, 3))  # Уменьшенный размер
-principal_payments = df["Тело кредита"].values
-interest_payments = df["Проценты"].values
-months = df["Месяц"].values
-
-ax_payments.bar(months, principal_payments, label="Тело кредита", color="#4682B4", alpha=0.6)
-ax_payments.bar(months, interest_payments, bottom=principal_payments, label="Проценты", color="#FFA07A", alpha=0.6)
-ax_payments.set_xlabel("Месяцы", fontsize=6)  # Уменьшенный размер шрифта метки оси X
-ax_payments.set_ylabel("Сумма выплат", fontsize=6)  # Уменьшенный размер шрифта метки оси Y
-ax_payments.set_title("Ежемесячные выплаты по кредиту", fontsize=8)  # Уменьшенный размер шрифта заголовка
-ax_payments.legend(fontsize=6)  # Уменьшенный размер шрифта легенды
-st.subheader("График ежемесячных выплат")
-st.pyplot(fig_payments)
-
-# График накопленных выплат (уменьшенный размер и шрифт)
-cumulative_payments = np.cumsum(df["Платеж"].values)
-fig_cumulative, ax_cumulative = plt.subplots(figsize=(5, 3))  # Уменьшенный размер
-ax_cumulative.plot(months, cumulative_payments, label="Накопленные выплаты", color="green")
-ax_cumulative.axhline(y=loan_amount, color="red", linestyle="--", label="Сумма кредита")
-ax_cumulative.set_xlabel("Месяцы", fontsize=6)  # Уменьшенный размер шрифта метки оси X
-ax_cumulative.set_ylabel("Накопленная сумма", fontsize=6)  # Уменьшенный размер шрифта метки оси Y
-ax_cumulative.set_title("Накопленные выплаты по кредиту", fontsize=8)  # Уменьшенный размер шрифта заголовка
-ax_cumulative.legend(fontsize=6)  # Уменьшенный размер шрифта легенды
-st.subheader("График накопленных выплат")
-st.pyplot(fig_cumulative)
\ No newline at end of file
+        start_date = payment_calendar_name = None
+    # Точный расчет в копейках есть только для ежемесячного начисления: при начислении по дням флажок снят и недоступен
+    if daily:
+        st.session_state.exact = False
+    exact = st.sidebar.checkbox("Точный расчет в копейках", key="exact", disabled=daily,
+                                help="Платежи и проценты округляются до копейки каждый месяц, последний платеж "
+                                "корректируется так, чтобы остаток стал нулевым. Недоступен при начислении по дням")
+    what_if = st.sidebar.checkbox("Анализ «что если»: ставка × срок")
+    prepayments = st.sidebar.checkbox("Досрочные погашения")
+    floating_rate = st.sidebar.checkbox("Плавающая ставка")
+    inverse = st.sidebar.checkbox("Обратный расчет и ПСК")
+
+    # Преобразование годовой ставки в месячную
+    monthly_interest_rate = annual_interest_rate / 100 / 12
+    loan_term_months = loan_term_years * 12
+
+    # Ключ кэша: одинаковые параметры у разных пользователей дают один и тот же расчет
+    cache_key = (loan_amount, annual_interest_rate, loan_term_years, payment_type, interest_type, exact,
+                 accrual, start_date, payment_calendar_name)
+
+    # Функция расчета графика, итогов и таблицы детализации
+    def calculate():
+        # График платежей строится векторно, без цикла по месяцам
+        dates = None
+        if daily:
+            schedule = daily_schedule(loan_amount, annual_interest_rate, start_date, loan_term_months, payment_type,
+                                      accrual, payment_calendar_name)
+            dates = payment_calendar(start_date, loan_term_months, payment_calendar_name).dates
+        elif exact:
+            schedule = schedule_from_kopecks(exact_schedule(loan_amount, monthly_interest_rate, loan_term_months, payment_type))
+        else:
+            schedule = build_schedule(loan_amount, monthly_interest_rate, loan_term_months, payment_type)
+        total_payment = float(schedule.payment.sum())
+        return {
+            "schedule": schedule,
+            "monthly_payment": float(schedule.payment[0]),
+            "total_payment": total_payment,
+            "total_interest_paid": total_payment - loan_amount,  # Переплата
+            "table": schedule_to_arrow(schedule, dates),  # Таблица с детализацией выплат (Arrow)
+        }
+
+    with metrics.span("calculate"):
+        result = schedule_cache.get_or_compute(("calculation",) + cache_key, calculate)
+    monthly_payment = result["monthly_payment"]
+    total_payment = result["total_payment"]
+    total_interest_paid = result["total_interest_paid"]
+
+    # Отображение результатов
+    st.write(f"Ежемесячный платеж: {monthly_payment:.2f}" if payment_type == ANNUITY else "Ежемесячные платежи различаются.")
+    st.write(f"Общая сумма выплат: {total_payment:.2f}")
+    st.write(f"Переплата по кредиту: {total_interest_paid:.2f}")
+
+    # Кнопка для сохранения расчета
+    if st.button("Сохранить расчет"):
+        unique_link = save_calculation(
+            username=username,
+            loan_amount=loan_amount,
+            annual_interest_rate=annual_interest_rate,
+            loan_term_years=loan_term_years,
+            payment_type=payment_type,
+            total_payment=total_payment,
+            total_interest_paid=total_interest_paid,
+            schedule_blob=encode_schedule(result["schedule"]),  # График сохраняется вместе с расчетом
+            # При начислении по дням - параметры, по которым построен график
+            day_count=accrual if daily else None,
+            payment_calendar=payment_calendar_name,
+            start_date=start_date,
+        )
+        if unique_link:
+            st.success(f"Расчет сохранен! Поделитесь ссылкой: {unique_link}")
+        else:
+            st.error("Не удалось сохранить расчет.")
+
+
+    # Круговая диаграмма
+    st.subheader("Распределение выплат")
+    show_chart("pie", cache_key, loan_amount, total_interest_paid)
+
+    # Таблица с распределением выплат: постранично, в браузер уходит только видимая страница
+    st.subheader("Детализация выплат")
+    show_table_page(result["table"], "schedule")
+
+    # Выгрузка графика платежей в файл: файл строится только по кнопке (готовый файл кэшируется по ключу расчета)
+    export_formats = available_export_formats()
+    export_format = st.selectbox("Формат выгрузки", list(export_formats))
+    suffix = export_formats[export_format]
+    if st.button("Подготовить файл"):
+        try:
+            with metrics.span("export.schedule"):
+                export_data = schedule_cache.get_or_compute(
+                    ("export", suffix) + cache_key, lambda: export_bytes(export_schedule, result["schedule"], suffix)
+                )
+            st.session_state.schedule_export = (cache_key, suffix, export_data)
+        except ImportError as error:
+            st.error(str(error))
+    export = st.session_state.get("schedule_export")
+    if export is not None and export[:2] == (cache_key, suffix):
+        st.download_button("Скачать график платежей", data=export[2], file_name=f"schedule{suffix}")
+
+    # Графики ежемесячных и накопленных выплат (длинные графики сжимаются до ограниченного числа точек)
+    st.subheader("График ежемесячных выплат")
+    show_chart("payments", cache_key, result["schedule"])
+
+    st.subheader("График накопленных выплат")
+    show_chart("cumulative", cache_key, result["schedule"], loan_amount)
+
+    # Анализ "что если": показатели по сетке ставок и сроков.
+    # Сетка хранится в сессии; при движении ползунка ставки досчитываются только новые строки
+    if what_if:
+        grid = st.session_state.get("sensitivity_grid")
+        if grid is None or (grid.loan_amount, grid.payment_type) != (loan_amount, payment_type):
+            grid = st.session_state.sensitivity_grid = SensitivityGrid(loan_amount, payment_type)
+        rates = rate_axis(annual_interest_rate)
+        terms = list(range(1, max(30, loan_term_years) + 1))
+        with metrics.span("what_if.grid"):
+            grid_values = grid.update(rates, terms)
+
+        st.subheader("Анализ «что если»: ставка × срок")
+        metric = st.selectbox("Показатель", METRICS, format_func=METRIC_TITLES.get)
+        st.vega_lite_chart(heatmap_spec(rates, terms, grid_values[metric], METRIC_TITLES[metric]), use_container_width=True)
+        st.dataframe(grid_to_dataframe(rates, terms, grid_values[metric]))
+
+    # Досрочные погашения: таблица событий и пересчет графика.
+    # План хранится в сессии; при правке события пересчитываются только месяцы начиная с него
+    if prepayments:
+        import pandas as pd  # pandas загружается только для разделов, где он нужен
+
+        st.subheader("Досрочные погашения")
+        modes = {REDUCE_TERM: "Уменьшение срока", REDUCE_PAYMENT: "Уменьшение платежа"}
+        mode_by_title = {title: mode for mode, title in modes.items()}
+        events_df = st.data_editor(
+            pd.DataFrame({"Месяц": [12], "Сумма": [100000.0], "Способ": [modes[REDUCE_TERM]]}),
+            num_rows="dynamic",
+            column_config={
+                "Месяц": st.column_config.NumberColumn(min_value=1, max_value=loan_term_months, step=1),
+                "Сумма": st.column_config.NumberColumn(min_value=0.0),
+                "Способ": st.column_config.SelectboxColumn(options=list(modes.values())),
+            },
+            key="prepayment_events",
+        )
+        events = [
+            Prepayment(int(row["Месяц"]), float(row["Сумма"]), mode_by_title.get(row["Способ"], REDUCE_TERM))
+            for _, row in events_df.dropna(subset=["Месяц", "Сумма"]).iterrows()
+        ]
+
+        plan = st.session_state.get("prepayment_plan")
+        plan_key = (loan_amount, monthly_interest_rate, loan_term_months, payment_type)
+        if plan is None or (plan.loan_amount, plan.rate, plan.loan_term_months, plan.payment_type) != plan_key:
+            plan = st.session_state.prepayment_plan = PrepaymentSchedule(*plan_key)
+        with metrics.span("prepayments"):
+            prepaid_schedule = plan.update(events)
+
+        prepaid_total = float(prepaid_schedule.payment.sum())
+        st.write(f"Срок с учетом досрочных погашений: {len(prepaid_schedule.month)} мес. (вместо {loan_term_months})")
+        st.write(f"Общая сумма выплат: {prepaid_total:.2f}")
+        st.write(f"Переплата по кредиту: {prepaid_total - loan_amount:.2f}")
+        st.write(f"Экономия на процентах: {total_payment - prepaid_total:.2f}")
+        show_table_page(schedule_to_arrow(prepaid_schedule), "prepaid_schedule")
+
+    # Плавающая ставка: ставка кредита = ключевая ставка + маржа, платеж пересчитывается
+    # при каждом пересмотре ставки. Риск оценивается по смоделированным траекториям ключевой ставки
+    if floating_rate:
+        import pandas as pd
+
+        st.subheader("Плавающая ставка")
+        columns = st.columns(3)
+        key_rate = columns[0].number_input("Ключевая ставка сейчас (%)", min_value=0.0, value=16.0, step=0.25)
+        mean_rate = columns[1].number_input("Долгосрочный уровень (%)", min_value=0.0, value=10.0, step=0.25)
+        volatility = columns[2].number_input("Волатильность (п.п. в год)", min_value=0.0, value=2.0, step=0.5)
+        margin = columns[0].number_input("Маржа банка (п.п.)", min_value=0.0, value=3.0, step=0.25)
+        reset_months = columns[1].selectbox("Пересмотр ставки (мес.)", [1, 3, 6, 12], index=1)
+        n_paths = columns[2].select_slider("Число траекторий", [1000, 5000, 10000, 50000], value=10000)
+        model = RateModel(key_rate, mean_rate, volatility=volatility)
+
+        # В процессе сервера - без пула процессов: запуск процессов дольше самого расчета на этих
+        # числах траекторий, а fork многопоточного сервера небезопасен. Многопроцессный расчет -
+        # в командной строке и фоновых задачах
+        with metrics.span("floating_rate"):
+            floating = schedule_cache.get_or_compute(
+                ("floating", loan_amount, loan_term_months, margin, model, n_paths, reset_months),
+                lambda: simulate_floating_rate(loan_amount, loan_term_months, margin, model, n_paths, reset_months,
+                                               seed=0, workers=1),
+            )
+
+        percentile_labels = [f"P{p}" for p in floating.percentiles]
+        st.dataframe(pd.DataFrame(
+            {"Общая сумма выплат": floating.total_payment, "Переплата": floating.overpayment},
+            index=percentile_labels,
+        ).round(2))
+        st.write("Ежемесячный платеж по периодам пересмотра ставки (перцентили)")
+        st.line_chart(pd.DataFrame(
+            floating.payment_bands.T,
+            index=pd.Index(np.arange(floating.payment_bands.shape[1]) * reset_months + 1, name="Месяц"),
+            columns=percentile_labels,
+        ))
+
+    # Обратный расчет: ставка по желаемому платежу, срок по бюджету и полная стоимость кредита
+    if inverse:
+        st.subheader("Обратный расчет и ПСК")
+        columns = st.columns(3)
+        target_payment = columns[0].number_input("Желаемый ежемесячный платеж", min_value=1.0, value=round(monthly_payment, 2))
+        budget = columns[1].number_input("Бюджет в месяц", min_value=1.0, value=float(np.ceil(monthly_payment)))
+        upfront_fee = columns[2].number_input("Разовая комиссия при выдаче", min_value=0.0, value=0.0)
+        monthly_fee = columns[2].number_input("Ежемесячная комиссия", min_value=0.0, value=0.0)
+
+        with metrics.span("inverse"):
+            implied_rate = solve_rate(loan_amount, target_payment, loan_term_months)
+            term = solve_term(loan_amount, budget, monthly_interest_rate)
+            full_cost = full_cost_of_credit(loan_amount, annual_interest_rate, loan_term_months, payment_type, upfront_fee, monthly_fee)
+
+        if implied_rate.converged:
+            columns[0].write(f"Ставка для платежа: {float(implied_rate.value) * 12 * 100:.3f}% годовых")
+        else:
+            columns[0].write("Платеж меньше суммы кредита, деленной на срок: подходящей ставки нет.")
+        if term.converged:
+            columns[1].write(f"Минимальный срок: {int(term.value)} мес., платеж {float(term.residual + budget):.2f}")
+        else:
+            columns[1].write("Бюджет не покрывает даже проценты: кредит не погасится.")
+        columns[2].write(f"ПСК: {float(full_cost.full_cost_rate):.3f}% годовых")
+        columns[2].write(f"Эффективная ставка: {float(full_cost.effective_rate):.3f}%")
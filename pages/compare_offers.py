@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+import metrics
+import auth
+from charts import offers_spec
+from credit_engine import ANNUITY, DIFFERENTIATED, PAYMENT_TYPES
+from credit_engine.offers import OFFER_TITLES, RANKINGS, compare_offers, offer_schedules, unpaid_offers
+
+# Настройка страницы
+st.set_page_config(page_title="Сравнение предложений", layout="wide")
+with metrics.rerun("compare_offers"):
+    # Проверка аутентификации
+    authenticated, username = auth.current_user()
+    if not authenticated:
+        st.warning("Вы не авторизованы. Пожалуйста, войдите.")
+        st.stop()
+
+    st.title("Сравнение кредитных предложений")
+
+    # Таблица предложений: строки можно добавлять, удалять и вставлять из буфера обмена
+    DEFAULT_OFFERS = pd.DataFrame({
+        "name": ["Банк А", "Банк Б", "Банк В"],
+        "loan_amount": [1000000.0, 1000000.0, 1000000.0],
+        "annual_interest_rate": [10.0, 9.5, 10.0],
+        "loan_term_years": [5, 5, 5],
+        "payment_type": [ANNUITY, ANNUITY, DIFFERENTIATED],
+        "upfront_fee": [0.0, 15000.0, 0.0],
+        "monthly_fee": [0.0, 0.0, 300.0],
+    })
+    offers = st.data_editor(
+        DEFAULT_OFFERS,
+        num_rows="dynamic",
+        hide_index=True,
+        column_config={
+            "name": st.column_config.TextColumn(OFFER_TITLES["name"]),
+            "loan_amount": st.column_config.NumberColumn(OFFER_TITLES["loan_amount"], min_value=1000),
+            "annual_interest_rate": st.column_config.NumberColumn(OFFER_TITLES["annual_interest_rate"], min_value=0.0, max_value=100.0),
+            "loan_term_years": st.column_config.NumberColumn(OFFER_TITLES["loan_term_years"], min_value=1, max_value=50, step=1),
+            "payment_type": st.column_config.SelectboxColumn(OFFER_TITLES["payment_type"], options=PAYMENT_TYPES),
+            "upfront_fee": st.column_config.NumberColumn(OFFER_TITLES["upfront_fee"], min_value=0.0),
+            "monthly_fee": st.column_config.NumberColumn(OFFER_TITLES["monthly_fee"], min_value=0.0),
+        },
+        key="offers",
+    )
+    offers = offers.dropna(subset=["loan_amount", "annual_interest_rate", "loan_term_years", "payment_type"])
+    # Предложения, где разовая комиссия не меньше суммы кредита, не сравниваются
+    unpaid = unpaid_offers(offers)
+    if unpaid.any():
+        st.warning(
+            "Разовая комиссия не меньше суммы кредита, предложения не сравниваются: "
+            + ", ".join(offers.loc[unpaid, "name"].fillna("без названия").astype(str))
+        )
+        offers = offers[~unpaid]
+    if offers.empty:
+        st.info("Добавьте хотя бы одно предложение.")
+        st.stop()
+
+    # Все предложения считаются одним векторным проходом
+    with metrics.span("compare_offers"):
+        comparison = compare_offers(offers)
+
+    ranking = st.selectbox("Ранжировать по", list(RANKINGS), format_func=RANKINGS.get)
+    comparison = comparison.sort_values(f"rank_{ranking}", kind="stable")
+    table = comparison[["name", "monthly_payment", "peak_payment", "total_cost", "overpayment", "full_cost_rate"]].copy()
+    # ПСК, которую не удалось найти, показывается прочерком
+    table["full_cost_rate"] = [f"{rate:.2f}" if np.isfinite(rate) else "—" for rate in table["full_cost_rate"]]
+    st.dataframe(
+        table.rename(columns=OFFER_TITLES),
+        hide_index=True,
+        use_container_width=True,
+        column_config={OFFER_TITLES[column]: st.column_config.NumberColumn(format="%.2f") for column in table.columns[1:-1]},
+    )
+    best = comparison.iloc[0]
+    st.success(f"Лучшее предложение по показателю «{RANKINGS[ranking]}»: {best['name']}")
+
+    # Графики сравнения: одинаковые предложения используют один и тот же график платежей
+    with metrics.span("compare_offers.charts"):
+        schedules = offer_schedules(comparison)
+    st.subheader("Ежемесячные платежи")
+    st.vega_lite_chart(offers_spec(comparison["name"], schedules, comparison["monthly_fee"]), use_container_width=True)
+    st.subheader("Накопленные выплаты")
+    st.vega_lite_chart(offers_spec(comparison["name"], schedules, comparison["monthly_fee"], cumulative=True), use_container_width=True)
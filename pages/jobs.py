@@ -0,0 +1,133 @@
+import json
+import os
+import uuid
+
+import streamlit as st
+import metrics
+import jobs
+import auth
+
+# Настройка страницы
+st.set_page_config(page_title="Фоновые задачи", layout="wide")
+with metrics.rerun("jobs"):
+    # Проверка аутентификации
+    authenticated, username = auth.current_user()
+    if not authenticated:
+        st.warning("Вы не авторизованы. Пожалуйста, войдите.")
+        st.stop()
+
+    # Обработчики задач запускаются один раз на процесс сервера (JOB_WORKERS=0 - используются внешние)
+    jobs.start_job_workers()
+
+    st.title("Фоновые задачи")
+    st.write("Долгие расчеты выполняются в отдельных процессах: страницу можно закрыть и вернуться к результату позже.")
+
+    JOB_POLL_INTERVAL = 2  # секунд между обновлениями списка задач
+    JOB_TITLES = {"floating": "Плавающая ставка", "portfolio": "Пакетный расчет портфеля"}
+    STATUS_TITLES = {
+        jobs.QUEUED: "В очереди",
+        jobs.RUNNING: "Выполняется",
+        jobs.DONE: "Готово",
+        jobs.FAILED: "Ошибка",
+        jobs.CANCELLED: "Отменена",
+    }
+
+    floating_tab, portfolio_tab = st.tabs([JOB_TITLES["floating"], JOB_TITLES["portfolio"]])
+
+    # Моделирование плавающей ставки на большом числе траекторий
+    with floating_tab:
+        with st.form("floating_job"):
+            columns = st.columns(3)
+            loan_amount = columns[0].number_input("Сумма кредита", min_value=1000.0, value=1000000.0, step=1000.0)
+            loan_term_years = columns[1].number_input("Срок кредита (лет)", min_value=1, max_value=50, value=10)
+            margin = columns[2].number_input("Маржа банка (п.п.)", min_value=0.0, value=3.0, step=0.25)
+            key_rate = columns[0].number_input("Ключевая ставка сейчас (%)", min_value=0.0, value=16.0, step=0.25)
+            mean_rate = columns[1].number_input("Долгосрочный уровень (%)", min_value=0.0, value=10.0, step=0.25)
+            volatility = columns[2].number_input("Волатильность (п.п. в год)", min_value=0.0, value=2.0, step=0.5)
+            reset_months = columns[0].selectbox("Пересмотр ставки (мес.)", [1, 3, 6, 12], index=1)
+            n_paths = columns[1].select_slider("Число траекторий", [10000, 100000, 500000, 1000000], value=100000)
+            path_periods = jobs.floating_path_periods(n_paths, int(loan_term_years) * 12, reset_months)
+            submitted = st.form_submit_button("Запустить")
+            if submitted and path_periods > jobs.FLOATING_MAX_PATH_PERIODS:
+                st.error("Слишком большой расчет: уменьшите число траекторий или срок либо увеличьте период пересмотра ставки.")
+            elif submitted:
+                jobs.submit_job(username, "floating", {
+                    "loan_amount": loan_amount,
+                    "loan_term_months": int(loan_term_years) * 12,
+                    "margin": margin,
+                    "model": {"initial_rate": key_rate, "mean_rate": mean_rate, "volatility": volatility},
+                    "n_paths": n_paths,
+                    "reset_months": reset_months,
+                    "seed": 0,
+                })
+
+    # Пакетный расчет портфеля из файла: итоги по каждому кредиту выгружаются в Parquet
+    with portfolio_tab:
+        with st.form("portfolio_job", clear_on_submit=True):
+            uploaded = st.file_uploader("Файл кредитов (CSV или Parquet)", type=["csv", "parquet"])
+            exact = st.checkbox("Точный расчет в копейках")
+            if st.form_submit_button("Запустить") and uploaded is not None:
+                name = uuid.uuid4().hex
+                input_path = jobs.job_file(f"{name}{os.path.splitext(uploaded.name)[1]}")
+                with open(input_path, "wb") as f:
+                    f.write(uploaded.getbuffer())
+                jobs.submit_job(username, "portfolio", {
+                    "input_path": input_path,
+                    "totals_path": jobs.job_file(f"{name}_totals.parquet"),
+                    "exact": exact,
+                })
+
+
+    # Результат моделирования плавающей ставки (частичный или итоговый)
+    def show_floating_result(result):
+        import pandas as pd  # pandas нужен только для таблицы результата
+
+        percentile_labels = [f"P{p}" for p in result["percentiles"]]
+        st.caption(f"Траекторий: {result['n_paths']}")
+        st.dataframe(pd.DataFrame(
+            {"Общая сумма выплат": result["total_payment"], "Переплата": result["overpayment"]},
+            index=percentile_labels,
+        ).round(2))
+
+
+    # Результат пакетного расчета (частичный или итоговый)
+    def show_portfolio_result(result, job):
+        columns = st.columns(3)
+        columns[0].metric("Обработано кредитов", f"{result['processed']} из {result['total']}")
+        columns[1].metric("Общая сумма выплат", f"{result['total_payment']:.2f}")
+        columns[2].metric("Переплата", f"{result['total_interest_paid']:.2f}")
+        totals_path = result.get("totals_path")
+        if job.status == jobs.DONE and totals_path and os.path.exists(totals_path):
+            with open(totals_path, "rb") as f:
+                st.download_button("Скачать итоги", data=f.read(), file_name="totals.parquet", key=f"download_{job.id}")
+
+
+    # Список задач обновляется отдельно от остальной страницы, пока она открыта
+    @st.fragment(run_every=JOB_POLL_INTERVAL)
+    def show_jobs():
+        with metrics.span("jobs.poll"):
+            user_jobs = jobs.list_jobs(username)
+        if not user_jobs:
+            st.info("Задач пока нет.")
+            return
+        for job in user_jobs:
+            with st.container(border=True):
+                columns = st.columns([6, 1])
+                columns[0].write(f"**{JOB_TITLES.get(job.kind, job.kind)}** №{job.id}: {STATUS_TITLES[job.status]}")
+                if job.status in jobs.ACTIVE_STATUSES:
+                    if columns[1].button("Отменить", key=f"cancel_{job.id}"):
+                        jobs.cancel_job(job.id, username)
+                        st.rerun(scope="fragment")
+                    st.progress(job.progress)
+                if job.error:
+                    st.error(job.error)
+                if job.result:
+                    result = json.loads(job.result)
+                    if job.kind == "floating":
+                        show_floating_result(result)
+                    elif job.kind == "portfolio":
+                        show_portfolio_result(result, job)
+
+
+    st.subheader("Мои задачи")
+    show_jobs()
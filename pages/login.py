@@ -1,5 +1,6 @@
 import streamlit as st
-from database import authenticate_user, activate_session
+import auth
+from database import authenticate_user
 
 # Настройка страницы
 st.set_page_config(page_title="Вход", layout="centered")
@@ -16,7 +17,7 @@ with st.form("login_form"):
     
     if submitted:
         if authenticate_user(username, password):
-            activate_session(username)  # Активируем сессию
+            auth.login(username)  # Активируем сессию браузера
             st.session_state.is_authenticated = True
             st.session_state.username = username  # Сохраняем имя пользователя
             st.success("Вход выполнен успешно! Перенаправляем на главную страницу...")
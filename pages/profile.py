@@ -1,36 +1,99 @@
 import streamlit as st
-from database import is_authenticated, get_user_calculations
+import metrics
+import auth
+from database import get_user_calculations_page, get_user_summary
+from database import iter_user_calculations
+from credit_engine.export import available_export_formats, export_bytes, export_calculations
 
 # Настройка страницы
 st.set_page_config(page_title="Профиль", layout="wide")
+with metrics.rerun("profile"):
+    # Проверка аутентификации
+    authenticated, username = auth.current_user()
+    if not authenticated:
+        st.warning("Вы не авторизованы. Пожалуйста, войдите.")
+        st.stop()
 
-# Проверка аутентификации
-authenticated, username = is_authenticated()
-if not authenticated:
-    st.warning("Вы не авторизованы. Пожалуйста, войдите.")
-    st.stop()
-
-# Заголовок
-st.title(f"Профиль пользователя: {username}")
-
-# Получение расчетов пользователя
-calculations = get_user_calculations(username)
-
-if not calculations:
-    st.info("У вас пока нет сохраненных расчетов.")
-else:
-    st.subheader("Сохраненные расчеты:")
-    for calc in calculations:
-        st.write(f"""
-        - **Сумма кредита**: {calc.loan_amount:.2f}
-        - **Ставка**: {calc.annual_interest_rate}%
-        - **Срок**: {calc.loan_term_years} лет
-        - **Тип платежей**: {calc.payment_type}
-        - **Общая сумма выплат**: {calc.total_payment:.2f}
-        - **Переплата**: {calc.total_interest_paid:.2f}
-        - [Посмотреть расчет]({calc.unique_link})
-        """)
-if st.button("Выйти"):
-    st.session_state.is_authenticated = False
-    st.session_state.username = None
-    st.experimental_rerun()
\ No newline at end of file
+    # Заголовок
+    st.title(f"Профиль пользователя: {username}")
+
+    HISTORY_PAGE_SIZE = 20
+
+    # Сводка по расчетам читается из поддерживаемой при записи таблицы, без просмотра всех расчетов
+    summary = get_user_summary(username)
+    total = sum(row.calculation_count for row in summary)
+
+    # Загруженные страницы истории хранятся в сессии; при изменении числа расчетов история загружается заново
+    history = st.session_state.get("history")
+    if history is None or history["username"] != username or history["total"] != total:
+        calculations, cursor = get_user_calculations_page(username, limit=HISTORY_PAGE_SIZE)
+        history = st.session_state.history = {
+            "username": username,
+            "total": total,
+            "calculations": calculations,
+            "cursor": cursor,
+        }
+
+    if not total:
+        st.info("У вас пока нет сохраненных расчетов.")
+    else:
+        st.subheader("Сводка по расчетам")
+        columns = st.columns(4)
+        columns[0].metric("Расчетов", total)
+        columns[1].metric("Сумма кредитов", f"{sum(row.total_loan_amount for row in summary):.2f}")
+        columns[2].metric("Средняя ставка", f"{sum(row.rate_sum for row in summary) / total:.2f}%")
+        columns[3].metric("Общая переплата", f"{sum(row.total_interest_paid for row in summary):.2f}")
+        st.dataframe(
+            [
+                {
+                    "Тип платежей": row.payment_type,
+                    "Расчетов": row.calculation_count,
+                    "Сумма кредитов": round(row.total_loan_amount, 2),
+                    "Средняя ставка (%)": round(row.average_rate, 2),
+                    "Общая сумма выплат": round(row.total_payment, 2),
+                    "Переплата": round(row.total_interest_paid, 2),
+                }
+                for row in summary
+            ],
+            hide_index=True,
+        )
+
+        st.subheader(f"Сохраненные расчеты ({total}):")
+        for calc in history["calculations"]:
+            st.write(f"""
+            - **Сумма кредита**: {calc.loan_amount:.2f}
+            - **Ставка**: {calc.annual_interest_rate}%
+            - **Срок**: {calc.loan_term_years} лет
+            - **Тип платежей**: {calc.payment_type}
+            - **Общая сумма выплат**: {calc.total_payment:.2f}
+            - **Переплата**: {calc.total_interest_paid:.2f}
+            - [Посмотреть расчет]({calc.unique_link})
+            """)
+        # Следующая страница подгружается по кнопке и добавляется к уже показанным
+        if history["cursor"] is not None:
+            if st.button(f"Показать еще (показано {len(history['calculations'])} из {total})"):
+                calculations, cursor = get_user_calculations_page(username, before_id=history["cursor"], limit=HISTORY_PAGE_SIZE)
+                history["calculations"] = history["calculations"] + calculations
+                history["cursor"] = cursor
+                st.rerun()
+
+        # Выгрузка графиков всех расчетов одним файлом: расчеты читаются из БД страницами
+        # и пишутся в файл блоками; в памяти остается только готовый файл для кнопки скачивания
+        st.subheader("Выгрузка графиков платежей")
+        export_formats = available_export_formats()
+        export_format = st.selectbox("Формат", list(export_formats))
+        suffix = export_formats[export_format]
+        if st.button("Подготовить файл"):
+            try:
+                with metrics.span("export.calculations"):
+                    st.session_state.history_export = (username, suffix, export_bytes(export_calculations, iter_user_calculations(username), suffix))
+            except ImportError as error:
+                st.error(str(error))
+        export = st.session_state.get("history_export")
+        if export is not None and export[:2] == (username, suffix) and export[2] is not None:
+            st.download_button("Скачать", data=export[2], file_name=f"calculations{suffix}")
+    if st.button("Выйти"):
+        auth.logout()
+        st.session_state.is_authenticated = False
+        st.session_state.username = None
+        st.rerun()
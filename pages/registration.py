@@ -1,5 +1,6 @@
 import streamlit as st
-from database import register_user, activate_session
+import auth
+from database import register_user
 
 # Настройка страницы
 st.set_page_config(page_title="Регистрация", layout="centered")
@@ -23,7 +24,7 @@ with st.form("registration_form"):
         else:
             success = register_user(username, password)
             if success:
-                activate_session(username)  # Активируем сессию
+                auth.login(username)  # Активируем сессию браузера
                 st.session_state.is_authenticated = True
                 st.session_state.username = username  # Сохраняем имя пользователя
                 st.success("Регистрация успешна! Перенаправляем на главную страницу...")
@@ -1,28 +1,62 @@
 import streamlit as st
-from database import get_calculation_by_link
+import metrics
+from database import get_calculation_by_link, is_valid_link
+from charts import show_chart
+from tables import show_table_page
+from credit_engine import CALENDAR_TITLES, build_schedule, daily_schedule, decode_schedule, payment_calendar, schedule_to_arrow
 
 # Настройка страницы
 st.set_page_config(page_title="Просмотр расчета", layout="wide")
+with metrics.rerun("view_calculation"):
+    # Получение уникальной ссылки из URL
+    query_params = st.experimental_get_query_params()
+    unique_link = query_params.get("link", [None])[0]
 
-# Получение уникальной ссылки из URL
-query_params = st.experimental_get_query_params()
-unique_link = query_params.get("link", [None])[0]
+    # Ссылки не в формате UUID отклоняются без обращения к базе данных
+    if not unique_link or not is_valid_link(unique_link):
+        st.warning("Неверная ссылка. Расчет не найден.")
+        st.stop()
 
-if not unique_link:
-    st.warning("Неверная ссылка. Расчет не найден.")
-    st.stop()
+    # Получение расчета по ссылке вместе с сохраненным графиком (один запрос, результат кэшируется)
+    calculation = get_calculation_by_link(unique_link, with_schedule=True)
+    if not calculation:
+        st.warning("Расчет не найден.")
+        st.stop()
 
-# Получение расчета по ссылке
-calculation = get_calculation_by_link(unique_link)
-if not calculation:
-    st.warning("Расчет не найден.")
-    st.stop()
+    # Отображение расчета
+    st.title("Просмотр расчета")
+    st.write(f"- **Сумма кредита**: {calculation.loan_amount:.2f}")
+    st.write(f"- **Ставка**: {calculation.annual_interest_rate}%")
+    st.write(f"- **Срок**: {calculation.loan_term_years} лет")
+    st.write(f"- **Тип платежей**: {calculation.payment_type}")
+    if calculation.day_count:
+        st.write(f"- **Начисление процентов**: {calculation.day_count}")
+        st.write(f"- **Дата выдачи**: {calculation.start_date:%d.%m.%Y}")
+        st.write(f"- **Календарь платежей**: {CALENDAR_TITLES[calculation.payment_calendar]}")
+    st.write(f"- **Общая сумма выплат**: {calculation.total_payment:.2f}")
+    st.write(f"- **Переплата**: {calculation.total_interest_paid:.2f}")
 
-# Отображение расчета
-st.title("Просмотр расчета")
-st.write(f"- **Сумма кредита**: {calculation.loan_amount:.2f}")
-st.write(f"- **Ставка**: {calculation.annual_interest_rate}%")
-st.write(f"- **Срок**: {calculation.loan_term_years} лет")
-st.write(f"- **Тип платежей**: {calculation.payment_type}")
-st.write(f"- **Общая сумма выплат**: {calculation.total_payment:.2f}")
-st.write(f"- **Переплата**: {calculation.total_interest_paid:.2f}")
\ No newline at end of file
+    # График платежей: сохраненный вместе с расчетом или, для старых расчетов, пересчитанный
+    if calculation.schedule_blob is not None:
+        schedule = decode_schedule(calculation.schedule_blob)
+    elif calculation.day_count:
+        schedule = daily_schedule(calculation.loan_amount, calculation.annual_interest_rate, calculation.start_date,
+                                  calculation.loan_term_years * 12, calculation.payment_type, calculation.day_count,
+                                  calculation.payment_calendar)
+    else:
+        schedule = build_schedule(
+            calculation.loan_amount,
+            calculation.annual_interest_rate / 100 / 12,
+            calculation.loan_term_years * 12,
+            calculation.payment_type,
+        )
+
+    st.subheader("График ежемесячных выплат")
+    show_chart("payments", ("link", unique_link), schedule)
+
+    # При начислении по дням в таблице - даты платежей по календарю, как на странице калькулятора
+    dates = None
+    if calculation.day_count:
+        dates = payment_calendar(calculation.start_date, calculation.loan_term_years * 12, calculation.payment_calendar).dates
+    st.subheader("Детализация выплат")
+    show_table_page(schedule_to_arrow(schedule, dates), "schedule")
@@ -0,0 +1,39 @@
+# Вывод длинных таблиц (графиков платежей) постранично.
+# Таблица хранится как Arrow: срез страницы не копирует данные, а в браузер
+# отправляется только видимая страница. Числа форматируются на уровне колонок
+# (column_config), без pandas Styler, который форматирует каждую ячейку на сервере.
+import metrics
+from credit_engine import SCHEDULE_COLUMNS
+
+DEFAULT_PAGE_SIZE = 60  # Строк на странице (5 лет помесячно)
+MONEY_FORMAT = "%.2f"
+
+
+# Настройки колонок графика платежей: номер месяца - целое, суммы - два знака после запятой
+def schedule_column_config():
+    import streamlit as st
+
+    config = {name: st.column_config.NumberColumn(format=MONEY_FORMAT) for name in SCHEDULE_COLUMNS.values()}
+    config[SCHEDULE_COLUMNS["month"]] = st.column_config.NumberColumn(format="%d")
+    return config
+
+
+# Функция вывода одной страницы таблицы Arrow с выбором номера страницы.
+# key - уникальный ключ таблицы на странице (для виджета выбора страницы)
+def show_table_page(table, key, page_size=DEFAULT_PAGE_SIZE, column_config=None):
+    import streamlit as st
+
+    with metrics.span("render.table"):
+        pages = max(1, -(-table.num_rows // page_size))
+        page = 1
+        if pages > 1:
+            page = st.number_input(f"Страница (из {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+        start = (page - 1) * page_size
+        st.dataframe(
+            table.slice(start, page_size),
+            hide_index=True,
+            use_container_width=True,
+            column_config=column_config if column_config is not None else schedule_column_config(),
+        )
+        if pages > 1:
+            st.caption(f"Строки {start + 1}–{min(start + page_size, table.num_rows)} из {table.num_rows}")
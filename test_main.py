@@ -1,15 +1,63 @@
 import pytest
-from database import register_user, authenticate_user, SessionLocal, User
-from pages.calculator import calculate_annuity_payment, calculate_differentiated_payment
+import database
+from database import register_user, authenticate_user, SessionLocal, User, Calculation, save_calculation, get_calculation_by_link
+from database import AuthSession, activate_session, deactivate_session, is_authenticated, cleanup_expired_sessions
+from database import Job, UserSummary, get_user_summary, rebuild_user_summaries
+from database import count_user_calculations, get_user_calculations, get_user_calculations_page, iter_user_calculations
+import calendar
+import datetime
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import numpy as np
+import pandas as pd
+import metrics
+import jobs
+from charts import VEGA, MATPLOTLIB, downsample, get_chart
+from credit_engine import (
+    ANNUITY,
+    DIFFERENTIATED,
+    ScheduleCache,
+    build_schedule,
+    calculate_annuity_payment,
+    calculate_differentiated_payment,
+    decode_schedule,
+    encode_schedule,
+    schedule_cache,
+    schedule_to_arrow,
+    schedule_to_dataframe,
+)
+from credit_engine.batch import calculate_portfolio_totals, process_chunk, run_portfolio, split_by_schedule_rows
+from credit_engine import export
+from credit_engine.export import available_export_formats, export_calculations, export_schedule
+from credit_engine.cli import main as credit_engine_cli
+from credit_engine.daycount import ACT_360, ACT_365, ACT_ACT, RUSSIA, daily_schedule, payment_calendar, year_fractions
+from credit_engine.events import REDUCE_PAYMENT, REDUCE_TERM, Prepayment, PrepaymentSchedule
+from credit_engine.offers import compare_offers, offer_schedules, unpaid_offers
+from credit_engine.money import exact_schedule, exact_totals, to_kopecks
+from credit_engine import floating
+from credit_engine.floating import RateModel, floating_payments, simulate_floating_rate, simulate_key_rate_paths
+from credit_engine import solvers
+from credit_engine.solvers import full_cost_of_credit, solve_irr, solve_rate, solve_term
+from credit_engine.sensitivity import SensitivityGrid, grid_metrics, rate_axis
 
 # Фикстура для очистки базы данных перед каждым тестом
 @pytest.fixture(autouse=True)
 def clear_database():
     """Очищает базу данных перед каждым тестом."""
     db = SessionLocal()
+    db.query(Calculation).delete()
+    db.query(AuthSession).delete()
     db.query(User).delete()
+    db.query(Job).delete()
+    db.query(UserSummary).delete()
     db.commit()
     db.close()
+    database.clear_user_id_cache()
+    database.clear_link_cache()
 
 # Фикстура для регистрации тестового пользователя
 @pytest.fixture
@@ -38,6 +86,66 @@ def test_authenticate_user_failure(test_user):
     assert authenticate_user(test_user["username"], "wrongpassword") is False
     assert authenticate_user("nonexistentuser", "password123") is False
 
+# Тесты сессий по токенам
+def test_sessions_are_per_browser(test_user):
+    """Тест: у каждого браузера своя сессия, чужой токен не подходит."""
+    register_user("otheruser", "password123")
+    token = activate_session(test_user["username"])
+    other_token = activate_session("otheruser")
+    assert is_authenticated(token) == (True, test_user["username"])
+    assert is_authenticated(other_token) == (True, "otheruser")
+    assert is_authenticated("unknown-token") == (False, None)
+    assert is_authenticated(None) == (False, None)
+    deactivate_session(token)
+    assert is_authenticated(token) == (False, None)
+    assert is_authenticated(other_token) == (True, "otheruser")
+
+def test_is_authenticated_uses_cache(test_user, monkeypatch):
+    """Тест: повторная проверка токена не обращается к базе данных."""
+    token = activate_session(test_user["username"])
+    assert is_authenticated(token)[0] is True
+    monkeypatch.setattr(database, "SessionLocal", None)  # Любое обращение к БД упадет
+    assert is_authenticated(token) == (True, test_user["username"])
+
+def test_session_restored_from_page_address(test_user):
+    """Тест: вход восстанавливается в новом соединении по токену из адреса страницы, выход его удаляет."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file("main.py", default_timeout=60)
+    at.run()
+    at.switch_page("pages/login.py").run()
+    at.text_input[0].input(test_user["username"])
+    at.text_input[1].input(test_user["password"])
+    at.button[0].click().run()
+    token = at.session_state["session_token"]
+    assert is_authenticated(token)[0]
+
+    # Перезагрузка страницы: новое соединение без состояния, токен только в адресе
+    at = AppTest.from_file("main.py", default_timeout=60)
+    at.query_params["session"] = token
+    at.run()
+    assert not at.exception and at.session_state["username"] == test_user["username"]
+    assert at.query_params["session"] == [token]
+    next(button for button in at.button if button.label == "Выход").click().run()
+    assert "session" not in at.query_params and is_authenticated(token) == (False, None)
+
+    at = AppTest.from_file("main.py", default_timeout=60)
+    at.query_params["session"] = token
+    at.run()
+    assert not at.session_state["is_authenticated"] and "session" not in at.query_params
+
+def test_cleanup_expired_sessions(test_user):
+    """Тест удаления истекших сессий."""
+    db = SessionLocal()
+    db.add(AuthSession(token="expired-token", username=test_user["username"], expires_at=database.utcnow() - database.timedelta(seconds=1)))
+    db.commit()
+    db.close()
+    assert is_authenticated("expired-token") == (False, None)
+    assert cleanup_expired_sessions() == 1
+    db = SessionLocal()
+    assert db.query(AuthSession).filter(AuthSession.token == "expired-token").first() is None
+    db.close()
+
 # Параметризация для тестов кредитного калькулятора
 @pytest.mark.parametrize(
     "loan_amount, annual_interest_rate, loan_term_years, expected_payment",
@@ -83,4 +191,1125 @@ def test_calculate_overpayment(loan_amount, annual_interest_rate, loan_term_year
     annuity_payment = calculate_annuity_payment(loan_amount, monthly_interest_rate, loan_term_months)
     total_payment = annuity_payment * loan_term_months
     overpayment = total_payment - loan_amount
-    assert round(overpayment, 2) == expected_overpayment
\ No newline at end of file
+    assert round(overpayment, 2) == expected_overpayment
+
+# Эталонный расчет графика циклом по месяцам (как было на странице калькулятора)
+def reference_schedule(loan_amount, monthly_interest_rate, loan_term_months, payment_type):
+    monthly_payment = calculate_annuity_payment(loan_amount, monthly_interest_rate, loan_term_months)
+    remaining_loan = loan_amount
+    rows = []
+    for month in range(1, loan_term_months + 1):
+        interest_payment = remaining_loan * monthly_interest_rate
+        if payment_type == ANNUITY:
+            principal_payment = monthly_payment - interest_payment
+        else:
+            principal_payment = loan_amount / loan_term_months
+        remaining_loan -= principal_payment
+        rows.append((principal_payment + interest_payment, interest_payment, principal_payment, remaining_loan))
+    return np.array(rows)
+
+@pytest.mark.parametrize("payment_type", [ANNUITY, DIFFERENTIATED])
+@pytest.mark.parametrize(
+    "loan_amount, annual_interest_rate, loan_term_years",
+    [
+        (1000000, 10, 1),
+        (1000000, 10, 30),
+        (500000, 0, 5),  # Нулевая ставка
+        (3000000, 20, 50),
+    ]
+)
+def test_build_schedule_matches_loop(loan_amount, annual_interest_rate, loan_term_years, payment_type):
+    """Тест совпадения векторного графика с расчетом в цикле."""
+    monthly_interest_rate = annual_interest_rate / 100 / 12
+    loan_term_months = loan_term_years * 12
+    schedule = build_schedule(loan_amount, monthly_interest_rate, loan_term_months, payment_type)
+    expected = reference_schedule(loan_amount, monthly_interest_rate, loan_term_months, payment_type)
+    actual = np.column_stack([schedule.payment, schedule.interest, schedule.principal, schedule.remaining])
+    np.testing.assert_allclose(actual, expected, rtol=1e-9, atol=1e-4)
+    assert abs(schedule.remaining[-1]) < 1e-6
+    assert schedule.principal.sum() == pytest.approx(loan_amount)
+
+def test_build_schedule_long_term_high_rate():
+    """Тест графика на длинном сроке с высокой ставкой (без накопления погрешности)."""
+    schedule = build_schedule(3000000, 49.5 / 100 / 12, 600, ANNUITY)
+    assert schedule.remaining[-1] == 0
+    assert np.all(np.diff(schedule.remaining) < 0)
+    assert schedule.principal.sum() == pytest.approx(3000000)
+
+def test_schedule_to_dataframe():
+    """Тест таблицы детализации выплат."""
+    schedule = build_schedule(1000000, 10 / 100 / 12, 12, ANNUITY)
+    df = schedule_to_dataframe(schedule)
+    assert list(df.columns) == ["Месяц", "Платеж", "Остаток долга", "Проценты", "Тело кредита"]
+    assert df["Платеж"].iloc[0] == 87915.89
+    assert df["Остаток долга"].iloc[-1] == 0
+
+# Тесты пакетного расчета портфеля
+def make_portfolio(count):
+    rng = np.random.default_rng(42)
+    return pd.DataFrame({
+        "loan_amount": rng.integers(1000, 10000000, count).astype(float),
+        "annual_interest_rate": rng.choice([0.0, 5.5, 10.0, 21.5], count),
+        "loan_term_years": rng.integers(1, 31, count),
+        "payment_type": rng.choice([ANNUITY, DIFFERENTIATED], count),
+    })
+
+def test_portfolio_matches_single_loan_schedules():
+    """Тест совпадения пакетного расчета с расчетом по одному кредиту."""
+    loans = make_portfolio(20)
+    totals, schedules = process_chunk(loans, with_schedules=True)
+    for i, loan in loans.iterrows():
+        schedule = build_schedule(
+            loan.loan_amount, loan.annual_interest_rate / 100 / 12, loan.loan_term_years * 12, loan.payment_type
+        )
+        assert totals.loc[i, "total_payment"] == pytest.approx(schedule.payment.sum())
+        assert totals.loc[i, "monthly_payment"] == pytest.approx(schedule.payment[0])
+        assert totals.loc[i, "last_payment"] == pytest.approx(schedule.payment[-1])
+        rows = schedules[schedules["loan_id"] == i]
+        np.testing.assert_allclose(rows["payment"], schedule.payment, rtol=1e-9)
+        np.testing.assert_allclose(rows["remaining"], schedule.remaining, atol=1e-6)
+
+@pytest.mark.parametrize("suffix, workers", [(".csv", 1), (".parquet", 2)])
+def test_run_portfolio(tmp_path, suffix, workers):
+    """Тест потокового расчета портфеля из файла блоками."""
+    loans = make_portfolio(250)
+    input_path = str(tmp_path / f"loans{suffix}")
+    if suffix == ".csv":
+        loans.to_csv(input_path, index=False)
+    else:
+        loans.to_parquet(input_path, index=False)
+    totals_path = str(tmp_path / f"totals{suffix}")
+    schedules_path = str(tmp_path / f"schedules{suffix}")
+    count = run_portfolio(input_path, totals_path, schedules_path, chunk_size=64, workers=workers)
+    assert count == 250
+    read = pd.read_csv if suffix == ".csv" else pd.read_parquet
+    totals = read(totals_path)
+    assert list(totals["loan_id"]) == list(range(250))
+    expected, _ = process_chunk(loans)
+    np.testing.assert_allclose(totals["total_payment"], expected["total_payment"])
+    assert len(read(schedules_path)) == (loans["loan_term_years"] * 12).sum()
+
+def test_portfolio_schedules_bounded_by_rows(tmp_path):
+    """Тест: блоки с полными графиками режутся по числу строк графика, результат не меняется."""
+    loans = make_portfolio(100)
+    parts = list(split_by_schedule_rows(loans, 1000))
+    assert sum(len(part) for part in parts) == 100
+    assert all(len(part) == 1 or (part["loan_term_years"] * 12).sum() <= 1000 for part in parts)
+    assert len(list(split_by_schedule_rows(loans.iloc[:1], 1))) == 1  # Длинный кредит - отдельная часть
+    loans.to_parquet(tmp_path / "loans.parquet", index=False)
+    run_portfolio(str(tmp_path / "loans.parquet"), str(tmp_path / "totals.parquet"), str(tmp_path / "schedules.parquet"),
+                  workers=2, schedule_rows=1000)
+    expected_totals, expected_schedules = process_chunk(loans, with_schedules=True)
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "totals.parquet"), expected_totals, check_dtype=False)
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "schedules.parquet"), expected_schedules, check_dtype=False)
+
+# Тесты кэша графиков
+def test_schedule_cache_hits_and_misses():
+    """Тест счетчиков попаданий и промахов кэша."""
+    cache = ScheduleCache()
+    calls = []
+    key = (1000000, 10.0, 5, ANNUITY, "Простой")
+    compute = lambda: calls.append(1) or build_schedule(1000000, 10 / 100 / 12, 60, ANNUITY)
+    first = cache.get_or_compute(key, compute)
+    second = cache.get_or_compute(key, compute)
+    assert first is second
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_schedule_cache_evicts_lru_under_budget():
+    """Тест вытеснения давно не использованных записей по бюджету памяти."""
+    cache = ScheduleCache(max_bytes=3 * 8000)
+    for key in range(3):
+        cache.put(key, np.zeros(900))  # ~7.2 КБ каждая запись
+    cache.get(0)  # Запись 0 становится самой свежей
+    cache.put(3, np.zeros(900))
+    assert cache.get(1) is None
+    assert cache.get(0) is not None and cache.get(3) is not None
+    assert cache.stats()["evictions"] == 1
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    cache.put("huge", np.zeros(10000))  # Больше бюджета: не кэшируется
+    assert cache.get("huge") is None
+
+# Тесты хранения графика в бинарном виде
+@pytest.mark.parametrize("compress", [True, False])
+def test_schedule_codec_roundtrip(compress):
+    """Тест упаковки и распаковки графика без потери точности."""
+    schedule = build_schedule(1000000, 10 / 100 / 12, 360, DIFFERENTIATED)
+    decoded = decode_schedule(encode_schedule(schedule, compress=compress))
+    for expected, actual in zip(schedule, decoded):
+        np.testing.assert_array_equal(actual, expected)
+
+def test_save_calculation_with_schedule(test_user):
+    """Тест сохранения расчета вместе с графиком и чтения по ссылке."""
+    schedule = build_schedule(1000000, 10 / 100 / 12, 60, ANNUITY)
+    total_payment = schedule.payment.sum()
+    link = save_calculation(
+        test_user["username"], 1000000, 10.0, 5, ANNUITY, total_payment, total_payment - 1000000,
+        schedule_blob=encode_schedule(schedule),
+    )
+    calculation = get_calculation_by_link(link, with_schedule=True)
+    np.testing.assert_array_equal(decode_schedule(calculation.schedule_blob).remaining, schedule.remaining)
+
+# Тесты построения графиков
+def test_downsample_long_schedule():
+    """Тест сжатия длинного графика до ограниченного числа точек."""
+    schedule = build_schedule(1000000, 10 / 100 / 12, 600, DIFFERENTIATED)
+    months, principal, interest, cumulative = downsample(schedule, max_points=100)
+    assert len(months) <= 100
+    assert months[-1] == 600
+    assert cumulative[-1] == pytest.approx(schedule.payment.sum())
+    assert principal.mean() == pytest.approx(schedule.principal.mean())
+
+@pytest.mark.parametrize("backend", [MATPLOTLIB, VEGA])
+def test_get_chart_is_cached(backend):
+    """Тест кэширования готовых графиков без накопления открытых фигур."""
+    import matplotlib.pyplot as plt
+
+    schedule = build_schedule(1000000, 10 / 100 / 12, 360, ANNUITY)
+    key = ("test", backend)
+    first = get_chart("payments", key, schedule, backend=backend)
+    second = get_chart("payments", key, schedule, backend=backend)
+    assert first is second
+    assert plt.get_fignums() == []
+    if backend == MATPLOTLIB:
+        assert first.startswith(b"\x89PNG")
+    else:
+        assert len(first["data"]["values"]) <= 2 * 120
+
+# Тесты анализа "что если"
+@pytest.mark.parametrize("payment_type", [ANNUITY, DIFFERENTIATED])
+def test_grid_metrics_matches_schedules(payment_type):
+    """Тест совпадения сетки показателей с расчетом графиков по отдельности."""
+    rates, terms = [0.5, 10.0, 25.5], [1, 7, 30]
+    values = grid_metrics(1000000, rates, terms, payment_type)
+    for i, rate in enumerate(rates):
+        for j, term in enumerate(terms):
+            schedule = build_schedule(1000000, rate / 100 / 12, term * 12, payment_type)
+            assert values["monthly_payment"][i, j] == pytest.approx(schedule.payment[0])
+            assert values["total_payment"][i, j] == pytest.approx(schedule.payment.sum())
+            assert values["overpayment"][i, j] == pytest.approx(schedule.payment.sum() - 1000000)
+
+def test_sensitivity_grid_recomputes_only_new_rows():
+    """Тест инкрементального пересчета сетки при сдвиге ставки."""
+    grid = SensitivityGrid(1000000, ANNUITY)
+    terms = list(range(1, 31))
+    grid.update(rate_axis(10.0), terms)
+    assert grid.computed_cells == 21 * 30
+    values = grid.update(rate_axis(11.0), terms)  # Ось сдвинулась на две строки
+    assert grid.computed_cells == 21 * 30 + 2 * 30
+    expected = grid_metrics(1000000, rate_axis(11.0), terms, ANNUITY)
+    np.testing.assert_allclose(values["total_payment"], expected["total_payment"])
+    values = grid.update(rate_axis(11.0), list(range(1, 36)))  # Добавились сроки
+    assert grid.computed_cells == 21 * 30 + 2 * 30 + 21 * 5
+    np.testing.assert_allclose(values["monthly_payment"], grid_metrics(1000000, rate_axis(11.0), range(1, 36), ANNUITY)["monthly_payment"])
+
+# Тесты расчетного ядра как отдельного пакета
+def test_credit_engine_does_not_import_ui_stack():
+    """Тест: импорт расчетного ядра не загружает Streamlit, SQLAlchemy и matplotlib."""
+    code = (
+        "import sys, credit_engine; "
+        "print(sorted(m for m in ('streamlit', 'sqlalchemy', 'matplotlib', 'pandas') if m in sys.modules))"
+    )
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.strip() == "[]"
+
+def test_database_import_is_quiet_and_skips_schema(tmp_path):
+    """Тест быстрого старта: импорт database не трогает базу, не пишет SQL в журнал и не грузит pandas."""
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'cold.db'}", DATABASE_SCHEMA="auto")
+    env.pop("SQL_ECHO", None)
+    code = (
+        "import sys, database; "
+        "print(sorted(m for m in ('pandas', 'matplotlib', 'streamlit') if m in sys.modules), database.engine)"
+    )
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env)
+    assert completed.stdout.strip() == "[] None"
+    assert "sqlalchemy.engine" not in completed.stdout + completed.stderr
+    assert not (tmp_path / "cold.db").exists()
+
+    # Подключение и создание схемы - при первом обращении к базе
+    code = "import database; print(database.register_user('cold', 'password'), database.get_schema_version())"
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True, env=env)
+    assert completed.stdout.split() == ["True", str(database.SCHEMA_VERSION)]
+
+def test_schema_created_once_per_version(tmp_path, monkeypatch):
+    """Тест: схема создается при первом подключении, дальше подключение только проверяет версию."""
+    try:
+        database.configure_database(f"sqlite:///{tmp_path / 'schema.db'}")
+        assert database.get_schema_version() == database.SCHEMA_VERSION
+        assert register_user("schemauser", "password") is True
+
+        def fail():
+            raise AssertionError("Схема уже создана")
+
+        monkeypatch.setattr(database, "create_schema", fail)
+        database.configure_database(f"sqlite:///{tmp_path / 'schema.db'}")
+        assert authenticate_user("schemauser", "password") is True
+    finally:
+        database.configure_database(database.DATABASE_URL)
+
+def test_credit_engine_cli_single(tmp_path, capsys):
+    """Тест расчета одного кредита из командной строки."""
+    schedule_path = tmp_path / "schedule.csv"
+    assert credit_engine_cli(["single", "--amount", "1000000", "--rate", "10", "--term", "5", "--schedule", str(schedule_path)]) == 0
+    output = capsys.readouterr().out
+    assert "Ежемесячный платеж: 21247.04" in output
+    assert "Переплата по кредиту: 274822.68" in output
+    assert len(pd.read_csv(schedule_path)) == 60
+
+def test_credit_engine_cli_batch(tmp_path, capsys):
+    """Тест пакетного расчета из командной строки."""
+    make_portfolio(10).to_csv(tmp_path / "loans.csv", index=False)
+    argv = ["batch", str(tmp_path / "loans.csv"), str(tmp_path / "totals.csv"), "--workers", "1"]
+    assert credit_engine_cli(argv) == 0
+    assert "Обработано кредитов: 10" in capsys.readouterr().out
+
+# Тесты постраничной истории расчетов
+def test_user_calculations_pages(test_user):
+    """Тест постраничного чтения истории от новых расчетов к старым."""
+    links = [
+        save_calculation(test_user["username"], 1000 + i, 10.0, 5, ANNUITY, 1.0, 0.5)
+        for i in range(7)
+    ]
+    assert count_user_calculations(test_user["username"]) == 7
+    page, cursor = get_user_calculations_page(test_user["username"], limit=3)
+    seen = [calc.unique_link for calc in page]
+    while cursor is not None:
+        page, cursor = get_user_calculations_page(test_user["username"], before_id=cursor, limit=3)
+        seen += [calc.unique_link for calc in page]
+    assert seen == links[::-1]
+    assert [calc.unique_link for calc in get_user_calculations(test_user["username"])] == links
+    assert get_user_calculations_page("nonexistentuser") == ([], None)
+
+def test_user_calculations_page_uses_cached_user_id(test_user):
+    """Тест: страницы истории не ищут пользователя в базе, id берется из кэша."""
+    from sqlalchemy import event
+
+    save_calculation(test_user["username"], 1000, 10.0, 5, ANNUITY, 1.0, 0.5)
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(database.get_engine(), "before_cursor_execute", record)
+    try:
+        for _ in range(3):
+            assert len(get_user_calculations_page(test_user["username"])[0]) == 1
+    finally:
+        event.remove(database.get_engine(), "before_cursor_execute", record)
+    assert len(statements) == 3 and not any("FROM users" in statement for statement in statements)
+
+def test_user_calculations_page_uses_index():
+    """Тест: выборка страницы истории идет по составному индексу (user_id, id)."""
+    with database.engine.connect() as connection:
+        plan = connection.exec_driver_sql(
+            "EXPLAIN QUERY PLAN SELECT id FROM calculations WHERE user_id = 1 AND id < 100 ORDER BY id DESC LIMIT 21"
+        ).fetchall()
+    assert "ix_calculations_user_id_id" in " ".join(str(row) for row in plan)
+
+# Тесты отложенной записи расчетов
+def test_write_behind_groups_saves_into_batches(test_user, monkeypatch):
+    """Тест: сохранения записываются пачками, ссылка доступна сразу."""
+    batches = []
+    original_insert = database.insert_calculations
+    monkeypatch.setattr(database, "insert_calculations", lambda records: batches.append(len(records)) or original_insert(records))
+    database.start_write_behind(batch_size=10, flush_interval=0.2)
+    try:
+        links = [save_calculation(test_user["username"], 1000 + i, 10.0, 5, ANNUITY, 1.0, 0.5) for i in range(25)]
+        assert get_calculation_by_link(links[-1]).loan_amount == 1024  # Еще в очереди или уже в БД
+        database._writer.flush()
+        assert sum(batches) == 25
+        assert len(batches) <= 5
+        assert all(get_calculation_by_link(link).id is not None for link in links)
+    finally:
+        database.stop_write_behind()
+
+def test_write_behind_stop_flushes_queue(test_user):
+    """Тест: при остановке все расчеты из очереди записываются."""
+    database.start_write_behind(batch_size=1000, flush_interval=10)
+    links = [save_calculation(test_user["username"], 1000, 10.0, 5, ANNUITY, 1.0, 0.5) for _ in range(50)]
+    database.stop_write_behind()
+    assert count_user_calculations(test_user["username"]) == 50
+    assert get_calculation_by_link(links[0]) is not None
+    assert save_calculation("nonexistentuser", 1000, 10.0, 5, ANNUITY, 1.0, 0.5) is False
+
+def test_write_behind_keeps_failed_saves(test_user, monkeypatch, tmp_path):
+    """Тест: расчет, который не записался, доступен по ссылке, при остановке попадает в файл и записывается из него."""
+    failed_path = tmp_path / "failed.jsonl"
+    original_insert = database.insert_calculations
+
+    def failing_insert(records):
+        if any(record["loan_amount"] == 666 for record in records):
+            raise RuntimeError("database is locked")
+        return original_insert(records)
+
+    monkeypatch.setattr(database, "insert_calculations", failing_insert)
+    database.start_write_behind(batch_size=10, flush_interval=0.05, retry_interval=60, failed_path=str(failed_path))
+    try:
+        links = [save_calculation(test_user["username"], amount, 10.0, 5, ANNUITY, 1.0, 0.5, schedule_blob=b"\x00\x01",
+                                  day_count=ACT_365, payment_calendar=RUSSIA, start_date=datetime.date(2024, 3, 15))
+                 for amount in [1000, 666, 2000]]
+        database._writer.flush()
+        assert count_user_calculations(test_user["username"]) == 2  # Остальные расчеты пачки записаны
+        assert get_calculation_by_link(links[1]).loan_amount == 666  # Ждет повторной попытки
+    finally:
+        database.stop_write_behind()
+    assert json.loads(failed_path.read_text(encoding="utf-8"))["unique_link"] == links[1]
+    monkeypatch.setattr(database, "insert_calculations", original_insert)
+    assert database.replay_failed_calculations(str(failed_path)) == 1
+    assert not failed_path.exists()
+    replayed = get_calculation_by_link(links[1], with_schedule=True)
+    assert replayed.schedule_blob == b"\x00\x01" and replayed.start_date == datetime.date(2024, 3, 15)
+
+# Тесты бенчмарков
+def test_benchmark_regression_threshold():
+    """Тест поиска регрессий относительно базовых значений."""
+    from benchmarks.bench import find_regressions
+
+    baselines = {"fast": 1.0, "slow": 1.0}
+    results = {"fast": 1.2, "slow": 2.0, "new": 5.0}
+    assert find_regressions(results, baselines, threshold=1.5) == [("slow", 1.0, 2.0, 2.0)]
+    assert find_regressions(results, baselines, threshold=2.5) == []
+
+def test_benchmark_fails_without_baselines(tmp_path, monkeypatch):
+    """Тест: без базовых значений проверка завершается ошибкой, пока они не записаны через --update."""
+    from benchmarks.bench import BASELINES_PATH, main as bench_main
+
+    assert os.path.exists(BASELINES_PATH)  # Эталонные значения лежат в репозитории
+
+    monkeypatch.setenv("DATABASE_URL", database.DATABASE_URL)
+    argv = ["--baselines", str(tmp_path / "baselines.json"), "--filter", "annuity_payment", "--repeat", "1"]
+    try:
+        assert bench_main(argv) == 1
+        assert not (tmp_path / "baselines.json").exists()
+        assert bench_main(argv + ["--update"]) == 0
+        assert "annuity_payment" in json.loads((tmp_path / "baselines.json").read_text())
+        assert os.environ["DATABASE_URL"] == database.DATABASE_URL  # Временная база не остается в окружении
+    finally:
+        database.configure_database(database.DATABASE_URL)
+
+def test_startup_baselines_cover_all_targets():
+    """Тест: у каждой цели бюджета холодного старта есть эталонное базовое значение."""
+    from benchmarks.startup import BASELINES_PATH, IMPORT_TARGETS, PAGE_TARGETS, check_budgets
+
+    with open(BASELINES_PATH, encoding="utf-8") as f:
+        baselines = json.load(f)
+    assert set(baselines) == set(IMPORT_TARGETS) | set(PAGE_TARGETS)
+    results = [{"target": "database", "ms": baselines["database"], "unexpected": []}]
+    assert check_budgets(results, baselines)[0]["ok"]
+
+def test_load_harness_runs_full_flow(tmp_path):
+    """Тест нагрузочного прогона: сессии проходят весь сценарий на временной базе."""
+    from benchmarks.load import STEPS, run_load
+
+    report = run_load(2, 2, f"sqlite:///{tmp_path / 'load.db'}", timeout=60)
+    assert report["completed"] == 2 and report["failed"] == []
+    assert all(report["rerun_ms"][step][50] is not None for step in STEPS)
+    assert report["db_writes"] > 0 and report["db_lock_errors"] == 0
+
+# Тесты инструментовки
+def test_metrics_disabled_is_noop(tmp_path):
+    """Тест: в выключенном состоянии ничего не записывается."""
+    metrics.disable()
+    metrics.reset()
+    assert metrics.span("noop") is metrics.span("other")
+    metrics.increment("noop")
+    metrics.start_rerun("page")
+    metrics.finish_rerun()
+    assert metrics.prometheus_text() == "\n"
+
+def test_metrics_rerun_spans(tmp_path):
+    """Тест записи интервалов и счетчиков перезапуска в JSONL и формат Prometheus."""
+    jsonl_path = tmp_path / "metrics.jsonl"
+    metrics.reset()
+    metrics.enable(str(jsonl_path))
+    try:
+        metrics.start_rerun("calculator")
+        with metrics.span("calculate"):
+            build_schedule(1000000, 10 / 100 / 12, 360, ANNUITY)
+        authenticate_user("nonexistentuser", "password123")  # Функции БД замеряются автоматически
+        metrics.increment("cache.hit", 2)
+        metrics.finish_rerun()
+    finally:
+        metrics.disable()
+    record = json.loads(jsonl_path.read_text(encoding="utf-8"))
+    assert record["page"] == "calculator" and record["status"] == "ok"
+    assert [span["name"] for span in record["spans"]] == ["calculate", "db.authenticate_user"]
+    assert record["counters"] == {"cache.hit": 2}
+    text = metrics.prometheus_text()
+    assert 'credit_span_seconds_count{span="rerun.calculator"} 1' in text
+    assert 'credit_span_max_seconds{span="rerun.calculator"}' in text
+    assert "credit_cache_hit_total 2" in text
+    # Каждая строка принадлежит объявленной перед ней метрике с допустимым для ее типа суффиксом
+    suffixes = {"summary": ("_count", "_sum"), "gauge": ("",), "counter": ("",)}
+    for line in text.splitlines():
+        if line.startswith("# TYPE"):
+            _, _, family, kind = line.split()
+        else:
+            name = line.split("{")[0].split()[0]
+            assert name in [family + suffix for suffix in suffixes[kind]], line
+
+def test_metrics_records_stopped_and_failed_reruns(tmp_path):
+    """Тест: перезапуск, прерванный st.stop() или исключением, тоже записывается в JSONL."""
+    from streamlit.testing.v1 import AppTest
+
+    jsonl_path = tmp_path / "metrics.jsonl"
+    metrics.enable(str(jsonl_path))
+    try:
+        at = AppTest.from_file("pages/jobs.py", default_timeout=60)
+        at.run()  # Без входа страница завершается через st.stop()
+        assert not at.exception and at.warning
+        with pytest.raises(ValueError):
+            with metrics.rerun("calculator"):
+                raise ValueError("ошибка расчета")
+    finally:
+        metrics.disable()
+    records = [json.loads(line) for line in jsonl_path.read_text(encoding="utf-8").splitlines()]
+    assert [(record["page"], record["status"]) for record in records] == [("jobs", "stopped"), ("calculator", "error")]
+
+# Тесты досрочных погашений
+def reference_prepayments(loan_amount, rate, months, payment_type, events):
+    """Помесячный расчет графика с досрочными погашениями для сравнения."""
+    balance, end, rows = loan_amount, months, []
+    param = calculate_annuity_payment(loan_amount, rate, months) if payment_type == ANNUITY else loan_amount / months
+    month = 0
+    while balance > 1e-9:
+        month += 1
+        interest = balance * rate
+        principal = min(param - interest if payment_type == ANNUITY else param, balance)
+        balance = balance - principal if balance - principal > 1e-7 else 0.0
+        prepaid = 0.0
+        for event in [e for e in events if e.month == month and balance > 0]:
+            amount = min(event.amount, balance)
+            prepaid, balance = prepaid + amount, balance - amount
+            if balance > 1e-9 and event.mode == REDUCE_PAYMENT:
+                left = end - month
+                param = calculate_annuity_payment(balance, rate, left) if payment_type == ANNUITY else balance / left
+        if balance > 1e-9:
+            if payment_type == ANNUITY and rate:
+                left = -np.log1p(-balance * rate / param) / np.log1p(rate)
+            else:
+                left = balance / param
+            end = month + int(np.ceil(left - 1e-9))
+        else:
+            balance = 0.0
+        rows.append((principal + interest + prepaid, interest, principal + prepaid, balance))
+    return np.array(rows)
+
+@pytest.mark.parametrize("payment_type", [ANNUITY, DIFFERENTIATED])
+@pytest.mark.parametrize("rate", [0.01, 0.0])
+def test_prepayments_match_monthly_loop(payment_type, rate):
+    """Тест совпадения графика с досрочными погашениями с помесячным расчетом."""
+    events = [
+        Prepayment(12, 100000, REDUCE_TERM),
+        Prepayment(24, 50000, REDUCE_PAYMENT),
+        Prepayment(24, 10000, REDUCE_TERM),
+        Prepayment(40, 70000, REDUCE_PAYMENT),
+    ]
+    schedule = PrepaymentSchedule(1000000, rate, 120, payment_type).update(events)
+    expected = reference_prepayments(1000000, rate, 120, payment_type, events)
+    assert len(schedule.month) < 120
+    np.testing.assert_allclose(np.column_stack(schedule[1:]), expected, atol=1e-6)
+
+def test_prepayments_without_events_and_full_payoff():
+    """Тест графика без событий и полного досрочного погашения."""
+    plan = PrepaymentSchedule(1000000, 0.01, 120, ANNUITY)
+    schedule = plan.update([])
+    expected = build_schedule(1000000, 0.01, 120, ANNUITY)
+    np.testing.assert_allclose(np.column_stack(schedule), np.column_stack(expected), atol=1e-6)
+    schedule = plan.update([(5, 10**9)])
+    assert len(schedule.month) == 5 and schedule.remaining[-1] == 0
+    assert schedule.principal.sum() == pytest.approx(1000000)
+    with pytest.raises(ValueError):
+        plan.update([(0, 1000)])
+
+def test_prepayments_recompute_only_suffix():
+    """Тест пересчета графика только начиная с измененного события."""
+    events = [Prepayment(12, 100000), Prepayment(60, 50000, REDUCE_PAYMENT)]
+    plan = PrepaymentSchedule(1000000, 0.01, 120, DIFFERENTIATED)
+    plan.update(events)
+    computed = plan.recomputed_months
+    schedule = plan.update([events[0], Prepayment(60, 80000, REDUCE_PAYMENT)])
+    assert plan.recomputed_months - computed == len(schedule.month) - 59
+    fresh = PrepaymentSchedule(1000000, 0.01, 120, DIFFERENTIATED).update([events[0], Prepayment(60, 80000, REDUCE_PAYMENT)])
+    np.testing.assert_allclose(np.column_stack(schedule), np.column_stack(fresh))
+
+# Тесты плавающей ставки
+def test_floating_rate_constant_path_matches_annuity():
+    """Тест: при неизменной ставке результат совпадает с обычным аннуитетом."""
+    result = simulate_floating_rate(1000000, 120, 3.0, RateModel(10.0, 10.0, volatility=0.0), n_paths=50, seed=1, workers=1)
+    annuity_payment = calculate_annuity_payment(1000000, 13 / 100 / 12, 120)
+    np.testing.assert_allclose(result.total_payment, annuity_payment * 120)
+    np.testing.assert_allclose(result.payment_bands, annuity_payment)
+
+def test_floating_payments_match_monthly_loop():
+    """Тест совпадения векторного расчета по траекториям с помесячным пересчетом платежа."""
+    paths = simulate_key_rate_paths(RateModel(16.0, 10.0), 3, 40, reset_months=3, seed=2) + 3.0
+    _, total_payment = floating_payments(1000000, paths, 119, reset_months=3)
+    for path, expected in zip(paths, total_payment):
+        balance, total = 1000000.0, 0.0
+        for month in range(119):
+            rate = path[month // 3] / 100 / 12
+            if month % 3 == 0:
+                payment = calculate_annuity_payment(balance, rate, 119 - month)
+            balance = balance * (1 + rate) - payment
+            total += payment
+        assert total == pytest.approx(expected)
+        assert balance == pytest.approx(0, abs=1e-6)
+
+def test_floating_rate_is_reproducible():
+    """Тест: одинаковое зерно дает одинаковый результат при любом числе процессов."""
+    model = RateModel(16.0, 10.0)
+    first = simulate_floating_rate(1000000, 60, 3.0, model, n_paths=7000, seed=42, workers=1)
+    second = simulate_floating_rate(1000000, 60, 3.0, model, n_paths=7000, seed=42, workers=2)
+    np.testing.assert_array_equal(first.payment_bands, second.payment_bands)
+    np.testing.assert_array_equal(first.overpayment, second.overpayment)
+    assert np.all(np.diff(first.total_payment) >= 0)
+
+def test_floating_summary_memory_is_bounded(monkeypatch):
+    """Тест: платежи по периодам хранятся только для выборки траекторий, суммы выплат - для всех."""
+    full = simulate_floating_rate(1000000, 60, 3.0, RateModel(16.0, 10.0), n_paths=12000, seed=3, workers=1)
+    monkeypatch.setattr(floating, "BAND_SAMPLE_PATHS", 6000)
+    summaries = []
+    sampled = simulate_floating_rate(1000000, 60, 3.0, RateModel(16.0, 10.0), n_paths=12000, seed=3, workers=1,
+                                     progress=lambda done, summarize: summaries.append(summarize.__self__))
+    assert sampled.n_paths == 12000 and sampled.payment_bands.shape == full.payment_bands.shape
+    np.testing.assert_array_equal(sampled.total_payment, full.total_payment)
+    assert sum(len(payments) for payments in summaries[-1]._payments) == 6000
+
+@pytest.mark.parametrize("payment_type", [ANNUITY, DIFFERENTIATED])
+@pytest.mark.parametrize("annual_rate", [0.0, 10.0, 49.5])
+def test_exact_schedule_reconciles(payment_type, annual_rate):
+    """Тест: строки точного графика в копейках сходятся к сумме кредита без погрешности."""
+    schedule = exact_schedule(1234567.89, annual_rate / 100 / 12, 360, payment_type)
+    assert schedule.payment.dtype == np.int64
+    assert schedule.principal.sum() == 123456789
+    assert schedule.remaining[-1] == 0 and (schedule.remaining >= 0).all()
+    np.testing.assert_array_equal(schedule.payment, schedule.interest + schedule.principal)
+    if payment_type == ANNUITY:
+        assert (schedule.payment[:-1] == schedule.payment[0]).all()  # Корректируется только последний платеж
+    else:
+        float_schedule = build_schedule(1234567.89, annual_rate / 100 / 12, 360, payment_type)
+        np.testing.assert_allclose(schedule.payment / 100, float_schedule.payment, atol=0.011)
+
+def test_exact_rounding_is_bankers():
+    """Тест банковского округления до копейки."""
+    np.testing.assert_array_equal(to_kopecks([0.125, 0.135, 1.005, 2.5]), [12, 14, 100, 250])
+    schedule = exact_schedule(0.3, 0.0, 4, DIFFERENTIATED)
+    np.testing.assert_array_equal(schedule.principal, [8, 7, 7, 8])  # round(7.5) = 8, round(15) = 15, round(22.5) = 22
+
+def test_exact_totals_match_schedules():
+    """Тест совпадения пакетного точного расчета итогов с точными графиками."""
+    rng = np.random.default_rng(1)
+    loans = rng.integers(100000, 10**9, 200)
+    rates = rng.uniform(0.1, 30, 200) / 100 / 12
+    rates[:10] = 0.0
+    months = rng.integers(1, 361, 200)  # В том числе кредиты на 1 месяц и сроки не кратные году
+    is_annuity = rng.random(200) < 0.5
+    totals = exact_totals(loans, rates, months, is_annuity)
+    for i in range(200):
+        schedule = exact_schedule(loans[i] / 100, rates[i], int(months[i]), ANNUITY if is_annuity[i] else DIFFERENTIATED)
+        assert totals["monthly_payment"][i] == schedule.payment[0]
+        assert totals["last_payment"][i] == schedule.payment[-1]
+        assert totals["total_payment"][i] == schedule.payment.sum()
+
+def test_exact_portfolio_schedules_match_totals():
+    """Тест: в точном режиме строки графиков портфеля - точные графики, в сумме равные итогам."""
+    rng = np.random.default_rng(2)
+    loans = pd.DataFrame({
+        "loan_id": np.arange(100) + 1000,
+        "loan_amount": rng.integers(100000, 10**9, 100) / 100,
+        "annual_interest_rate": rng.uniform(0.1, 30, 100).round(2),
+        "loan_term_years": rng.integers(1, 31, 100),
+        "payment_type": rng.choice([ANNUITY, DIFFERENTIATED], 100),
+    })
+    totals, schedules = process_chunk(loans, with_schedules=True, exact=True)
+    for i, loan in enumerate(loans.itertuples()):
+        schedule = exact_schedule(loan.loan_amount, loan.annual_interest_rate / 100 / 12, loan.loan_term_years * 12,
+                                  loan.payment_type)
+        rows = schedules[schedules["loan_id"] == loan.loan_id]
+        assert rows["month"].tolist() == schedule.month.tolist()
+        for column in ["payment", "interest", "principal", "remaining"]:
+            assert to_kopecks(rows[column].to_numpy()).tolist() == getattr(schedule, column).tolist()
+        assert to_kopecks(totals["total_payment"][i]) == schedule.payment.sum()
+
+# Тесты кэша расчетов по ссылкам
+@pytest.fixture
+def count_sessions(monkeypatch):
+    """Считает открытия сессий БД."""
+    opened = []
+    original = database.SessionLocal
+    monkeypatch.setattr(database, "SessionLocal", lambda: opened.append(1) or original())
+    return opened
+
+def test_link_cache_hits_and_invalid_links(test_user, count_sessions):
+    """Тест: повторные и некорректные ссылки не обращаются к БД."""
+    link = save_calculation(test_user["username"], 1000000, 10.0, 5, ANNUITY, 1274822.68, 274822.68)
+    count_sessions.clear()
+    assert get_calculation_by_link(link).loan_amount == 1000000
+    assert get_calculation_by_link(link).loan_amount == 1000000
+    assert len(count_sessions) == 1
+    assert get_calculation_by_link("not-a-link") is None
+    assert get_calculation_by_link(link.upper()) is None
+    assert get_calculation_by_link("' OR 1=1 --") is None
+    assert len(count_sessions) == 1
+
+def test_link_cache_negative_results_and_invalidation(test_user, count_sessions, monkeypatch):
+    """Тест: неизвестная ссылка кэшируется как отсутствующая до записи расчета с ней."""
+    link = "12345678-1234-4234-8234-123456789abc"
+    assert get_calculation_by_link(link) is None
+    assert get_calculation_by_link(link) is None
+    assert len(count_sessions) == 1
+    monkeypatch.setattr(database.uuid, "uuid4", lambda: link)
+    assert save_calculation(test_user["username"], 1000, 10.0, 5, ANNUITY, 1.0, 0.5) == link
+    assert get_calculation_by_link(link).loan_amount == 1000
+
+# Тесты выгрузки графиков
+@pytest.mark.parametrize("suffix", [".csv", ".parquet", ".xlsx"])
+def test_export_schedule_in_batches(tmp_path, suffix):
+    """Тест выгрузки графика блоками: результат совпадает с таблицей детализации."""
+    if suffix == ".xlsx":
+        pytest.importorskip("openpyxl")
+    schedule = build_schedule(1000000, 10 / 100 / 12, 600, ANNUITY)
+    path = str(tmp_path / f"schedule{suffix}")
+    assert export_schedule(schedule, path, batch_size=64) == 600
+    read = {".csv": pd.read_csv, ".parquet": pd.read_parquet, ".xlsx": pd.read_excel}[suffix]
+    pd.testing.assert_frame_equal(read(path), schedule_to_dataframe(schedule), check_dtype=False)
+
+def test_export_user_calculations(test_user, tmp_path):
+    """Тест выгрузки графиков всех расчетов пользователя, прочитанных из БД страницами."""
+    schedule = build_schedule(1000000, 10 / 100 / 12, 24, ANNUITY)
+    links = [save_calculation(test_user["username"], 1000000, 10.0, 2, ANNUITY, 1.0, 0.5, encode_schedule(schedule)),
+             save_calculation(test_user["username"], 500000, 12.0, 1, DIFFERENTIATED, 1.0, 0.5)]
+    assert [calc.unique_link for calc in iter_user_calculations(test_user["username"], batch_size=1)] == links
+    path = str(tmp_path / "calculations.parquet")
+    assert export_calculations(iter_user_calculations(test_user["username"]), path, batch_size=10) == 36
+    df = pd.read_parquet(path)
+    assert df["Расчет"].tolist() == [links[0]] * 24 + [links[1]] * 12
+    assert df["Остаток долга"].iloc[[23, 35]].tolist() == [0, 0]
+
+def test_export_formats_hide_missing_dependencies(monkeypatch):
+    """Тест: формат без установленного пакета записи не предлагается."""
+    monkeypatch.setattr(export.importlib.util, "find_spec", lambda name: None)
+    assert list(available_export_formats()) == ["CSV", "Parquet"]
+
+def test_calculator_builds_export_on_demand(test_user, monkeypatch):
+    """Тест: файл графика на странице калькулятора строится только по кнопке."""
+    from streamlit.testing.v1 import AppTest
+
+    schedule_cache.clear()
+    calls = []
+    export_bytes = export.export_bytes
+    monkeypatch.setattr(export, "export_bytes", lambda *args: calls.append(args[2]) or export_bytes(*args))
+    at = AppTest.from_file("pages/calculator.py", default_timeout=60)
+    at.session_state["session_token"] = activate_session(test_user["username"])
+    at.run()
+    assert not at.exception and calls == [] and not at.get("download_button")
+    next(button for button in at.button if button.label == "Подготовить файл").click().run()
+    assert calls == [".csv"] and len(at.get("download_button")) == 1
+
+def test_calculator_exact_unavailable_with_daily_accrual(test_user):
+    """Тест: при начислении по дням флажок точного расчета снят и недоступен."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file("pages/calculator.py", default_timeout=60)
+    at.session_state["session_token"] = activate_session(test_user["username"])
+    at.run()
+    next(checkbox for checkbox in at.checkbox if checkbox.key == "exact").check().run()
+    accrual = next(selectbox for selectbox in at.selectbox if selectbox.label == "Начисление процентов")
+    accrual.select(ACT_365).run()
+    exact = next(checkbox for checkbox in at.checkbox if checkbox.key == "exact")
+    assert not at.exception and exact.disabled and not exact.value
+
+def test_daily_calculation_saved_with_its_parameters(test_user):
+    """Тест: расчет с начислением по дням сохраняется с конвенцией, календарем и датой выдачи, по которым график пересчитывается."""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file("pages/calculator.py", default_timeout=60)
+    at.session_state["session_token"] = activate_session(test_user["username"])
+    at.run()
+    next(selectbox for selectbox in at.selectbox if selectbox.label == "Начисление процентов").select(ACT_365).run()
+    at.date_input[0].set_value(datetime.date(2024, 3, 15)).run()
+    next(button for button in at.button if button.label == "Сохранить расчет").click().run()
+    link = at.success[0].value.rsplit(" ", 1)[1]
+
+    db = SessionLocal()
+    calculation = db.query(Calculation).filter(Calculation.unique_link == link).one()
+    assert (calculation.day_count, calculation.payment_calendar, calculation.start_date) == (ACT_365, RUSSIA, datetime.date(2024, 3, 15))
+    expected = daily_schedule(1000000, 10.0, calculation.start_date, 60, calculation.payment_type, ACT_365, RUSSIA)
+    np.testing.assert_allclose(decode_schedule(calculation.schedule_blob).payment, expected.payment)
+    # Без сохраненного графика страница просмотра пересчитывает его по тем же параметрам
+    calculation.schedule_blob = None
+    db.commit()
+    db.close()
+    database.clear_link_cache()
+    view = AppTest.from_file("pages/view_calculation.py", default_timeout=60)
+    view.query_params["link"] = link
+    view.run()
+    assert not view.exception
+    assert any(ACT_365 in markdown.value for markdown in view.markdown)
+
+# Тесты таблицы детализации
+def test_schedule_to_arrow_matches_dataframe():
+    """Тест: таблица Arrow содержит те же значения, что и таблица pandas, и режется без копирования."""
+    schedule = build_schedule(1000000, 10 / 100 / 12, 600, ANNUITY)
+    table = schedule_to_arrow(schedule)
+    assert str(table.schema.field("Месяц").type) == "int32"
+    pd.testing.assert_frame_equal(table.to_pandas(), schedule_to_dataframe(schedule), check_dtype=False)
+    page = table.slice(540, 60)
+    assert page.num_rows == 60 and page.column("Месяц")[0].as_py() == 541
+
+# Тесты ежедневного начисления процентов
+def test_payment_calendar_rolls_to_business_days():
+    """Тест дат платежей: конец месяца, перенос с выходных и праздников, кэширование."""
+    dates, days = payment_calendar(datetime.date(2024, 1, 31), 5, RUSSIA)
+    assert [str(date) for date in dates] == ["2024-02-29", "2024-04-01", "2024-04-30", "2024-05-31", "2024-07-01"]
+    assert days.tolist() == [29, 32, 29, 31, 31]
+    assert payment_calendar(datetime.date(2024, 1, 31), 5, RUSSIA) is payment_calendar(datetime.date(2024, 1, 31), 5, RUSSIA)
+    assert str(payment_calendar(datetime.date(2023, 12, 1), 1, RUSSIA).dates[0]) == "2024-01-09"  # Новогодние праздники
+
+def test_act_act_year_fractions():
+    """Тест ACT/ACT: дни високосного года весят 1/366."""
+    fractions = year_fractions(datetime.date(2023, 12, 15), 1, "none", ACT_ACT)
+    assert fractions[0] == pytest.approx(17 / 365 + 14 / 366)
+    assert year_fractions(datetime.date(2023, 12, 15), 12, "none", ACT_ACT).sum() == pytest.approx(17 / 365 + 349 / 366)
+
+@pytest.mark.parametrize("payment_type", [ANNUITY, DIFFERENTIATED])
+@pytest.mark.parametrize("convention", [ACT_365, ACT_ACT, ACT_360])
+def test_daily_schedule_matches_daily_loop(payment_type, convention):
+    """Тест совпадения векторного графика с начислением процентов по каждому дню."""
+    start = datetime.date(2023, 12, 29)
+    schedule = daily_schedule(1000000, 12.0, start, 36, payment_type, convention, RUSSIA)
+    annuity_payment = schedule.payment[0]
+    balance, day = 1000000.0, start
+    for k, date in enumerate(payment_calendar(start, 36, RUSSIA).dates.astype(object)):
+        interest = 0.0
+        while day < date:
+            days_in_year = {ACT_365: 365, ACT_360: 360, ACT_ACT: 366 if calendar.isleap(day.year) else 365}[convention]
+            interest += balance * 0.12 / days_in_year
+            day += datetime.timedelta(days=1)
+        principal = annuity_payment - interest if payment_type == ANNUITY else 1000000 / 36
+        balance -= principal
+        assert schedule.interest[k] == pytest.approx(interest)
+        assert schedule.principal[k] == pytest.approx(principal)
+    assert balance == pytest.approx(0, abs=1e-6)  # Платеж по ставкам периодов гасит кредит сам
+    assert schedule.remaining[-1] == pytest.approx(0, abs=1e-6)
+
+@pytest.mark.parametrize("convention", [ACT_360, ACT_365])
+@pytest.mark.parametrize("annual_rate, years", [(10.0, 20), (20.0, 30), (50.0, 50)])
+def test_daily_schedule_long_term_high_rate(convention, annual_rate, years):
+    """Тест аннуитета по дням на длинных сроках с высокой ставкой: платежи равны, тело кредита не растет."""
+    schedule = daily_schedule(1000000, annual_rate, datetime.date(2024, 1, 15), years * 12, ANNUITY, convention, RUSSIA)
+    np.testing.assert_allclose(schedule.payment[:-1], schedule.payment[0], rtol=1e-12)
+    assert schedule.payment[-1] == pytest.approx(schedule.payment[0], abs=0.005)
+    assert schedule.principal.min() >= 0
+    assert schedule.principal.sum() == pytest.approx(1000000)
+    assert schedule.remaining[-1] == 0
+
+def test_daily_schedule_defers_interest_of_long_periods():
+    """Тест переноса процентов: проценты длинного периода сверх платежа не капитализируются."""
+    start = datetime.date(2024, 12, 1)  # Платеж 1 января переносится на 9 января: 39 дней
+    schedule = daily_schedule(1000000, 20.0, start, 360, ANNUITY, ACT_365, RUSSIA)
+    accrued = 1000000 * 0.2 * payment_calendar(start, 360, RUSSIA).days[0] / 365
+    assert accrued > schedule.payment[0]
+    assert schedule.interest[0] == pytest.approx(schedule.payment[0])
+    assert schedule.principal[0] == 0
+    assert schedule.remaining[0] == 1000000
+    assert schedule.interest.sum() == pytest.approx(schedule.payment.sum() - 1000000)
+
+# Тесты обратных расчетов и ПСК
+def test_solve_rate_recovers_rates_for_batch():
+    """Тест: ставка по платежу восстанавливается для всего пакета, включая нулевую."""
+    rng = np.random.default_rng(3)
+    loans = rng.uniform(1e4, 1e7, 1000)
+    rates = rng.uniform(0, 0.05, 1000)
+    rates[:10] = 0
+    months = rng.integers(1, 601, 1000)
+    result = solve_rate(loans, calculate_annuity_payment(loans, rates, months), months)
+    assert result.converged.all() and result.iterations.max() <= 10
+    np.testing.assert_allclose(result.value, rates, atol=1e-9)
+    infeasible = solve_rate(1000000, 1000, 60)  # Платеж меньше P / n
+    assert not infeasible.converged and np.isnan(infeasible.value)
+
+def test_solver_converged_on_last_iteration():
+    """Тест: решение, сошедшееся ровно на последней итерации, считается сошедшимся."""
+    payment = calculate_annuity_payment(1000000, 0.01, 60)
+    result = solve_rate(1000000, payment, 60)
+    last = solve_rate(1000000, payment, 60, max_iter=int(result.iterations))
+    assert last.converged and float(last.value) == float(result.value)
+
+def test_solve_term_for_budget():
+    """Тест: минимальный срок, при котором платеж укладывается в бюджет."""
+    result = solve_term([1000000, 1000000, 1000000], [25000, 10000, 25000], [0.01, 0.01, 0.0])
+    assert result.value[0] == 52 and result.value[2] == 40
+    assert calculate_annuity_payment(1000000, 0.01, 52) <= 25000 < calculate_annuity_payment(1000000, 0.01, 51)
+    assert result.converged.tolist() == [True, False, True]
+
+def test_full_cost_of_credit():
+    """Тест ПСК: без комиссий равна ставке, с комиссиями совпадает с общим решением по потокам."""
+    no_fees = full_cost_of_credit([1000000, 1000000], [10, 10], [60, 120], [ANNUITY, DIFFERENTIATED])
+    np.testing.assert_allclose(no_fees.full_cost_rate, [10, 10])
+    assert no_fees.effective_rate[0] == pytest.approx(((1 + 0.1 / 12) ** 12 - 1) * 100)
+
+    for payment_type in [ANNUITY, DIFFERENTIATED]:
+        fees = full_cost_of_credit(1000000, 10, 60, payment_type, upfront_fee=20000, monthly_fee=500)
+        payments = build_schedule(1000000, 10 / 100 / 12, 60, payment_type).payment + 500
+        expected = solve_irr(np.array([980000.0]), payments[None, :])
+        assert fees.monthly_rate.converged
+        assert float(fees.full_cost_rate) == pytest.approx(expected.value[0] * 1200)
+        assert float(fees.full_cost_rate) > 10
+
+def test_full_cost_of_credit_solves_each_payment_type_once(monkeypatch):
+    """Тест: аннуитетные и дифференцированные кредиты пакета решаются только своим методом."""
+    sizes = []
+
+    def recording(name):
+        solver = getattr(solvers, name)
+        return lambda net_amount, *args: sizes.append((name, net_amount.size)) or solver(net_amount, *args)
+
+    for name in ["solve_rate", "_solve_linear_irr"]:
+        monkeypatch.setattr(solvers, name, recording(name))
+    types = [ANNUITY, DIFFERENTIATED, ANNUITY]
+    result = full_cost_of_credit([1000000] * 3, [10, 12, 14], [60, 60, 60], types)
+    assert sizes == [("solve_rate", 2), ("_solve_linear_irr", 1)]
+    expected = [float(full_cost_of_credit(1000000, rate, 60, payment_type).full_cost_rate)
+                for rate, payment_type in zip([10, 12, 14], types)]
+    np.testing.assert_allclose(result.full_cost_rate, expected)
+    assert full_cost_of_credit([1000000], [10], [60], [ANNUITY]).monthly_rate.converged.all()
+
+# Тесты сравнения предложений
+def test_compare_offers_totals_and_ranks():
+    """Тест: итоги предложений совпадают с графиками плюс комиссии, места - по возрастанию стоимости."""
+    offers = pd.DataFrame({
+        "name": ["А", "Б", "В"],
+        "loan_amount": [1000000, 1000000, 1000000],
+        "annual_interest_rate": [10.0, 9.5, 10.0],
+        "loan_term_years": [5, 5, 5],
+        "payment_type": [ANNUITY, ANNUITY, DIFFERENTIATED],
+        "upfront_fee": [0.0, 15000.0, 0.0],
+        "monthly_fee": [0.0, 0.0, 300.0],
+    })
+    result = compare_offers(offers)
+    for i, offer in offers.iterrows():
+        schedule = build_schedule(offer.loan_amount, offer.annual_interest_rate / 100 / 12, 60, offer.payment_type)
+        total_cost = schedule.payment.sum() + offer.upfront_fee + offer.monthly_fee * 60
+        assert result.total_cost[i] == pytest.approx(total_cost)
+        assert result.peak_payment[i] == pytest.approx(schedule.payment.max() + offer.monthly_fee)
+    assert sorted(result.rank_total_cost) == [1, 2, 3]
+    assert result.total_cost[result.rank_total_cost == 1].iloc[0] == result.total_cost.min()
+    assert result.full_cost_rate[0] == pytest.approx(10)
+
+def test_compare_offers_without_full_cost_rate(test_user, monkeypatch):
+    """Тест: предложение без ПСК не ломает сравнение, а страница не сравнивает предложения с комиссией не меньше кредита."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    offers = pd.DataFrame({
+        "name": ["А", "Б"],
+        "loan_amount": [100000.0, 100000.0],
+        "annual_interest_rate": [10.0, 12.0],
+        "loan_term_years": [1, 1],
+        "upfront_fee": [200000.0, 0.0],
+    })
+    result = compare_offers(offers)
+    assert np.isnan(result.full_cost_rate[0]) and result.rank_full_cost_rate.isna().tolist() == [True, False]
+    assert result.rank_total_cost.tolist() == [2, 1]
+    assert unpaid_offers(offers).tolist() == [True, False]
+
+    monkeypatch.setattr(st, "data_editor", lambda data, **kwargs: offers.assign(payment_type=ANNUITY, monthly_fee=0.0))
+    at = AppTest.from_file("pages/compare_offers.py", default_timeout=60)
+    at.session_state["session_token"] = activate_session(test_user["username"])
+    at.run()
+    assert not at.exception
+    assert "А" in at.warning[0].value
+    assert at.dataframe[0].value["Предложение"].tolist() == ["Б"]
+
+def test_offer_schedules_shared_for_identical_offers():
+    """Тест: одинаковые предложения получают один и тот же объект графика."""
+    offers = pd.DataFrame({"loan_amount": [500000, 500000], "annual_interest_rate": [12.0, 12.0], "loan_term_years": [3, 3]})
+    first, second = offer_schedules(offers)
+    assert first is second
+
+# Тесты фоновых задач
+def test_floating_job_reports_partial_results(monkeypatch):
+    """Тест: задача моделирования пишет частичные результаты и совпадает с прямым расчетом."""
+    monkeypatch.setattr(jobs, "PROGRESS_INTERVAL", 0)
+    reports = []
+    monkeypatch.setattr(jobs, "report_progress", lambda job_id, progress, partial=None: reports.append((progress, partial)))
+    params = {"loan_amount": 1000000, "loan_term_months": 120, "margin": 3.0,
+              "model": {"initial_rate": 16.0, "mean_rate": 10.0}, "n_paths": 12000, "seed": 1}
+    job_id = jobs.submit_job("testuser", "floating", params)
+    assert jobs.run_next_job() == job_id
+    job = jobs.get_job(job_id)
+    assert job.status == jobs.DONE and job.progress == 1.0
+    assert [progress for progress, _ in reports] == pytest.approx([5000 / 12000, 10000 / 12000, 1.0])
+    assert reports[0][1]["n_paths"] == 5000
+    expected = simulate_floating_rate(1000000, 120, 3.0, RateModel(16.0, 10.0), 12000, seed=1, workers=1)
+    np.testing.assert_allclose(json.loads(job.result)["total_payment"], expected.total_payment)
+    assert jobs.run_next_job() is None
+
+def test_floating_job_builds_summary_only_when_reported(monkeypatch):
+    """Тест: сводка для частичного результата строится, только когда отчет пишется в БД."""
+    monkeypatch.setattr(jobs, "PROGRESS_INTERVAL", 3600)
+    monkeypatch.setattr(jobs, "report_progress", lambda job_id, progress, partial=None: None)
+    calls = []
+    result = floating.PathSummary.result
+    monkeypatch.setattr(floating.PathSummary, "result", lambda self: calls.append(self.n_paths) or result(self))
+    params = {"loan_amount": 1000000, "loan_term_months": 60, "margin": 3.0,
+              "model": {"initial_rate": 16.0, "mean_rate": 10.0}, "n_paths": 15000, "seed": 1}
+    job_id = jobs.submit_job("testuser", "floating", params)
+    jobs.run_next_job()
+    assert jobs.get_job(job_id).status == jobs.DONE
+    assert calls == [5000, 15000, 15000]  # Первый отчет, отчет о завершении и итог
+    too_big = jobs.submit_job("testuser", "floating", {**params, "n_paths": 1000000, "loan_term_months": 600,
+                                                       "reset_months": 1})
+    jobs.run_next_job()
+    assert jobs.get_job(too_big).status == jobs.FAILED
+
+def test_job_cancellation(monkeypatch):
+    """Тест отмены: задача в очереди отменяется сразу, выполняющаяся - на отчете о прогрессе."""
+    monkeypatch.setattr(jobs, "PROGRESS_INTERVAL", 0)
+
+    def steps(params, report):
+        report(0.5, {"step": 1})
+        jobs.cancel_job(jobs.list_jobs("testuser")[0].id)
+        report(0.6, {"step": 2})
+        raise AssertionError("Задача должна была остановиться")
+
+    monkeypatch.setitem(jobs.JOB_KINDS, "steps", steps)
+    queued = jobs.submit_job("testuser", "steps", {})
+    assert jobs.cancel_job(queued, "other") is False  # Чужую задачу отменить нельзя
+    assert jobs.cancel_job(queued, "testuser") is True
+    assert jobs.get_job(queued).status == jobs.CANCELLED
+    assert jobs.run_next_job() is None
+
+    running = jobs.submit_job("testuser", "steps", {})
+    jobs.run_next_job()
+    job = jobs.get_job(running)
+    assert job.status == jobs.CANCELLED
+    assert job.progress == pytest.approx(0.6) and json.loads(job.result) == {"step": 2}
+
+def test_failed_job_keeps_error(monkeypatch):
+    """Тест: ошибка задачи сохраняется, задача помечается как неуспешная."""
+    def broken(params, report):
+        raise ValueError("нет данных")
+
+    monkeypatch.setitem(jobs.JOB_KINDS, "broken", broken)
+    job_id = jobs.submit_job("testuser", "broken", {})
+    jobs.run_next_job()
+    job = jobs.get_job(job_id)
+    assert job.status == jobs.FAILED and job.error == "ValueError: нет данных"
+    with pytest.raises(ValueError):
+        jobs.submit_job("testuser", "unknown", {})
+
+def test_job_worker_pool_runs_portfolio(tmp_path):
+    """Тест: обработчик в отдельном процессе выполняет пакетный расчет портфеля."""
+    loans = pd.DataFrame({"loan_amount": [100000.0, 200000.0, 300000.0], "annual_interest_rate": [10.0, 12.0, 8.0],
+                          "loan_term_years": [1, 2, 3], "payment_type": [ANNUITY, DIFFERENTIATED, ANNUITY]})
+    loans.to_csv(tmp_path / "loans.csv", index=False)
+    totals_path = str(tmp_path / "totals.parquet")
+    job_id = jobs.submit_job("testuser", "portfolio", {"input_path": str(tmp_path / "loans.csv"), "totals_path": totals_path,
+                                                       "chunk_size": 2})
+    pool = jobs.JobWorkerPool(1, poll_interval=0.05)
+    try:
+        deadline = time.monotonic() + 60
+        while jobs.get_job(job_id).status in jobs.ACTIVE_STATUSES and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        pool.stop()
+    job = jobs.get_job(job_id)
+    assert job.status == jobs.DONE and job.worker_pid != os.getpid()
+    result = json.loads(job.result)
+    expected = calculate_portfolio_totals(loans)
+    assert result["processed"] == result["total"] == 3
+    assert result["total_payment"] == pytest.approx(expected["total_payment"].sum())
+    assert len(pd.read_parquet(totals_path)) == 3
+
+def test_jobs_of_dead_workers_are_failed():
+    """Тест: задачи погибших обработчиков (и обработчиков, чей pid занят другим процессом)
+    помечаются как прерванные, а обработчик заменяется."""
+    dead_pid = subprocess.run([sys.executable, "-c", "import os; print(os.getpid())"],
+                              capture_output=True, text=True, check=True).stdout.strip()
+    own_start = jobs.process_start_time(os.getpid())
+    orphaned = jobs.submit_job("testuser", "floating", {})
+    reused = jobs.submit_job("testuser", "floating", {})
+    alive = jobs.submit_job("testuser", "floating", {})
+    db = SessionLocal()
+    for job_id, pid, started in [(orphaned, int(dead_pid), None), (reused, os.getpid(), own_start - 1),
+                                 (alive, os.getpid(), own_start)]:
+        db.query(Job).filter(Job.id == job_id).update({Job.status: jobs.RUNNING, Job.worker_pid: pid,
+                                                       Job.worker_started: started})
+    db.commit()
+    db.close()
+    assert sorted(jobs.fail_orphaned_jobs()) == [orphaned, reused]
+    assert jobs.get_job(reused).status == jobs.FAILED and jobs.get_job(alive).status == jobs.RUNNING
+    jobs.finish_job(alive, jobs.DONE)
+
+    # Долгая задача, обработчик которой убивается во время ее выполнения
+    killed = jobs.submit_job("testuser", "floating", {
+        "loan_amount": 1000000, "loan_term_months": 360, "margin": 3.0, "n_paths": 500_000, "reset_months": 1,
+        "model": {"initial_rate": 16.0, "mean_rate": 10.0}, "seed": 0,
+    })
+    pool = jobs.JobWorkerPool(1, poll_interval=0.05)
+    try:
+        first = pool.processes[0]
+        deadline = time.monotonic() + 60
+        while jobs.get_job(killed).status == jobs.QUEUED and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert jobs.get_job(killed).worker_pid == first.pid
+        os.kill(first.pid, signal.SIGKILL)
+        while jobs.get_job(killed).status in jobs.ACTIVE_STATUSES and time.monotonic() < deadline:
+            pool.check()
+            time.sleep(0.05)
+        assert jobs.get_job(killed).status == jobs.FAILED
+        assert pool.processes[0] is not first and pool.processes[0].is_alive()
+    finally:
+        pool.stop()
+
+# Тесты сводок по расчетам пользователей
+def test_user_summary_updated_on_save(test_user):
+    """Тест: сводка обновляется при каждом сохранении и совпадает с полным пересчетом."""
+    username = test_user["username"]
+    save_calculation(username, 100000, 10, 1, ANNUITY, 105500, 5500)
+    save_calculation(username, 300000, 14, 2, ANNUITY, 345000, 45000)
+    save_calculation(username, 200000, 12, 1, DIFFERENTIATED, 213000, 13000)
+    register_user("other", "password")
+    save_calculation("other", 50000, 20, 1, ANNUITY, 55000, 5000)
+
+    summary = {row.payment_type: row for row in get_user_summary(username)}
+    assert summary[ANNUITY].calculation_count == 2
+    assert summary[ANNUITY].total_loan_amount == pytest.approx(400000)
+    assert summary[ANNUITY].average_rate == pytest.approx(12)
+    assert summary[ANNUITY].total_interest_paid == pytest.approx(50500)
+    assert summary[DIFFERENTIATED].total_payment == pytest.approx(213000)
+
+    def snapshot():
+        return sorted((row.user_id, row.payment_type, row.calculation_count, row.total_loan_amount, row.rate_sum,
+                       row.total_payment, row.total_interest_paid) for row in SessionLocal().query(UserSummary))
+
+    incremental = snapshot()
+    assert rebuild_user_summaries() == 3
+    assert snapshot() == incremental
+    assert get_user_summary("nobody") == []
+
+def test_user_summary_without_upsert(test_user, monkeypatch):
+    """Тест: в СУБД без ON CONFLICT сводка обновляется через UPDATE и INSERT с тем же результатом."""
+    monkeypatch.setattr(database, "_upsert_insert", lambda dialect_name: None)
+    username = test_user["username"]
+    save_calculation(username, 100000, 10, 1, ANNUITY, 105500, 5500)
+    save_calculation(username, 300000, 14, 2, ANNUITY, 345000, 45000)
+    (row,) = get_user_summary(username)
+    assert row.calculation_count == 2
+    assert row.total_loan_amount == pytest.approx(400000)
+    assert row.average_rate == pytest.approx(12)
+
+def test_user_summary_with_write_behind(test_user):
+    """Тест: пачка отложенной записи обновляет сводку одной транзакцией с расчетами."""
+    database.start_write_behind(batch_size=10, flush_interval=0.05)
+    try:
+        for _ in range(5):
+            save_calculation(test_user["username"], 100000, 10, 1, ANNUITY, 105500, 5500)
+        database._writer.flush()
+    finally:
+        database.stop_write_behind()
+    (row,) = get_user_summary(test_user["username"])
+    assert row.calculation_count == count_user_calculations(test_user["username"]) == 5